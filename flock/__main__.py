@@ -4,15 +4,29 @@ import json
 import random
 import sys
 from pathlib import Path
+from typing import List
 
 import aiohttp
 
-from flock.config import API_BASE_URL, PORT
+from flock.cluster import (
+    ClusterSupervisor,
+    HashRing,
+    create_router_app,
+    worker_name,
+)
+from flock.config import (
+    API_BASE_URL,
+    PHASE_WORKER_MAX_PHASES,
+    PHASE_WORKERS,
+    PORT,
+    SOCKET_PATH,
+)
 from flock.server import create_app
-from flock.type_defs import ProcessingMode
+from flock.type_defs import PhaseRunner, PhaseTransport, ProcessingMode
+from flock.workflows.handlers import resume_pending_workflows
 
 
-async def start_workflow() -> None:
+async def start_workflow(api_url: str = API_BASE_URL) -> None:
     try:
         settings_path = Path("./settings.json")
         if not settings_path.exists():
@@ -32,7 +46,7 @@ async def start_workflow() -> None:
 
         async with aiohttp.ClientSession() as session:
             async with session.post(
-                f"{API_BASE_URL}/start_workflow",
+                f"{api_url}/start_workflow",
                 json={
                     "state_id": state_id,
                     "settings_path": str(settings_path),
@@ -80,6 +94,60 @@ async def wait_for_server(url: str, timeout: int = 30, interval: float = 0.5) ->
         await asyncio.sleep(interval)
 
 
+def cluster_worker_args(args: argparse.Namespace) -> List[str]:
+    """Command-line options passed on to the worker servers of a cluster"""
+    worker_args = [
+        "--mode",
+        args.mode.value,
+        "--log-level",
+        args.log_level,
+        "--phase-runner",
+        args.phase_runner.value,
+        "--phase-workers",
+        str(args.phase_workers),
+        "--phase-worker-max-phases",
+        str(args.phase_worker_max_phases),
+        "--prespawn-phases" if args.prespawn_phases else "--no-prespawn-phases",
+        "--transport",
+        args.transport.value,
+        "--socket-path",
+        str(args.socket_path),
+    ]
+    if args.max_concurrent_phases:
+        worker_args += ["--max-concurrent-phases", str(args.max_concurrent_phases)]
+    if args.max_concurrent_operations:
+        worker_args += [
+            "--max-concurrent-operations",
+            str(args.max_concurrent_operations),
+        ]
+    return worker_args
+
+
+async def run_cluster(args: argparse.Namespace) -> None:
+    """Start the worker servers and the router in front of them"""
+    supervisor = ClusterSupervisor(
+        args.cluster_workers, args.port, cluster_worker_args(args)
+    )
+    await supervisor.start()
+    await asyncio.gather(*[wait_for_server(w.url) for w in supervisor.workers])
+
+    runner = aiohttp.web.AppRunner(create_router_app(supervisor))
+    await runner.setup()
+    site = aiohttp.web.TCPSite(runner, "localhost", args.port)
+
+    print(f"Starting cluster router on port {args.port}")
+    await site.start()
+
+    api_url = f"http://localhost:{args.port}"
+    await wait_for_server(api_url)
+    try:
+        await start_workflow(api_url)
+        # Keep the router running, failed runs are reported through /runs
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
+
 async def main() -> None:
     parser = argparse.ArgumentParser(description="Run the workflow server")
     parser.add_argument(
@@ -98,10 +166,112 @@ async def main() -> None:
         choices=list(ProcessingMode),
         help="Processing mode to use",
     )
+    parser.add_argument(
+        "--phase-runner",
+        type=PhaseRunner,
+        default=PhaseRunner.SUBPROCESS,
+        choices=list(PhaseRunner),
+        help="Run each phase in a new interpreter, inside the server process or "
+        "in a pool of pre-forked workers",
+    )
+    parser.add_argument(
+        "--phase-workers",
+        type=int,
+        default=PHASE_WORKERS,
+        help="Number of pre-forked workers for the worker_pool phase runner",
+    )
+    parser.add_argument(
+        "--phase-worker-max-phases",
+        type=int,
+        default=PHASE_WORKER_MAX_PHASES,
+        help="Number of phases a pooled worker runs before it is recycled",
+    )
+    parser.add_argument(
+        "--prespawn-phases",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Start the next phase's interpreter while operations are running, "
+        "when a phase slot is free (subprocess phase runner only)",
+    )
+    parser.add_argument(
+        "--transport",
+        type=PhaseTransport,
+        default=PhaseTransport.HTTP,
+        choices=list(PhaseTransport),
+        help="How phase processes send workflow requests to the server",
+    )
+    parser.add_argument(
+        "--socket-path",
+        type=Path,
+        default=SOCKET_PATH,
+        help="Unix socket used by the unix transport",
+    )
+    parser.add_argument(
+        "--async-handoff",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Acknowledge phase requests once they are durably queued so phase "
+        "processes exit immediately",
+    )
+    parser.add_argument(
+        "--isolate-run-failures",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Only stop the failing run when a phase fails instead of shutting the "
+        "server down",
+    )
+    parser.add_argument(
+        "--max-concurrent-phases",
+        type=int,
+        default=None,
+        help="Maximum number of phases executing at once across all runs",
+    )
+    parser.add_argument(
+        "--max-concurrent-operations",
+        type=int,
+        default=None,
+        help="Maximum number of operations executing at once across all runs",
+    )
+    parser.add_argument(
+        "--cluster-workers",
+        type=int,
+        default=0,
+        help="Run this many worker servers on the following ports behind a router "
+        "that assigns each run to a worker by its state_id",
+    )
+    # Set by the cluster supervisor on the worker servers it starts
+    parser.add_argument("--cluster-size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--cluster-index", type=int, help=argparse.SUPPRESS)
 
     args = parser.parse_args()
 
-    app, event = create_app(mode=args.mode, log_level=args.log_level)
+    if args.cluster_workers:
+        await run_cluster(args)
+        return
+
+    cluster_worker = args.cluster_size is not None
+    if cluster_worker:
+        # Runs survive a worker restart through the queue of accepted requests,
+        # and a failing run must not take down the other runs of the worker
+        args.async_handoff = True
+        args.isolate_run_failures = True
+        args.socket_path = args.socket_path.with_name(f"flock_{args.port}.sock")
+
+    app, event = create_app(
+        mode=args.mode,
+        log_level=args.log_level,
+        runner=args.phase_runner,
+        phase_workers=args.phase_workers,
+        phase_worker_max_phases=args.phase_worker_max_phases,
+        prespawn_phases=args.prespawn_phases,
+        transport=args.transport,
+        socket_path=args.socket_path,
+        async_handoff=args.async_handoff,
+        isolate_run_failures=args.isolate_run_failures,
+        max_concurrent_phases=args.max_concurrent_phases,
+        max_concurrent_operations=args.max_concurrent_operations,
+        port=args.port,
+    )
 
     runner = aiohttp.web.AppRunner(app)
     await runner.setup()
@@ -113,6 +283,21 @@ async def main() -> None:
     print("Waiting for server to be ready...")
     await wait_for_server(f"http://localhost:{args.port}")
 
+    if args.async_handoff:
+        owns = None
+        if cluster_worker:
+            ring = HashRing(worker_name(i) for i in range(args.cluster_size))
+            name = worker_name(args.cluster_index)
+            owns = lambda state_id: ring.node_for(state_id) == name  # noqa: E731
+        resumed = resume_pending_workflows(app["runtime"], owns)
+        if resumed:
+            print(f"Resumed {resumed} queued workflow requests")
+
+    if cluster_worker:
+        # Runs are started through the router
+        await event.wait()
+        raise RuntimeError("Some phase errored out, exiting...")
+
     if args.mode == ProcessingMode.HOOKS:
         print("Starting server in HOOKS mode...")
         print(f"sys.path: {sys.path}")
@@ -0,0 +1,12 @@
+"""Cluster mode: a router in front of several flock worker servers"""
+
+from flock.cluster.ring import HashRing, worker_name
+from flock.cluster.router import create_router_app
+from flock.cluster.supervisor import ClusterSupervisor
+
+__all__ = [
+    "HashRing",
+    "worker_name",
+    "create_router_app",
+    "ClusterSupervisor",
+]
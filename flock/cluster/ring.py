@@ -0,0 +1,52 @@
+"""Consistent hash ring assigning state_ids to cluster workers"""
+
+import bisect
+import hashlib
+from typing import Dict, Iterable, List
+
+from flock.config import CLUSTER_VIRTUAL_NODES
+
+
+def worker_name(index: int) -> str:
+    return f"worker-{index}"
+
+
+class HashRing:
+    """Maps keys to nodes so that adding or removing a node only moves the keys
+    of that node. Each node is placed at `replicas` points on the ring to
+    spread keys evenly."""
+
+    def __init__(
+        self, nodes: Iterable[str] = (), replicas: int = CLUSTER_VIRTUAL_NODES
+    ):
+        self.replicas = replicas
+        self.points: List[int] = []
+        self.owners: Dict[int, str] = {}
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(set(self.owners.values()))
+
+    def add(self, node: str) -> None:
+        for replica in range(self.replicas):
+            point = self.hash(f"{node}#{replica}")
+            if point in self.owners:
+                continue
+            bisect.insort(self.points, point)
+            self.owners[point] = node
+
+    def remove(self, node: str) -> None:
+        self.points = [p for p in self.points if self.owners[p] != node]
+        self.owners = {p: n for p, n in self.owners.items() if n != node}
+
+    def node_for(self, key: str) -> str:
+        if not self.points:
+            raise LookupError("Hash ring has no nodes")
+        index = bisect.bisect(self.points, self.hash(key)) % len(self.points)
+        return self.owners[self.points[index]]
@@ -0,0 +1,110 @@
+"""Router forwarding workflow requests to the cluster worker owning the run"""
+
+import asyncio
+import json
+from collections import Counter
+from typing import Any, Dict
+
+import aiohttp
+from aiohttp import web
+
+from flock.cluster.ring import HashRing
+from flock.cluster.supervisor import ClusterSupervisor
+from flock.config import SERVER_RECONNECT_TIMEOUT
+from flock.logger import logger
+
+
+async def forward_request(request: web.Request, path: str) -> web.Response:
+    """Forward a POST body to the worker that owns its state_id"""
+    body = await request.read()
+    try:
+        state_id = json.loads(body)["state_id"]
+    except (ValueError, KeyError, TypeError) as e:
+        return web.json_response({"error": f"Invalid request: {e!r}"}, status=400)
+
+    node = request.app["ring"].node_for(state_id)
+    url = request.app["worker_urls"][node] + path
+    request.app["routed"][node] += 1
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SERVER_RECONNECT_TIMEOUT
+    while True:
+        try:
+            async with request.app["session"].post(
+                url, data=body, headers={"Content-Type": "application/json"}
+            ) as response:
+                return web.Response(
+                    body=await response.read(),
+                    status=response.status,
+                    content_type="application/json",
+                )
+        except aiohttp.ClientConnectorError as e:
+            # The request never reached the worker, so it is safe to retry
+            # while the supervisor restarts it
+            if loop.time() > deadline:
+                error_msg = f"Worker {node} is unavailable: {e!r}"
+                logger.error(f"[{state_id}] {error_msg}")
+                return web.json_response({"error": error_msg}, status=503)
+            await asyncio.sleep(0.5)
+
+
+async def runs_handler(request: web.Request) -> web.Response:
+    """List the runs of every worker"""
+
+    async def worker_runs(node: str, url: str) -> list[Dict[str, Any]]:
+        try:
+            async with request.app["session"].get(
+                f"{url}/runs", params=request.query
+            ) as response:
+                runs = (await response.json())["runs"]
+        except aiohttp.ClientError as e:
+            logger.warning(f"Could not list runs of worker {node}: {e!r}")
+            return []
+        return [{**run, "worker": node} for run in runs]
+
+    results = await asyncio.gather(
+        *[worker_runs(node, url) for node, url in request.app["worker_urls"].items()]
+    )
+    return web.json_response({"runs": [run for runs in results for run in runs]})
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    supervisor: ClusterSupervisor = request.app["supervisor"]
+    workers = supervisor.stats()
+    for node, stats in workers.items():
+        stats["requests_routed"] = request.app["routed"][node]
+    return web.json_response({"workers": workers})
+
+
+async def health_check(request: web.Request) -> web.Response:
+    return web.Response(text="OK")
+
+
+def create_router_app(supervisor: ClusterSupervisor) -> web.Application:
+    """Create the router in front of the workers started by `supervisor`"""
+    app = web.Application(client_max_size=1024**2 * 100)  # 100 MB limit
+    app["supervisor"] = supervisor
+    app["worker_urls"] = {worker.name: worker.url for worker in supervisor.workers}
+    app["ring"] = HashRing(app["worker_urls"])
+    app["routed"] = Counter()
+
+    async def on_startup(app: web.Application) -> None:
+        app["session"] = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=None)
+        )
+
+    async def on_cleanup(app: web.Application) -> None:
+        await app["session"].close()
+        await supervisor.stop()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+
+    app.router.add_post("/run_workflow", lambda r: forward_request(r, "/run_workflow"))
+    app.router.add_post(
+        "/start_workflow", lambda r: forward_request(r, "/start_workflow")
+    )
+    app.router.add_get("/runs", runs_handler)
+    app.router.add_get("/health", health_check)
+    app.router.add_get("/metrics", metrics_handler)
+    return app
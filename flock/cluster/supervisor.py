@@ -0,0 +1,104 @@
+"""Start the worker servers of a cluster and replace them when they exit"""
+
+import asyncio
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from flock.cluster.ring import worker_name
+from flock.config import CLUSTER_RESTART_DELAY
+from flock.logger import logger
+
+
+@dataclass
+class ClusterWorker:
+    index: int
+    port: int
+    proc: Optional[asyncio.subprocess.Process] = None
+    started_at: float = 0.0
+    restarts: int = 0
+
+    @property
+    def name(self) -> str:
+        return worker_name(self.index)
+
+    @property
+    def url(self) -> str:
+        return f"http://localhost:{self.port}"
+
+
+class ClusterSupervisor:
+    """Runs `size` flock servers on the ports following `base_port`
+
+    Every worker is started with `worker_args` plus its own port and position
+    in the cluster. A worker that exits is restarted on the same port, where it
+    resumes the queued workflow requests of the runs it owns.
+    """
+
+    def __init__(self, size: int, base_port: int, worker_args: List[str]):
+        self.worker_args = worker_args
+        self.workers = [
+            ClusterWorker(index=i, port=base_port + 1 + i) for i in range(size)
+        ]
+        self.monitors: List[asyncio.Task] = []
+        self.stopping = False
+
+    async def start(self) -> None:
+        for worker in self.workers:
+            await self.spawn(worker)
+            self.monitors.append(
+                asyncio.create_task(self.monitor(worker), name=f"monitor_{worker.name}")
+            )
+        logger.info(f"Started {len(self.workers)} cluster workers")
+
+    async def spawn(self, worker: ClusterWorker) -> None:
+        worker.proc = await asyncio.create_subprocess_exec(
+            sys.executable,
+            "-m",
+            "flock",
+            "--port",
+            str(worker.port),
+            "--cluster-size",
+            str(len(self.workers)),
+            "--cluster-index",
+            str(worker.index),
+            *self.worker_args,
+        )
+        worker.started_at = time.time()
+
+    async def monitor(self, worker: ClusterWorker) -> None:
+        while not self.stopping:
+            returncode = await worker.proc.wait()
+            if self.stopping:
+                break
+            logger.error(
+                f"Cluster worker {worker.name} exited with code {returncode}, "
+                "restarting it"
+            )
+            worker.restarts += 1
+            await asyncio.sleep(CLUSTER_RESTART_DELAY)
+            await self.spawn(worker)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            worker.name: {
+                "url": worker.url,
+                "pid": worker.proc.pid if worker.proc else None,
+                "alive": worker.proc is not None and worker.proc.returncode is None,
+                "started_at": worker.started_at,
+                "restarts": worker.restarts,
+            }
+            for worker in self.workers
+        }
+
+    async def stop(self) -> None:
+        self.stopping = True
+        for task in self.monitors:
+            task.cancel()
+        for worker in self.workers:
+            if worker.proc and worker.proc.returncode is None:
+                worker.proc.terminate()
+        await asyncio.gather(
+            *[worker.proc.wait() for worker in self.workers if worker.proc]
+        )
@@ -1,12 +1,119 @@
 """Configuration settings for flock"""
 
+import json
+import os
 from pathlib import Path
 
 # API settings
 PORT = 46397
-API_BASE_URL = f"http://localhost:{PORT}"
+# Phases are pointed at the server that started them, which is not on PORT
+# for the workers of a cluster
+API_URL_ENV = "FLOCK_API_URL"
+API_BASE_URL = os.getenv(API_URL_ENV, f"http://localhost:{PORT}")
+
+# Transport used by phase processes to reach the server, set by the server
+# when it starts a phase
+PHASE_TRANSPORT_ENV = "FLOCK_PHASE_TRANSPORT"
+SOCKET_PATH_ENV = "FLOCK_SOCKET_PATH"
+PHASE_TRANSPORT = os.getenv(PHASE_TRANSPORT_ENV, "http")
+SOCKET_PATH = Path(os.getenv(SOCKET_PATH_ENV, f"/tmp/flock_{PORT}.sock"))
 
 # Directory settings
 REPO_ROOT = Path(__file__).parent
-STATES_DIR = REPO_ROOT / "states"
+# Read from the environment so phase subprocesses and cluster workers share it
+STATES_DIR_ENV = "FLOCK_STATES_DIR"
+STATES_DIR = Path(os.getenv(STATES_DIR_ENV, str(REPO_ROOT / "states")))
 STATES_DIR.mkdir(parents=True, exist_ok=True)
+
+# Where run states are stored (files, sqlite, binary). Read from the environment so
+# phase subprocesses use the same backend as the server.
+STATE_BACKEND_ENV = "FLOCK_STATE_BACKEND"
+STATE_DB_ENV = "FLOCK_STATE_DB"
+STATE_BACKEND = os.getenv(STATE_BACKEND_ENV, "files")
+STATE_DB_PATH = Path(os.getenv(STATE_DB_ENV, str(STATES_DIR / "states.db")))
+
+# State journal settings: how many trailing list items a save may still change,
+# and the journal size below which it is never compacted into the checkpoint
+JOURNAL_MUTABLE_TAIL = 1
+JOURNAL_MIN_COMPACT_BYTES = 1024**2
+
+# Number of operation result batches kept in the live state. Older batches are
+# moved to states/<state_id>/previous_results.jsonl. 0 keeps every batch, and
+# phases read up to two batches back, so smaller windows are raised to 2.
+PREVIOUS_RESULTS_WINDOW = int(os.getenv("FLOCK_PREVIOUS_RESULTS_WINDOW", "0"))
+MIN_PREVIOUS_RESULTS_WINDOW = 2
+
+# State snapshots: every Nth snapshot of a run is a full keyframe and the others
+# are deltas against the previous snapshot. With a retention of K, snapshots
+# older than the last K are thinned to their keyframes (0 keeps everything).
+SNAPSHOT_KEYFRAME_INTERVAL = int(os.getenv("FLOCK_SNAPSHOT_KEYFRAME_INTERVAL", "20"))
+SNAPSHOT_RETENTION = int(os.getenv("FLOCK_SNAPSHOT_RETENTION", "0"))
+# Log what changed in the state at every snapshot
+STATE_DIFF = os.getenv("FLOCK_STATE_DIFF", "0") == "1"
+
+# Validate every node and result batch of a state when a phase loads it. By
+# default, result batches a phase does not read are passed through unvalidated,
+# as flock validated them when they were produced.
+STRICT_STATE_VALIDATION = os.getenv("FLOCK_STRICT_STATE", "0") == "1"
+
+# Pooled HTTP clients to the model APIs (Middleman, hooks generations), shared
+# by every operation of the server: connection limits (0 is unlimited per host),
+# how long idle connections are kept open and how long DNS lookups are cached
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("FLOCK_UPSTREAM_MAX_CONNECTIONS", "120"))
+UPSTREAM_MAX_CONNECTIONS_PER_HOST = int(
+    os.getenv("FLOCK_UPSTREAM_MAX_CONNECTIONS_PER_HOST", "0")
+)
+UPSTREAM_KEEPALIVE_TIMEOUT = float(os.getenv("FLOCK_UPSTREAM_KEEPALIVE_TIMEOUT", "120"))
+UPSTREAM_DNS_CACHE_TTL = int(os.getenv("FLOCK_UPSTREAM_DNS_CACHE_TTL", "300"))
+
+# Local cache of generation outputs (off, on, deterministic, refresh), which a
+# settings pack can override with its `generation_cache` setting, and the size
+# beyond which the least recently used outputs are evicted
+GENERATION_CACHE = os.getenv("FLOCK_GENERATION_CACHE", "off")
+GENERATION_CACHE_DIR = Path(
+    os.getenv("FLOCK_GENERATION_CACHE_DIR", str(REPO_ROOT / "generation_cache"))
+)
+GENERATION_CACHE_MAX_BYTES = int(
+    os.getenv("FLOCK_GENERATION_CACHE_MAX_BYTES", str(1024**3))
+)
+
+# Identical generations requested while one is in flight wait for it instead
+# of calling upstream again (off, deterministic, all)
+COALESCE_GENERATIONS = os.getenv("FLOCK_COALESCE_GENERATIONS", "deterministic")
+
+# Generations failing with a retryable error (rate limits, 5xx, timeouts) are
+# retried with exponential backoff (delays in seconds) before falling back to
+# the settings pack's `fallback_models`. With hedging on, a generation still
+# running after the model's recent p95 latency is sent a second time and the
+# first to return wins.
+GENERATION_RETRIES = int(os.getenv("FLOCK_GENERATION_RETRIES", "3"))
+GENERATION_RETRY_DELAY = float(os.getenv("FLOCK_GENERATION_RETRY_DELAY", "1"))
+GENERATION_RETRY_MAX_DELAY = float(os.getenv("FLOCK_GENERATION_RETRY_MAX_DELAY", "30"))
+GENERATION_HEDGING = os.getenv("FLOCK_GENERATION_HEDGING", "0") == "1"
+GENERATION_HEDGE_PERCENTILE = 95
+
+# Per-model budgets of generation calls, as JSON mapping model names ("*" for
+# any other model) to requests_per_minute and tokens_per_minute; none by
+# default. Calls waiting for a budget are admitted by the priority of the phase
+# making them, lower first.
+MODEL_RATE_LIMITS = json.loads(os.getenv("FLOCK_MODEL_RATE_LIMITS", "{}"))
+GENERATION_PRIORITIES = json.loads(
+    os.getenv(
+        "FLOCK_GENERATION_PRIORITIES",
+        '{"actor": 0, "advisor_ratings": 1, "advisor": 2}',
+    )
+)
+DEFAULT_GENERATION_PRIORITY = 1
+
+# Phase worker pool settings
+PHASE_WORKERS = 4
+PHASE_WORKER_MAX_PHASES = 200
+
+# Cluster settings
+CLUSTER_VIRTUAL_NODES = 64
+CLUSTER_RESTART_DELAY = 1.0
+# Times a queued workflow request is resumed after restarts before it is
+# marked failed, so a request that kills its server cannot crash-loop it
+WORKFLOW_RESUME_ATTEMPTS = int(os.getenv("FLOCK_WORKFLOW_RESUME_ATTEMPTS", "3"))
+# How long requests are retried while the server they are sent to restarts
+SERVER_RECONNECT_TIMEOUT = 30.0
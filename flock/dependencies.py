@@ -0,0 +1,124 @@
+"""Clients shared by the operation handlers of a server process"""
+
+from typing import Any, Dict, Optional, Tuple
+
+import aiohttp
+
+from flock.config import MODEL_RATE_LIMITS
+from flock.logger import logger
+from flock.middleman_client import create_session, get_credentials, post_completion
+from flock.observation_simulator import create_simulator
+from flock.storage.generation_cache import GenerationCache, cache_policy
+from flock.type_defs.processing import ProcessingMode
+from flock.utils.resilience import LatencyTracker
+from flock.utils.scheduler import RateLimiter
+from flock.utils.singleflight import Singleflight
+
+# Hooks generations can take much longer than Middleman calls
+HOOKS_GENERATE_TIMEOUT = 30 * 60
+
+
+class Dependencies:
+    """Builds the clients a processing mode needs once and hands them to every
+    operation batch
+
+    `start` and `close` are run with the server (see `flock.server`); a
+    container that was not started builds its clients on first use. Each
+    upstream gets one pooled keep-alive session, so model calls reuse open
+    connections instead of connecting for every generation.
+    """
+
+    def __init__(self, mode: ProcessingMode):
+        self.mode = mode
+        self.clients: Optional[Dict[str, Any]] = None
+        # Upstream name -> pooled session
+        self.sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._credentials: Optional[Tuple[str, str]] = None
+        self.generation_cache = GenerationCache()
+        self.generation_flights = Singleflight()
+        self.generation_latencies = LatencyTracker()
+        self.generation_rate_limiter = RateLimiter(MODEL_RATE_LIMITS)
+
+    @property
+    def credentials(self) -> Tuple[str, str]:
+        """Middleman base URL and API key, looked up once"""
+        if self._credentials is None:
+            self._credentials = get_credentials()
+        return self._credentials
+
+    async def start(self) -> None:
+        if self.clients is None:
+            await self.generation_cache.open()
+            self.clients = self.create_clients()
+            logger.info(f"Dependencies ready: {', '.join(self.clients) or 'none'}")
+
+    async def close(self) -> None:
+        self.clients = None
+        sessions, self.sessions = self.sessions, {}
+        for session in sessions.values():
+            await session.close()
+
+    def create_clients(self) -> Dict[str, Any]:
+        clients: Dict[str, Any] = {
+            "generation_cache": self.generation_cache,
+            "generation_flights": self.generation_flights,
+            "generation_latencies": self.generation_latencies,
+            "generation_rate_limiter": self.generation_rate_limiter,
+        }
+        if self.mode == ProcessingMode.MIDDLEMAN_SIMULATED:
+            session = self.sessions["middleman"] = create_session()
+
+            async def post_completion_with_credentials(
+                messages,
+                model="gpt-4o-mini",
+                temp=1.0,
+                n=1,
+                function_call=None,
+                functions=None,
+                stream=None,
+            ):
+                return await post_completion(
+                    messages=messages,
+                    model=model,
+                    temp=temp,
+                    n=n,
+                    function_call=function_call,
+                    functions=functions,
+                    credentials=self.credentials,
+                    session=session,
+                    stream=stream,
+                )
+
+            clients["post_completion"] = post_completion_with_credentials
+            clients["simulator"] = create_simulator(
+                credentials=self.credentials, session=session
+            )
+        if self.mode == ProcessingMode.HOOKS:
+            try:
+                from pyhooks import CommonEnvs, Hooks
+            except ImportError:
+                raise ImportError("pyhooks required for HOOKS mode")
+            clients["hooks_client"] = Hooks(envs=CommonEnvs.from_env())
+            # Hooks and Vivaria calls verify TLS certificates
+            clients["generate_session"] = self.sessions["hooks"] = create_session(
+                timeout=HOOKS_GENERATE_TIMEOUT, ssl=True
+            )
+        return clients
+
+    async def for_batch(
+        self,
+        state_id: Optional[str],
+        settings: Optional[Dict[str, Any]] = None,
+        phase: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Return the dependencies passed to the handlers of one batch, given
+        the settings of its run and the phase that sent it"""
+        await self.start()
+        return {
+            **self.clients,
+            # Add state_id to dependencies for UI events
+            "state_id": state_id or "unknown",
+            "generation_cache_policy": cache_policy(settings),
+            "fallback_models": (settings or {}).get("fallback_models") or {},
+            "phase": phase,
+        }
@@ -1,11 +1,13 @@
 """Base handler definitions and utilities"""
 
 import json
-import sys
-from typing import Awaitable, Callable, Optional, Protocol, TypeVar
+from typing import Awaitable, Callable, List, Optional, Protocol, TypeVar
+
+from pydantic import ValidationError
 
 from flock.logger import logger
 from flock.type_defs.operations import (
+    OPERATION_REQUESTS_ADAPTER,
     ActionRequest,
     BaseOperationRequest,
     BashRequest,
@@ -15,6 +17,7 @@ from flock.type_defs.operations import (
     LogRequest,
     LogWithAttributesRequest,
     ObservationRequest,
+    OperationRequest,
     PythonRequest,
     ReadMessagesRequest,
     SaveStateRequest,
@@ -46,6 +49,10 @@ ParamsT = TypeVar("ParamsT")
 OutputT = TypeVar("OutputT")
 
 
+class OperationError(Exception):
+    """An operation handler failed; the run that requested it fails with it"""
+
+
 class OperationHandler(Protocol[ParamsT, OutputT]):
     """Protocol for operation handlers"""
 
@@ -71,13 +78,12 @@ def validate_operation_request(
         raise ValueError(f"Unknown operation type: {operation_type}")
 
 
-def validate_untyped_request(raw_request: dict) -> BaseOperationRequest:
-    for operation_type, request_class in OPERATION_REQUEST_MAP.items():
-        try:
-            return request_class(**raw_request)
-        except Exception:
-            pass
-    raise ValueError(f"Could not validate request: {raw_request}")
+def validate_untyped_requests(raw_requests: List[dict]) -> List[OperationRequest]:
+    """Validate a batch of requests, dispatching each on its `type`"""
+    try:
+        return OPERATION_REQUESTS_ADAPTER.validate_python(raw_requests)
+    except ValidationError as e:
+        raise ValueError(f"Could not validate requests:\n{e}")
 
 
 def create_handler(
@@ -93,7 +99,9 @@ def create_handler(
                 return await executor(params, dependencies or {})
             except Exception as e:
                 logger.error(f"Error in {operation_type} handler: {str(e)}")
-                sys.exit(1)
+                raise OperationError(
+                    f"Error in {operation_type} handler: {str(e)}"
+                ) from e
 
     return Handler()
 
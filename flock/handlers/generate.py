@@ -2,26 +2,51 @@
 
 import asyncio
 import json
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Optional
 
 import aiohttp
 
-from flock.handlers.base import create_handler
+from flock.config import (
+    COALESCE_GENERATIONS,
+    DEFAULT_GENERATION_PRIORITY,
+    GENERATION_HEDGE_PERCENTILE,
+    GENERATION_HEDGING,
+    GENERATION_PRIORITIES,
+    GENERATION_RETRIES,
+    GENERATION_RETRY_DELAY,
+    GENERATION_RETRY_MAX_DELAY,
+)
+from flock.handlers.base import HandlerExecutor, create_handler
 from flock.logger import logger
+from flock.middleman_client import MIDDLEMAN_MAX_TOKENS
+from flock.storage.generation_cache import GenerationCache, generation_key
 from flock.type_defs.operations import GenerationOutput, GenerationParams
-from flock.type_defs.processing import ProcessingMode
+from flock.type_defs.processing import (
+    CoalescingPolicy,
+    GenerationCachePolicy,
+    ProcessingMode,
+)
+from flock.utils.resilience import LatencyTracker, backoff_delay, hedged, is_retryable
+from flock.utils.scheduler import RateLimiter
+from flock.utils.singleflight import Singleflight
 
 SINGLE_GENERATION_MODELS = ()
 REASONING_EFFORT_MODELS = ("o1-2024-12-17", "o3-mini-2025-01-31")
+# Usage reported for outputs that did not cost an upstream call
+NO_USAGE = {
+    "n_completion_tokens_spent": 0,
+    "n_prompt_tokens_spent": 0,
+    "cost": 0,
+    "duration_ms": 0,
+}
 
 
 def log_generation(params: GenerationParams, result: GenerationOutput) -> None:
     """Log generation request and response"""
     try:
-        log_dir = Path("logs/generations")
-        log_dir.mkdir(parents=True, exist_ok=True)
         log_entry = {
             "timestamp": datetime.now().isoformat(),
             "request": {
@@ -44,13 +69,34 @@ def log_generation(params: GenerationParams, result: GenerationOutput) -> None:
             "success": not bool(result.error),
             "error": result.error if result.error else None,
         }
-        log_file = log_dir / f"generation_{datetime.now().strftime('%Y%m%d')}.jsonl"
-        with open(log_file, "a") as f:
-            f.write(json.dumps(log_entry) + "\n")
+        write_generation_log(log_entry)
     except Exception as e:
         logger.error(f"Error logging generation: {str(e)}")
 
 
+def log_generation_attempt(params: GenerationParams, attempt: Dict[str, Any]) -> None:
+    """Log one attempt at a generation: its model, retry number, whether it
+    was hedged, how long it took and its error if it failed"""
+    try:
+        write_generation_log(
+            {
+                "timestamp": datetime.now().isoformat(),
+                "attempt": attempt,
+                "request_model": params.settings.model,
+            }
+        )
+    except Exception as e:
+        logger.error(f"Error logging generation attempt: {str(e)}")
+
+
+def write_generation_log(log_entry: Dict[str, Any]) -> None:
+    log_dir = Path("logs/generations")
+    log_dir.mkdir(parents=True, exist_ok=True)
+    log_file = log_dir / f"generation_{datetime.now().strftime('%Y%m%d')}.jsonl"
+    with open(log_file, "a") as f:
+        f.write(json.dumps(log_entry) + "\n")
+
+
 async def generate_middleman(
     params: GenerationParams, deps: Optional[dict]
 ) -> GenerationOutput:
@@ -68,6 +114,7 @@ async def generate_middleman(
                         n=1,
                         function_call=params.settings.function_call,
                         functions=params.functions,
+                        stream=params.stream,
                     )
                     for _ in range(params.settings.n)
                 ]
@@ -105,6 +152,7 @@ async def generate_middleman(
                 n=params.settings.n,
                 function_call=params.settings.function_call,
                 functions=params.functions,
+                stream=params.stream,
             )
             if raw_output.get("error"):
                 error_output = GenerationOutput(
@@ -129,54 +177,66 @@ async def generate_hooks(
     params: GenerationParams, deps: Optional[dict]
 ) -> GenerationOutput:
     """Generate handler for hooks mode"""
-    hooks_client = deps["hooks_client"]
-    processed_messages = params.messages
     settings = params.settings.copy()
     if settings.model in REASONING_EFFORT_MODELS:
         settings.reasoning_effort = "high"
 
-    timeout = aiohttp.ClientTimeout(total=30 * 60)  # 30 minutes
-    async with aiohttp.ClientSession(timeout=timeout) as session:
-        if settings.model in SINGLE_GENERATION_MODELS and settings.n > 1:
-            raw_outputs = []
-            settings.n = 1
-            raw_outputs = await asyncio.gather(
-                *[
-                    hooks_client.generate(
-                        settings=settings,
-                        messages=processed_messages,
-                        functions=params.functions,
-                        session=session,
-                    )
-                    for _ in range(params.settings.n)
-                ]
-            )
-            outputs = []
-            for raw_output in raw_outputs:
-                outputs.extend(raw_output.outputs)
-            merged = GenerationOutput(
-                outputs=outputs,
-                n_completion_tokens_spent=sum(
-                    raw_output.n_completion_tokens_spent or 0
-                    for raw_output in raw_outputs
-                ),
-                n_prompt_tokens_spent=sum(
-                    raw_output.n_prompt_tokens_spent or 0 for raw_output in raw_outputs
-                ),
-                cost=sum(raw_output.cost or 0 for raw_output in raw_outputs),
-            )
-            log_generation(params, merged)
-            return merged
-        else:
-            result = await hooks_client.generate(
-                settings=settings,
-                messages=processed_messages,
-                functions=params.functions,
-                session=session,
-            )
-            output = GenerationOutput(**result.dict())
-            log_generation(params, output)
-            return output
+    # The server's pooled session, or one opened for this generation
+    session = deps.get("generate_session")
+    if session is None:
+        timeout = aiohttp.ClientTimeout(total=30 * 60)  # 30 minutes
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            return await generate_hooks_on_session(params, settings, deps, session)
+    return await generate_hooks_on_session(params, settings, deps, session)
+
+
+async def generate_hooks_on_session(
+    params: GenerationParams,
+    settings: Any,
+    deps: dict,
+    session: aiohttp.ClientSession,
+) -> GenerationOutput:
+    hooks_client = deps["hooks_client"]
+    processed_messages = params.messages
+    if settings.model in SINGLE_GENERATION_MODELS and settings.n > 1:
+        raw_outputs = []
+        settings.n = 1
+        raw_outputs = await asyncio.gather(
+            *[
+                hooks_client.generate(
+                    settings=settings,
+                    messages=processed_messages,
+                    functions=params.functions,
+                    session=session,
+                )
+                for _ in range(params.settings.n)
+            ]
+        )
+        outputs = []
+        for raw_output in raw_outputs:
+            outputs.extend(raw_output.outputs)
+        merged = GenerationOutput(
+            outputs=outputs,
+            n_completion_tokens_spent=sum(
+                raw_output.n_completion_tokens_spent or 0 for raw_output in raw_outputs
+            ),
+            n_prompt_tokens_spent=sum(
+                raw_output.n_prompt_tokens_spent or 0 for raw_output in raw_outputs
+            ),
+            cost=sum(raw_output.cost or 0 for raw_output in raw_outputs),
+        )
+        log_generation(params, merged)
+        return merged
+    else:
+        result = await hooks_client.generate(
+            settings=settings,
+            messages=processed_messages,
+            functions=params.functions,
+            session=session,
+        )
+        output = GenerationOutput(**result.dict())
+        log_generation(params, output)
+        return output
 
 
 async def generate_mock(
@@ -188,7 +248,174 @@ async def generate_mock(
     return mock_output
 
 
+def from_fallback(params: GenerationParams, output: GenerationOutput) -> bool:
+    """Whether `output` was produced by a fallback for the requested model"""
+    return output.model is not None and output.model != params.settings.model
+
+
+def cached(
+    executor: HandlerExecutor[GenerationParams, GenerationOutput],
+) -> HandlerExecutor[GenerationParams, GenerationOutput]:
+    """Serve generations from the generation cache when the run's policy
+    allows it"""
+
+    async def generate_cached(
+        params: GenerationParams, deps: Optional[dict]
+    ) -> GenerationOutput:
+        cache: Optional[GenerationCache] = deps.get("generation_cache")
+        if cache is None:
+            return await executor(params, deps)
+        policy = deps.get("generation_cache_policy", GenerationCachePolicy.OFF)
+        output = await cache.get(params, policy)
+        if output is not None:
+            # Nothing was spent upstream for this output
+            return output.model_copy(update=NO_USAGE)
+        output = await executor(params, deps)
+        # The key names the requested model, which did not produce a fallback
+        if not from_fallback(params, output):
+            await cache.put(params, output, policy)
+        return output
+
+    return generate_cached
+
+
+def coalesced(
+    executor: HandlerExecutor[GenerationParams, GenerationOutput],
+) -> HandlerExecutor[GenerationParams, GenerationOutput]:
+    """Share one upstream call between identical generations in flight"""
+
+    async def generate_coalesced(
+        params: GenerationParams, deps: Optional[dict]
+    ) -> GenerationOutput:
+        flights: Optional[Singleflight] = deps.get("generation_flights")
+        policy = CoalescingPolicy(COALESCE_GENERATIONS)
+        if (
+            flights is None
+            or policy == CoalescingPolicy.OFF
+            or (policy == CoalescingPolicy.DETERMINISTIC and params.settings.temp != 0)
+        ):
+            return await executor(params, deps)
+        output, shared = await flights.run(
+            generation_key(params), lambda: executor(params, deps)
+        )
+        if shared and from_fallback(params, output):
+            # The caller that made the call fell back under its run's fallback
+            # models, which need not be this run's
+            return await executor(params, deps)
+        if shared:
+            # Usage is attributed to the caller that made the upstream call
+            return output.model_copy(update=NO_USAGE)
+        return output
+
+    return generate_coalesced
+
+
+def resilient(
+    executor: HandlerExecutor[GenerationParams, GenerationOutput],
+) -> HandlerExecutor[GenerationParams, GenerationOutput]:
+    """Retry generations failing with retryable errors, hedge slow ones and
+    fall back to the run's fallback models once a model keeps failing
+
+    The output records the model that produced it, so that the layers above
+    neither cache nor share a fallback's output under the requested model.
+    """
+
+    async def generate_resilient(
+        params: GenerationParams, deps: Optional[dict]
+    ) -> GenerationOutput:
+        latencies: Optional[LatencyTracker] = deps.get("generation_latencies")
+        requested = params.settings.model
+        models = [requested, *deps.get("fallback_models", {}).get(requested, [])]
+        error: Optional[Exception] = None
+        for model in models:
+            attempt_params = params
+            if model != requested:
+                settings = params.settings.model_copy(update={"model": model})
+                attempt_params = params.model_copy(update={"settings": settings})
+            hedge_delay = None
+            if GENERATION_HEDGING and latencies is not None:
+                hedge_delay = latencies.percentile(model, GENERATION_HEDGE_PERCENTILE)
+            for retry in range(GENERATION_RETRIES + 1):
+                if retry:
+                    await asyncio.sleep(
+                        backoff_delay(
+                            retry - 1,
+                            GENERATION_RETRY_DELAY,
+                            GENERATION_RETRY_MAX_DELAY,
+                        )
+                    )
+                attempt = {"model": model, "retry": retry, "hedged": False}
+                start = time.monotonic()
+                try:
+                    output = await hedged(
+                        lambda: executor(attempt_params, deps),
+                        hedge_delay,
+                        on_hedge=lambda: attempt.update(hedged=True),
+                    )
+                except Exception as e:
+                    error = e
+                    attempt["duration_ms"] = int((time.monotonic() - start) * 1000)
+                    attempt["error"] = str(e)
+                    log_generation_attempt(attempt_params, attempt)
+                    if not is_retryable(e):
+                        break
+                    logger.warning(
+                        f"Generation with {model} failed (retry {retry}): {str(e)}"
+                    )
+                    continue
+                duration = time.monotonic() - start
+                if latencies is not None:
+                    latencies.record(model, duration)
+                attempt["duration_ms"] = int(duration * 1000)
+                log_generation_attempt(attempt_params, attempt)
+                return output.model_copy(update={"model": model})
+        raise error
+
+    return generate_resilient
+
+
+def estimate_generation_tokens(params: GenerationParams) -> int:
+    """Rough token count of a generation: its prompt at about four characters
+    a token, plus the completions it may produce"""
+    prompt_chars = len(json.dumps(params.messages or [])) + len(
+        json.dumps(params.functions or [])
+    )
+    max_tokens = params.settings.max_tokens or MIDDLEMAN_MAX_TOKENS
+    return prompt_chars // 4 + params.settings.n * max_tokens
+
+
+def rate_limited(
+    executor: HandlerExecutor[GenerationParams, GenerationOutput],
+) -> HandlerExecutor[GenerationParams, GenerationOutput]:
+    """Wait for the model's request and token budget before each call"""
+
+    async def generate_rate_limited(
+        params: GenerationParams, deps: Optional[dict]
+    ) -> GenerationOutput:
+        limiter: Optional[RateLimiter] = deps.get("generation_rate_limiter")
+        if limiter is None:
+            return await executor(params, deps)
+        model = params.settings.model
+        estimate = estimate_generation_tokens(params)
+        priority = GENERATION_PRIORITIES.get(
+            deps.get("phase"), DEFAULT_GENERATION_PRIORITY
+        )
+        await limiter.acquire(model, estimate, priority)
+        output = await executor(params, deps)
+        spent = [output.n_prompt_tokens_spent, output.n_completion_tokens_spent]
+        # Without usage, e.g. for a stream stopped early, the estimate stands
+        if any(tokens is not None for tokens in spent):
+            limiter.settle(model, estimate, sum(tokens or 0 for tokens in spent))
+        return output
+
+    return generate_rate_limited
+
+
 handlers = {
-    ProcessingMode.MIDDLEMAN_SIMULATED: create_handler("generate", generate_middleman),
-    ProcessingMode.HOOKS: create_handler("generate", generate_hooks),
+    ProcessingMode.MIDDLEMAN_SIMULATED: create_handler(
+        "generate", cached(coalesced(resilient(rate_limited(generate_middleman))))
+    ),
+    ProcessingMode.HOOKS: create_handler(
+        "generate", cached(coalesced(resilient(rate_limited(generate_hooks))))
+    ),
 }
@@ -2,11 +2,22 @@
 
 import json
 import os
+import time
 from typing import Any, Dict, List, Optional, Tuple
 
 import aiohttp
 
+from flock.config import (
+    UPSTREAM_DNS_CACHE_TTL,
+    UPSTREAM_KEEPALIVE_TIMEOUT,
+    UPSTREAM_MAX_CONNECTIONS,
+    UPSTREAM_MAX_CONNECTIONS_PER_HOST,
+)
 from flock.logger import logger
+from flock.type_defs.operations import GenerationStreamOptions
+
+# Completion size of every Middleman request
+MIDDLEMAN_MAX_TOKENS = 2000
 
 
 def get_credentials() -> Tuple[str, str]:
@@ -28,11 +39,22 @@ def get_credentials() -> Tuple[str, str]:
     return base_url, api_key
 
 
-def create_session() -> aiohttp.ClientSession:
-    """Create a configured aiohttp session"""
+def create_session(timeout: float = 120, ssl: bool = False) -> aiohttp.ClientSession:
+    """Create a configured aiohttp session, pooling keep-alive connections
+
+    TLS certificates are only verified with `ssl=True`; Middleman sessions keep
+    verification off as they always have.
+    """
     return aiohttp.ClientSession(
-        connector=aiohttp.TCPConnector(limit=120, ssl=False, keepalive_timeout=120),
-        timeout=aiohttp.ClientTimeout(total=120),
+        connector=aiohttp.TCPConnector(
+            limit=UPSTREAM_MAX_CONNECTIONS,
+            limit_per_host=UPSTREAM_MAX_CONNECTIONS_PER_HOST,
+            ssl=ssl,
+            keepalive_timeout=UPSTREAM_KEEPALIVE_TIMEOUT,
+            use_dns_cache=True,
+            ttl_dns_cache=UPSTREAM_DNS_CACHE_TTL,
+        ),
+        timeout=aiohttp.ClientTimeout(total=timeout),
     )
 
 
@@ -69,8 +91,13 @@ async def post_completion(
     n: int = 1,
     function_call: Optional[Dict[str, Any]] = None,
     functions: Optional[Dict[str, Any]] = None,
+    credentials: Optional[Tuple[str, str]] = None,
+    session: Optional[aiohttp.ClientSession] = None,
+    stream: Optional[GenerationStreamOptions] = None,
 ) -> Dict[str, Any]:
-    base_url, api_key = get_credentials()
+    """Request a completion, on `session` when given and otherwise on a
+    session opened for this request, streamed when `stream` is given"""
+    base_url, api_key = credentials or get_credentials()
     if api_key == "test-key":
         return get_mock_response()
     formatted_messages = format_messages(messages)
@@ -80,35 +107,173 @@ async def post_completion(
         "model": model,
         "temperature": temp,
         "n": n,
-        "stream": False,
+        "stream": stream is not None,
         "functions": functions,
         "function_call": function_call,
-        "max_tokens": 2000,
+        "max_tokens": MIDDLEMAN_MAX_TOKENS,
     }
-    async with create_session() as session:
-        try:
-            async with session.post(f"{base_url}/completions", json=data) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    error_result = {
-                        "error": f"{response.status}, {error_text}",
-                        "outputs": [],
-                        "non_blocking_errors": [
-                            f"HTTP {response.status}: {error_text}"
-                        ],
+    if session is None:
+        async with create_session() as session:
+            return await send_completion(session, base_url, data, stream)
+    return await send_completion(session, base_url, data, stream)
+
+
+async def send_completion(
+    session: aiohttp.ClientSession,
+    base_url: str,
+    data: Dict[str, Any],
+    stream: Optional[GenerationStreamOptions],
+) -> Dict[str, Any]:
+    if stream is None:
+        return await request_completion(session, base_url, data)
+    return await stream_completion(session, base_url, data, stream)
+
+
+async def error_response(response: aiohttp.ClientResponse) -> Dict[str, Any]:
+    error_text = await response.text()
+    return {
+        "error": f"{response.status}, {error_text}",
+        "outputs": [],
+        "non_blocking_errors": [f"HTTP {response.status}: {error_text}"],
+    }
+
+
+async def request_completion(
+    session: aiohttp.ClientSession, base_url: str, data: Dict[str, Any]
+) -> Dict[str, Any]:
+    try:
+        async with session.post(f"{base_url}/completions", json=data) as response:
+            if response.status != 200:
+                return await error_response(response)
+            result = await response.json()
+            if "outputs" not in result:
+                result["outputs"] = [
+                    {
+                        "completion": result.get("completion", ""),
+                        "function_call": result.get("function_call", None),
+                        "stop_reason": result.get("stop_reason", "length"),
                     }
-                    return error_result
-                result = await response.json()
-                if "outputs" not in result:
-                    result["outputs"] = [
-                        {
-                            "completion": result.get("completion", ""),
-                            "function_call": result.get("function_call", None),
-                            "stop_reason": result.get("stop_reason", "length"),
-                        }
-                    ]
-                return result
-        except Exception as e:
-            logger.error(f"Error in post_completion: {str(e)}")
-            logger.error("Full traceback:", exc_info=True)
-            return {"error": str(e), "outputs": [], "non_blocking_errors": [str(e)]}
+                ]
+            return result
+    except Exception as e:
+        logger.error(f"Error in post_completion: {str(e)}")
+        logger.error("Full traceback:", exc_info=True)
+        return {"error": str(e), "outputs": [], "non_blocking_errors": [str(e)]}
+
+
+class CompletionStream:
+    """Outputs of a streamed completion, assembled from its chunks
+
+    Each chunk is a JSON object whose `outputs` carry, per `completion_index`,
+    the completion text and function call name and arguments added since the
+    previous chunk. Usage fields are taken from the last chunk setting them.
+    """
+
+    def __init__(self, n: int, options: GenerationStreamOptions):
+        self.options = options
+        self.outputs: List[Dict[str, Any]] = [new_stream_output() for _ in range(n)]
+        self.usage: Dict[str, Any] = {}
+
+    def add(self, chunk: Dict[str, Any]) -> None:
+        for delta in chunk.get("outputs") or []:
+            index = delta.get("completion_index") or 0
+            while index >= len(self.outputs):
+                self.outputs.append(new_stream_output())
+            output = self.outputs[index]
+            output["completion"] += delta.get("completion") or ""
+            if delta.get("function_call"):
+                call = output["function_call"] or {"name": "", "arguments": ""}
+                call["name"] += delta["function_call"].get("name") or ""
+                call["arguments"] += delta["function_call"].get("arguments") or ""
+                output["function_call"] = call
+            if delta.get("stop_reason"):
+                output["stop_reason"] = delta["stop_reason"]
+        for key in STREAM_USAGE_KEYS:
+            if chunk.get(key) is not None:
+                self.usage[key] = chunk[key]
+
+    def early_stop_reason(self) -> Optional[str]:
+        """Return why the rest of the stream is not needed, if it is not"""
+        max_chars = self.options.max_completion_chars
+        if max_chars is not None and any(
+            stream_output_size(output) > max_chars for output in self.outputs
+        ):
+            return "max_size"
+        if self.options.stop_after_function_call and all(
+            has_complete_function_call(output) for output in self.outputs
+        ):
+            return "function_call"
+        return None
+
+
+STREAM_USAGE_KEYS = ("n_prompt_tokens_spent", "n_completion_tokens_spent", "cost")
+
+
+def new_stream_output() -> Dict[str, Any]:
+    return {"completion": "", "function_call": None, "stop_reason": None}
+
+
+def stream_output_size(output: Dict[str, Any]) -> int:
+    call = output["function_call"] or {}
+    return len(output["completion"]) + len(call.get("arguments", ""))
+
+
+def has_complete_function_call(output: Dict[str, Any]) -> bool:
+    call = output["function_call"]
+    if not call or not call["name"] or not call["arguments"].rstrip().endswith("}"):
+        return False
+    try:
+        json.loads(call["arguments"])
+    except ValueError:
+        return False
+    return True
+
+
+async def stream_completion(
+    session: aiohttp.ClientSession,
+    base_url: str,
+    data: Dict[str, Any],
+    options: GenerationStreamOptions,
+) -> Dict[str, Any]:
+    """Read a completion streamed as server-sent events, stopping as soon as
+    `options` allow"""
+    start = time.monotonic()
+    stream = CompletionStream(data["n"], options)
+    time_to_first_token_ms = None
+    stop_reason = None
+    try:
+        async with session.post(f"{base_url}/completions", json=data) as response:
+            if response.status != 200:
+                return await error_response(response)
+            async for line in response.content:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                payload = line[len(b"data:") :].strip()
+                if payload == b"[DONE]":
+                    break
+                if time_to_first_token_ms is None:
+                    time_to_first_token_ms = int((time.monotonic() - start) * 1000)
+                stream.add(json.loads(payload))
+                stop_reason = stream.early_stop_reason()
+                if stop_reason:
+                    # Closing the connection ends the generation upstream
+                    response.close()
+                    break
+    except Exception as e:
+        logger.error(f"Error in stream_completion: {str(e)}")
+        logger.error("Full traceback:", exc_info=True)
+        return {"error": str(e), "outputs": [], "non_blocking_errors": [str(e)]}
+
+    for output in stream.outputs:
+        output["stop_reason"] = stop_reason or output["stop_reason"] or "stop"
+    # Usage arrives with the last chunks, so it is unknown for a stream cut
+    # short; it is left out rather than reported partially, and the rate
+    # limiter then keeps the tokens it reserved for the call
+    usage = {} if stop_reason else stream.usage
+    return {
+        "outputs": stream.outputs,
+        **usage,
+        "duration_ms": int((time.monotonic() - start) * 1000),
+        "time_to_first_token_ms": time_to_first_token_ms,
+    }
@@ -27,6 +27,8 @@ def initialize_state_from_settings(state_id: str, settings_path: str) -> Modular
         generator=MiddlemanSettings(**settings_data["generator"]),
         limit_type=settings_data.get("limit_type", "token"),
         intermediate_scoring=settings_data.get("intermediate_scoring", False),
+        generation_cache=settings_data.get("generation_cache"),
+        fallback_models=settings_data.get("fallback_models", {}),
     )
 
     initial_state = ModularState(
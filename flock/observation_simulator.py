@@ -2,7 +2,9 @@
 
 import json
 from textwrap import dedent
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import aiohttp
 
 from flock.logger import logger
 from flock.middleman_client import get_credentials, post_completion
@@ -15,9 +17,11 @@ from flock.type_defs.operations import (
 def create_simulator(
     model: str = "gpt-4o-mini",
     context: str = None,
+    credentials: Optional[Tuple[str, str]] = None,
+    session: Optional[aiohttp.ClientSession] = None,
 ) -> Dict[str, Any]:
     """Create a simulator with the given settings"""
-    base_url, api_key = get_credentials()
+    base_url, api_key = credentials or get_credentials()
     context = (
         context
         or dedent(
@@ -36,6 +40,7 @@ def create_simulator(
     return {
         "base_url": base_url,
         "api_key": api_key,
+        "session": session,
         "model": model,
         "context": context,
         "history": history,
@@ -106,6 +111,8 @@ async def simulate_command(
                     model=model,
                     temp=0.7,
                     n=1,
+                    credentials=(sim_state["base_url"], sim_state["api_key"]),
+                    session=sim_state.get("session"),
                 )
                 output = process_response(response)
 
@@ -4,45 +4,15 @@ import asyncio
 import time
 from typing import Any, Dict, List, Optional, Tuple
 
+from flock.dependencies import Dependencies
 from flock.handlers import get_handler
-from flock.middleman_client import post_completion
-from flock.observation_simulator import create_simulator
 from flock.type_defs.operations import (
     RESULT_MODELS,
     OperationRequest,
     OperationResult,
 )
 from flock.type_defs.processing import ProcessingMode
-
-
-def setup_dependencies(mode: ProcessingMode) -> Dict[str, Any]:
-    deps = {}
-    if mode in [ProcessingMode.MIDDLEMAN_SIMULATED]:
-        deps["post_completion"] = (
-            lambda messages,
-            model="gpt-4o-mini",
-            temp=1.0,
-            n=1,
-            function_call=None,
-            functions=None: post_completion(
-                messages=messages,
-                model=model,
-                temp=temp,
-                n=n,
-                function_call=function_call,
-                functions=functions,
-            )
-        )
-        deps["simulator"] = create_simulator()
-    if mode in [ProcessingMode.HOOKS]:
-        try:
-            from pyhooks import CommonEnvs, Hooks
-
-            deps["hooks_client"] = Hooks(envs=CommonEnvs.from_env())
-        except ImportError:
-            if mode == ProcessingMode.HOOKS:
-                raise ImportError("pyhooks required for HOOKS mode")
-    return deps
+from flock.utils.scheduler import FairLimiter
 
 
 async def handle_operation(
@@ -89,10 +59,23 @@ async def handle_operations(
     operations: List[OperationRequest],
     state_id: Optional[str] = None,
     current_phase: Optional[str] = None,
+    limiter: Optional[FairLimiter] = None,
+    container: Optional[Dependencies] = None,
+    settings: Optional[Dict[str, Any]] = None,
 ) -> List[Tuple[OperationRequest, OperationResult]]:
-    dependencies = setup_dependencies(mode)
-    # Add state_id to dependencies for UI events
-    dependencies["state_id"] = state_id or "unknown"
+    if limiter is None:
+        limiter = FairLimiter()
+    if container is None:
+        # Clients built for this batch only, closed once it is done
+        container = Dependencies(mode)
+        try:
+            return await handle_operations(
+                mode, operations, state_id, current_phase, limiter, container, settings
+            )
+        finally:
+            await container.close()
+    run_key = state_id or "unknown"
+    dependencies = await container.for_batch(state_id, settings, current_phase)
 
     # Find usage request if present
     usage_op = next((op for op in operations if op.type == "get_usage"), None)
@@ -101,12 +84,15 @@ async def handle_operations(
     # Handle non-usage operations first
     results = await asyncio.gather(
         *[
-            handle_operation(
-                request=op,
-                mode=mode,
-                dependencies=dependencies,
-                phase=current_phase,
-                state_id=state_id,
+            limiter.run(
+                run_key,
+                handle_operation(
+                    request=op,
+                    mode=mode,
+                    dependencies=dependencies,
+                    phase=current_phase,
+                    state_id=state_id,
+                ),
             )
             for op in other_ops
         ]
@@ -114,12 +100,15 @@ async def handle_operations(
 
     # Handle usage operation if present
     if usage_op:
-        usage_result = await handle_operation(
-            request=usage_op,
-            mode=mode,
-            dependencies=dependencies,
-            phase=current_phase,
-            state_id=state_id,
+        usage_result = await limiter.run(
+            run_key,
+            handle_operation(
+                request=usage_op,
+                mode=mode,
+                dependencies=dependencies,
+                phase=current_phase,
+                state_id=state_id,
+            ),
         )
         results.append(usage_result)
 
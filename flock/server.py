@@ -3,12 +3,23 @@
 import asyncio
 import logging
 import sys
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
 
 from aiohttp import web
 
+from flock.config import PHASE_WORKER_MAX_PHASES, PHASE_WORKERS, PORT, SOCKET_PATH
+from flock.dependencies import Dependencies
 from flock.logger import setup_logger
-from flock.type_defs import ProcessingMode
+from flock.type_defs import PhaseRunner, PhaseTransport, ProcessingMode
+from flock.utils.scheduler import FairLimiter
 from flock.workflows import start_workflow_handler, workflow_handler
+from flock.workflows.handlers import frame_workflow_handler, runs_handler
+from flock.workflows.runtime import WorkflowRuntime
+from flock.workflows.worker_pool import (
+    start_phase_worker_pool,
+    stop_phase_worker_pool,
+)
 
 logger = setup_logger("server")
 
@@ -36,26 +47,128 @@ async def health_check(request: web.Request) -> web.Response:
     return web.Response(text="OK")
 
 
+async def metrics_handler(request: web.Request) -> web.Response:
+    """Report the metrics of every registered component"""
+    providers: Dict[str, Callable[[], Any]] = request.app["metrics"]
+    return web.json_response({name: provider() for name, provider in providers.items()})
+
+
+def setup_worker_pool(
+    app: web.Application, size: int, max_phases_per_worker: int
+) -> None:
+    """Start the phase worker pool with the app and stop it on shutdown"""
+
+    async def on_startup(app: web.Application) -> None:
+        pool = await start_phase_worker_pool(size, max_phases_per_worker)
+        app["metrics"]["phase_workers"] = pool.stats
+
+    async def on_cleanup(app: web.Application) -> None:
+        await stop_phase_worker_pool()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+
+
+def setup_dependencies(app: web.Application, dependencies: Dependencies) -> None:
+    """Build the clients shared by operation batches with the app and close
+    them on shutdown"""
+
+    async def on_startup(app: web.Application) -> None:
+        await dependencies.start()
+        app["metrics"]["generation_cache"] = dependencies.generation_cache.stats
+        app["metrics"]["generation_flights"] = dependencies.generation_flights.stats
+        app["metrics"]["generation_latencies"] = dependencies.generation_latencies.stats
+        app["metrics"]["generation_rate_limits"] = (
+            dependencies.generation_rate_limiter.stats
+        )
+
+    async def on_cleanup(app: web.Application) -> None:
+        await dependencies.close()
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+
+
+def setup_unix_transport(app: web.Application, runtime: WorkflowRuntime) -> None:
+    """Serve /run_workflow frames on the Unix socket while the app is running"""
+
+    async def on_startup(app: web.Application) -> None:
+        runtime.socket_path.unlink(missing_ok=True)
+        app["unix_server"] = await asyncio.start_unix_server(
+            lambda r, w: frame_workflow_handler(r, w, runtime),
+            path=str(runtime.socket_path),
+        )
+        runtime.socket_path.chmod(0o600)
+        logger.info(f"Serving phase requests on {runtime.socket_path}")
+
+    async def on_cleanup(app: web.Application) -> None:
+        app["unix_server"].close()
+        await app["unix_server"].wait_closed()
+        runtime.socket_path.unlink(missing_ok=True)
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+
+
 def create_app(
-    mode: ProcessingMode, log_level: str = "INFO"
+    mode: ProcessingMode,
+    log_level: str = "INFO",
+    runner: PhaseRunner = PhaseRunner.SUBPROCESS,
+    phase_workers: int = PHASE_WORKERS,
+    phase_worker_max_phases: int = PHASE_WORKER_MAX_PHASES,
+    prespawn_phases: bool = False,
+    transport: PhaseTransport = PhaseTransport.HTTP,
+    socket_path: Path = SOCKET_PATH,
+    async_handoff: bool = False,
+    isolate_run_failures: bool = False,
+    max_concurrent_phases: Optional[int] = None,
+    max_concurrent_operations: Optional[int] = None,
+    port: int = PORT,
 ) -> tuple[web.Application, asyncio.Event]:
     """Create and configure the web application"""
     setup_logging(log_level)
-    logger.info(f"Starting server in {mode} mode with log level {log_level}")
+    logger.info(
+        f"Starting server in {mode} mode with {runner} phase runner "
+        f"and log level {log_level}"
+    )
 
     app = web.Application(client_max_size=1024**2 * 100)  # 100 MB limit
 
-    event = asyncio.Event()
-    # Add routes
-    app.router.add_post("/run_workflow", lambda r: workflow_handler(r, mode, event))
-    app.router.add_post(
-        "/start_workflow", lambda r: start_workflow_handler(r, mode, event)
+    runtime = WorkflowRuntime(
+        mode=mode,
+        runner=runner,
+        api_url=f"http://localhost:{port}",
+        prespawn_phases=prespawn_phases,
+        transport=transport,
+        socket_path=socket_path,
+        async_handoff=async_handoff,
+        isolate_run_failures=isolate_run_failures,
+        phase_limiter=FairLimiter(max_concurrent_phases),
+        operation_limiter=FairLimiter(max_concurrent_operations),
+        dependencies=Dependencies(mode),
     )
+    # Add routes
+    app.router.add_post("/run_workflow", lambda r: workflow_handler(r, runtime))
+    app.router.add_post("/start_workflow", lambda r: start_workflow_handler(r, runtime))
+    app.router.add_get("/runs", lambda r: runs_handler(r, runtime))
 
-    # Add health check route
+    # Add health check and metrics routes
     app.router.add_get("/health", health_check)
+    app.router.add_get("/metrics", metrics_handler)
+    app["metrics"] = {
+        "runs": runtime.runs.stats,
+        "phases": runtime.phase_limiter.stats,
+        "operations": runtime.operation_limiter.stats,
+    }
+
+    setup_dependencies(app, runtime.dependencies)
+    if runner == PhaseRunner.WORKER_POOL:
+        setup_worker_pool(app, phase_workers, phase_worker_max_phases)
+    if transport == PhaseTransport.UNIX:
+        setup_unix_transport(app, runtime)
 
     # Store settings in app state
     app["mode"] = mode
+    app["runtime"] = runtime
 
-    return app, event
+    return app, runtime.event
@@ -0,0 +1,31 @@
+"""Pluggable stores for run states"""
+
+from functools import cache
+
+from flock.config import STATE_BACKEND
+from flock.storage.base import StateBackend
+from flock.storage.binary import BinaryStateBackend, LazyState
+from flock.storage.files import FileStateBackend
+from flock.storage.sqlite import SQLiteStateBackend
+from flock.type_defs.processing import StateBackendType
+
+
+@cache
+def get_state_backend() -> StateBackend:
+    """Return the backend selected by FLOCK_STATE_BACKEND"""
+    backend_type = StateBackendType(STATE_BACKEND)
+    if backend_type == StateBackendType.SQLITE:
+        return SQLiteStateBackend()
+    if backend_type == StateBackendType.BINARY:
+        return BinaryStateBackend()
+    return FileStateBackend()
+
+
+__all__ = [
+    "StateBackend",
+    "FileStateBackend",
+    "SQLiteStateBackend",
+    "BinaryStateBackend",
+    "LazyState",
+    "get_state_backend",
+]
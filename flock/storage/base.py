@@ -0,0 +1,41 @@
+"""Interface of the stores holding run states"""
+
+from typing import Any, Dict, List, Protocol
+
+ResultBatch = List[Dict[str, Any]]
+
+
+class StateBackend(Protocol):
+    """Protocol for state backends
+
+    States are plain dicts. `load` raises FileNotFoundError for unknown runs so
+    callers do not depend on the backend in use.
+    """
+
+    def load(self, state_id: str) -> Dict[str, Any]: ...
+
+    def save(self, state_id: str, state: Dict[str, Any]) -> None: ...
+
+    def save_snapshot(
+        self, state_id: str, state: Dict[str, Any], timestamp: str
+    ) -> str:
+        """Keep a copy of the state and return where it was stored"""
+        ...
+
+    def list_snapshots(self, state_id: str) -> List[str]:
+        """Return the timestamps of the snapshots still held, oldest first"""
+        ...
+
+    def load_snapshot(self, state_id: str, timestamp: str) -> Dict[str, Any]: ...
+
+    def spill_results(
+        self, state_id: str, first_index: int, batches: List[ResultBatch]
+    ) -> None:
+        """Keep result batches that are about to leave the live state"""
+        ...
+
+    def load_cold_results(self, state_id: str) -> List[ResultBatch]:
+        """Return the result batches that left the live state, oldest first"""
+        ...
+
+    def list_states(self) -> List[str]: ...
@@ -0,0 +1,320 @@
+"""State backend storing each run in a sectioned binary file
+
+`states/<state_id>.flock` holds one section per scalar field (`settings`,
+`token_usage`, ...) and one per item of each list field (`nodes/12`,
+`previous_results/40`), each a JSON document, zlib-compressed when large. An
+index mapping section names to their position is written after the sections,
+followed by a fixed-size trailer pointing at the index:
+
+    MAGIC | section ... | index | trailer (index offset, index size, END_MAGIC)
+
+A save appends the changed fields and list items (see `journal.diff_state`)
+with a new index and trailer, so it writes what changed rather than the whole
+state, although finding what changed hashes the whole state. Sections replaced by later saves are dropped when the file is
+rewritten, once it is more than twice the size of its live sections.
+
+`LazyState` reads the index and then only the sections it is asked for, so a
+reader that needs `nodes[-1]` and `previous_results[-1]` does not decode the
+rest of the history. Phases load their state with `previous_results` as
+`LazyItems`, whose batches are only decoded when read; the ones a phase never
+read are copied into its workflow request as they were stored.
+"""
+
+import fcntl
+import json
+import os
+import struct
+import zlib
+from collections.abc import Sequence
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from flock.config import JOURNAL_MIN_COMPACT_BYTES, STATES_DIR
+from flock.storage.files import FileStateBackend
+from flock.storage.journal import (
+    SUMMARY_KEYS,
+    diff_state,
+    journal_lock,
+    state_summary,
+)
+
+MAGIC = b"FLKS\x01"
+END_MAGIC = b"FLKE"
+TRAILER = struct.Struct(">QQ4s")
+RAW, ZLIB = 0, 1
+# Sections smaller than this are not worth compressing
+COMPRESS_MIN_BYTES = 1024
+
+# Section name -> (offset, size, codec)
+SectionIndex = Dict[str, Tuple[int, int, int]]
+
+
+def binary_path(state_id: str) -> Path:
+    return STATES_DIR / f"{state_id}.flock"
+
+
+def field_section(key: str) -> str:
+    return f"field:{key}"
+
+
+def item_section(key: str, index: int) -> str:
+    return f"{key}/{index}"
+
+
+def encode(value: Any) -> Tuple[bytes, int]:
+    data = json.dumps(value).encode()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return data, RAW
+    return zlib.compress(data, 1), ZLIB
+
+
+def decode(data: bytes, codec: int) -> Any:
+    return json.loads(section_json(data, codec))
+
+
+def section_json(data: bytes, codec: int) -> bytes:
+    """The JSON document held by a section, without parsing it"""
+    return zlib.decompress(data) if codec == ZLIB else data
+
+
+class Encoded(NamedTuple):
+    """A section read from a state file but not decoded yet"""
+
+    data: bytes
+    codec: int
+
+
+class LazyItems(Sequence):
+    """List items decoded on first access
+
+    Slicing returns `LazyItems` sharing nothing decoded; `list(items)` decodes
+    all of them, while `entries` holds each item as loaded or decoded.
+    """
+
+    def __init__(self, entries: List[Any]):
+        self.entries = entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __getitem__(self, index: Union[int, slice]) -> Any:
+        if isinstance(index, slice):
+            return LazyItems(self.entries[index])
+        entry = self.entries[index]
+        if isinstance(entry, Encoded):
+            entry = self.entries[index] = decode(entry.data, entry.codec)
+        return entry
+
+    def append(self, item: Any) -> None:
+        self.entries.append(item)
+
+
+def write_section(f: IO[bytes], value: Any) -> Tuple[int, int, int]:
+    data, codec = encode(value)
+    offset = f.tell()
+    f.write(data)
+    return offset, len(data), codec
+
+
+def write_index(f: IO[bytes], summary: Dict[str, Any], sections: SectionIndex) -> None:
+    data = zlib.compress(
+        json.dumps({"summary": summary, "sections": sections}).encode()
+    )
+    offset = f.tell()
+    f.write(data)
+    f.write(TRAILER.pack(offset, len(data), END_MAGIC))
+
+
+def read_index(f: IO[bytes]) -> Optional[Tuple[Dict[str, Any], int]]:
+    """Return the latest complete index and the position where it ends
+
+    A save cut short by a crash leaves bytes after the last trailer, in which
+    case the file is searched backwards for the last complete one.
+    """
+    f.seek(0, os.SEEK_END)
+    end = f.tell()
+    if end < len(MAGIC) + TRAILER.size:
+        return None
+    f.seek(end - TRAILER.size)
+    candidates = [end]
+    if f.read(TRAILER.size)[-len(END_MAGIC) :] != END_MAGIC:
+        f.seek(0)
+        data = f.read()
+        position = len(data)
+        candidates = []
+        while (position := data.rfind(END_MAGIC, 0, position)) != -1:
+            candidates.append(position + len(END_MAGIC))
+    for trailer_end in candidates:
+        f.seek(trailer_end - TRAILER.size)
+        offset, size, magic = TRAILER.unpack(f.read(TRAILER.size))
+        if magic != END_MAGIC or offset + size > trailer_end - TRAILER.size:
+            continue
+        f.seek(offset)
+        try:
+            return json.loads(zlib.decompress(f.read(size))), trailer_end
+        except (zlib.error, ValueError):
+            continue
+    return None
+
+
+def write_full(path: Path, state: Dict[str, Any]) -> None:
+    """Write a file holding only the sections of `state`"""
+    sections: SectionIndex = {}
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        for key, value in state.items():
+            if isinstance(value, list):
+                offset = state.get(f"{key}_offset", 0)
+                for index, item in enumerate(value, start=offset):
+                    sections[item_section(key, index)] = write_section(f, item)
+            else:
+                sections[field_section(key)] = write_section(f, value)
+        write_index(f, state_summary(state), sections)
+    os.replace(tmp_path, path)
+
+
+class LazyState:
+    """Read access to the sections of a binary state file
+
+    Use as a context manager; list indices are positions in the live list, so
+    `item("nodes", -1)` is the last node.
+    """
+
+    def __init__(self, state_id: str):
+        self.state_id = state_id
+        self.file: Optional[IO[bytes]] = None
+        self.summary: Dict[str, Any] = {}
+        self.sections: SectionIndex = {}
+
+    def __enter__(self) -> "LazyState":
+        path = binary_path(self.state_id)
+        with journal_lock(self.state_id, fcntl.LOCK_SH):
+            try:
+                self.file = open(path, "rb")
+            except FileNotFoundError:
+                raise FileNotFoundError(f"State file {path} not found")
+            found = read_index(self.file)
+        if found is None:
+            self.file.close()
+            raise ValueError(f"State file {path} has no complete index")
+        index, _ = found
+        self.summary, self.sections = index["summary"], index["sections"]
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        if self.file:
+            self.file.close()
+
+    def read_encoded(self, name: str) -> Encoded:
+        offset, size, codec = self.sections[name]
+        self.file.seek(offset)
+        return Encoded(self.file.read(size), codec)
+
+    def read(self, name: str) -> Any:
+        return decode(*self.read_encoded(name))
+
+    @property
+    def fields(self) -> List[str]:
+        return list(self.summary["hashes"])
+
+    @property
+    def lists(self) -> List[str]:
+        return list(self.summary["lengths"])
+
+    def field(self, key: str) -> Any:
+        return self.read(field_section(key))
+
+    def length(self, key: str) -> int:
+        return self.summary["lengths"][key] - self.summary["offsets"][key]
+
+    def item(self, key: str, index: int) -> Any:
+        length = self.length(key)
+        position = index + length if index < 0 else index
+        if not 0 <= position < length:
+            raise IndexError(f"{key} index {index} out of range for {length} items")
+        return self.read(item_section(key, self.summary["offsets"][key] + position))
+
+    def items(self, key: str) -> List[Any]:
+        return [self.item(key, i) for i in range(self.length(key))]
+
+    def lazy_items(self, key: str) -> LazyItems:
+        """Read the items of a list, leaving them to be decoded on access"""
+        offset = self.summary["offsets"][key]
+        return LazyItems(
+            [
+                self.read_encoded(item_section(key, offset + i))
+                for i in range(self.length(key))
+            ]
+        )
+
+    def to_dict(self, lazy_lists: Iterable[str] = ()) -> Dict[str, Any]:
+        """Decode the whole state, except the lists in `lazy_lists`, which are
+        returned as `LazyItems`"""
+        lazy_lists = set(lazy_lists)
+        state = {key: self.field(key) for key in self.fields}
+        state.update(
+            {
+                key: self.lazy_items(key) if key in lazy_lists else self.items(key)
+                for key in self.lists
+            }
+        )
+        return state
+
+
+class BinaryStateBackend(FileStateBackend):
+    """Stores states in sectioned binary files; snapshots and result batches
+    moved out of the live state are kept as with the files backend"""
+
+    def load(self, state_id: str, lazy_lists: Iterable[str] = ()) -> Dict[str, Any]:
+        with LazyState(state_id) as state:
+            return state.to_dict(lazy_lists)
+
+    def save(self, state_id: str, state: Dict[str, Any]) -> None:
+        path = binary_path(state_id)
+        with journal_lock(state_id, fcntl.LOCK_EX):
+            if path.exists():
+                with open(path, "r+b") as f:
+                    if append_state(f, state):
+                        return
+            write_full(path, state)
+
+    def list_states(self) -> List[str]:
+        return sorted(path.stem for path in STATES_DIR.glob("*.flock"))
+
+
+def append_state(f: IO[bytes], state: Dict[str, Any]) -> bool:
+    """Append the changes to an existing file, returning False when it has to
+    be rewritten instead, e.g. when a list was rebuilt before its mutable tail"""
+    found = read_index(f)
+    entry = diff_state(found[0]["summary"], state) if found else None
+    if entry is None:
+        return False
+    index, end = found
+    previous = index["summary"]
+    sections: SectionIndex = dict(index["sections"])
+
+    # Drop anything a crashed save left after the last index
+    f.truncate(end)
+    f.seek(end)
+    for key in entry["removed"]:
+        sections.pop(field_section(key), None)
+        for i in range(previous["lengths"].get(key, 0)):
+            sections.pop(item_section(key, i), None)
+    for key, value in entry["fields"].items():
+        sections[field_section(key)] = write_section(f, value)
+    for key, (start, items, offset) in entry["lists"].items():
+        previous_items = range(
+            previous["offsets"].get(key, 0), previous["lengths"].get(key, 0)
+        )
+        for i in previous_items:
+            # Moved out of the live list, or replaced below
+            if i < offset or i >= start:
+                sections.pop(item_section(key, i), None)
+        for i, item in enumerate(items, start=start):
+            sections[item_section(key, i)] = write_section(f, item)
+    summary = {key: entry[key] for key in SUMMARY_KEYS}
+    write_index(f, summary, sections)
+
+    live_size = sum(size for _, size, _ in sections.values())
+    return f.tell() <= max(2 * live_size, JOURNAL_MIN_COMPACT_BYTES)
@@ -0,0 +1,56 @@
+"""Copy states from one backend to another
+
+    python -m flock.storage.convert --from files --to binary [state_id ...]
+
+Without state ids, every state of the source backend is converted. Result
+batches that already left the live state are copied along with the state.
+"""
+
+import argparse
+from typing import List, Optional
+
+from flock.storage.base import StateBackend
+from flock.storage.binary import BinaryStateBackend
+from flock.storage.files import FileStateBackend
+from flock.storage.sqlite import SQLiteStateBackend
+from flock.type_defs.processing import StateBackendType
+
+BACKENDS = {
+    StateBackendType.FILES: FileStateBackend,
+    StateBackendType.SQLITE: SQLiteStateBackend,
+    StateBackendType.BINARY: BinaryStateBackend,
+}
+
+
+def convert_state(state_id: str, source: StateBackend, target: StateBackend) -> None:
+    state = source.load(state_id)
+    cold_results = source.load_cold_results(state_id)
+    if cold_results:
+        target.spill_results(state_id, 0, cold_results)
+        # Backends keeping cold batches as part of the state (sqlite) see them
+        # before they are moved out again
+        full_results = cold_results + state["previous_results"]
+        target.save(
+            state_id,
+            {**state, "previous_results": full_results, "previous_results_offset": 0},
+        )
+    target.save(state_id, state)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    choices = [backend_type.value for backend_type in StateBackendType]
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--from", dest="source", choices=choices, required=True)
+    parser.add_argument("--to", dest="target", choices=choices, required=True)
+    parser.add_argument("state_ids", nargs="*", help="States to convert")
+    args = parser.parse_args(argv)
+
+    source = BACKENDS[StateBackendType(args.source)]()
+    target = BACKENDS[StateBackendType(args.target)]()
+    for state_id in args.state_ids or source.list_states():
+        convert_state(state_id, source, target)
+        print(f"Converted {state_id}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""State backend storing each run under STATES_DIR
+
+The state itself is a checkpoint plus journal (see `flock.storage.journal`),
+snapshots are JSON files in `states/<state_id>/snapshots/` named
+`<sequence>_<timestamp>.json` for keyframes and `.delta.json` for deltas (see
+`flock.storage.snapshots`), and result batches moved out of the live state go
+to `states/<state_id>/previous_results.jsonl`.
+"""
+
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from flock.config import STATES_DIR
+from flock.storage import journal
+from flock.storage.base import ResultBatch
+from flock.storage.snapshots import (
+    SnapshotEncoder,
+    rebuild_snapshot,
+    thinned_snapshots,
+)
+
+DELTA_SUFFIX = ".delta.json"
+
+
+def cold_results_path(state_id: str) -> Path:
+    return STATES_DIR / state_id / "previous_results.jsonl"
+
+
+def snapshots_dir(state_id: str) -> Path:
+    return STATES_DIR / state_id / "snapshots"
+
+
+def snapshot_files(state_id: str) -> List[Tuple[Path, str, bool]]:
+    """Return (path, timestamp, is_delta) for each snapshot, in the order they
+    were stored"""
+    snapshots = []
+    for path in sorted(snapshots_dir(state_id).glob("[0-9]*_*.json")):
+        is_delta = path.name.endswith(DELTA_SUFFIX)
+        name = path.name[: -len(DELTA_SUFFIX if is_delta else ".json")]
+        snapshots.append((path, name.split("_", 1)[1], is_delta))
+    return snapshots
+
+
+class FileStateBackend:
+    def __init__(self) -> None:
+        self.snapshots = SnapshotEncoder()
+
+    def load(self, state_id: str) -> Dict[str, Any]:
+        try:
+            return journal.read_state(state_id)
+        except FileNotFoundError:
+            raise FileNotFoundError(
+                f"State file {journal.checkpoint_path(state_id)} not found"
+            )
+
+    def save(self, state_id: str, state: Dict[str, Any]) -> None:
+        STATES_DIR.mkdir(exist_ok=True)
+        journal.append_state(state_id, state)
+
+    def save_snapshot(
+        self, state_id: str, state: Dict[str, Any], timestamp: str
+    ) -> str:
+        directory = snapshots_dir(state_id)
+        directory.mkdir(parents=True, exist_ok=True)
+
+        def store(is_delta: bool, payload: Dict[str, Any]) -> str:
+            # Nanosecond sequence numbers keep the files in the order stored
+            name = f"{time.time_ns():020d}_{timestamp}"
+            path = directory / (name + (DELTA_SUFFIX if is_delta else ".json"))
+            journal.write_atomic(path, json.dumps(payload).encode())
+            return str(path)
+
+        location = self.snapshots.save(state_id, state, store)
+        if self.snapshots.retention:
+            snapshots = snapshot_files(state_id)
+            kinds = [is_delta for _, _, is_delta in snapshots]
+            for i in thinned_snapshots(kinds, self.snapshots.retention):
+                snapshots[i][0].unlink(missing_ok=True)
+        return location
+
+    def list_snapshots(self, state_id: str) -> List[str]:
+        return [timestamp for _, timestamp, _ in snapshot_files(state_id)]
+
+    def load_snapshot(self, state_id: str, timestamp: str) -> Dict[str, Any]:
+        snapshots = snapshot_files(state_id)
+        for end in reversed(range(len(snapshots))):
+            if snapshots[end][1] == timestamp:
+                break
+        else:
+            raise FileNotFoundError(f"No snapshot of {state_id} at {timestamp}")
+        start = end
+        while start > 0 and snapshots[start][2]:
+            start -= 1
+        chain = []
+        for path, _, is_delta in snapshots[start : end + 1]:
+            with open(path, "r") as f:
+                chain.append((is_delta, json.load(f)))
+        return rebuild_snapshot(chain)
+
+    def spill_results(
+        self, state_id: str, first_index: int, batches: List[ResultBatch]
+    ) -> None:
+        path = cold_results_path(state_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # A state starting from offset 0 belongs to a fresh run
+        with open(path, "a" if first_index else "w") as f:
+            for index, batch in enumerate(batches, start=first_index):
+                f.write(json.dumps({"index": index, "results": batch}) + "\n")
+
+    def load_cold_results(self, state_id: str) -> List[ResultBatch]:
+        path = cold_results_path(state_id)
+        if not path.exists():
+            return []
+        batches: Dict[int, ResultBatch] = {}
+        with open(path, "r") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                entry = json.loads(line)
+                # Batches spilled again after a crash replace the earlier copy
+                batches[entry["index"]] = entry["results"]
+        return [batches[index] for index in sorted(batches)]
+
+    def list_states(self) -> List[str]:
+        return sorted(path.stem for path in STATES_DIR.glob("*.json"))
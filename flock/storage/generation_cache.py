@@ -0,0 +1,156 @@
+"""Local disk cache of generation outputs
+
+Each output is stored as `<GENERATION_CACHE_DIR>/<key[:2]>/<key>.json`, where
+the key is the SHA-256 of the canonical JSON of the generation params, so the
+same messages, functions and settings map to the same entry across runs. The
+least recently used entries are evicted once the cache grows beyond its size
+limit. Whether a run reads or writes the cache is decided per settings pack
+(see `GenerationCachePolicy`).
+
+The index of entries is built by `open` when the server starts, and reads and
+writes run in worker threads, so the event loop never waits on the disk.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+from flock.config import (
+    GENERATION_CACHE,
+    GENERATION_CACHE_DIR,
+    GENERATION_CACHE_MAX_BYTES,
+)
+from flock.logger import logger
+from flock.storage.journal import write_atomic
+from flock.type_defs.operations import GenerationOutput, GenerationParams
+from flock.type_defs.processing import GenerationCachePolicy
+
+T = TypeVar("T")
+
+
+def generation_key(params: GenerationParams) -> str:
+    canonical = json.dumps(
+        params.model_dump(mode="json"), sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def cache_policy(settings: Optional[Dict[str, Any]]) -> GenerationCachePolicy:
+    """Return the policy of a settings pack, FLOCK_GENERATION_CACHE by default"""
+    policy = (settings or {}).get("generation_cache") or GENERATION_CACHE
+    return GenerationCachePolicy(policy)
+
+
+class GenerationCache:
+    """Generation outputs keyed by their params, with hit and miss counters"""
+
+    def __init__(
+        self,
+        directory: Path = GENERATION_CACHE_DIR,
+        max_bytes: int = GENERATION_CACHE_MAX_BYTES,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # key -> size in bytes, least recently used first; built by `open`
+        self.entries: Optional[OrderedDict[str, int]] = None
+        self.size = 0
+        self.counters = {"hits": 0, "misses": 0, "bypassed": 0, "evictions": 0}
+        # Held by the worker threads reading and writing the cache
+        self.lock = threading.Lock()
+
+    def path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    async def open(self) -> None:
+        """Build the index of the entries on disk"""
+        await asyncio.to_thread(self.locked, self.load_entries)
+
+    def locked(self, func: Callable[..., T], *args: Any) -> T:
+        with self.lock:
+            return func(*args)
+
+    def load_entries(self) -> OrderedDict[str, int]:
+        if self.entries is None:
+            files = []
+            for path in self.directory.glob("*/*.json"):
+                stat = path.stat()
+                files.append((stat.st_mtime_ns, path.stem, stat.st_size))
+            self.entries = OrderedDict((key, size) for _, key, size in sorted(files))
+            self.size = sum(self.entries.values())
+        return self.entries
+
+    def uses(self, params: GenerationParams, policy: GenerationCachePolicy) -> bool:
+        if policy == GenerationCachePolicy.DETERMINISTIC:
+            return params.settings.temp == 0
+        return policy != GenerationCachePolicy.OFF
+
+    async def get(
+        self, params: GenerationParams, policy: GenerationCachePolicy
+    ) -> Optional[GenerationOutput]:
+        """Return the cached output for `params`, or None on a miss or when the
+        policy does not read the cache"""
+        if not self.uses(params, policy) or policy == GenerationCachePolicy.REFRESH:
+            self.counters["bypassed"] += 1
+            return None
+        data = await asyncio.to_thread(self.locked, self.read, generation_key(params))
+        if data is None:
+            return None
+        return GenerationOutput.model_validate_json(data)
+
+    def read(self, key: str) -> Optional[bytes]:
+        entries = self.load_entries()
+        if key not in entries:
+            self.counters["misses"] += 1
+            return None
+        path = self.path(key)
+        try:
+            data = path.read_bytes()
+            # The file times keep the recency order across restarts
+            os.utime(path)
+        except FileNotFoundError:
+            self.size -= entries.pop(key)
+            self.counters["misses"] += 1
+            return None
+        entries.move_to_end(key)
+        self.counters["hits"] += 1
+        return data
+
+    async def put(
+        self,
+        params: GenerationParams,
+        output: GenerationOutput,
+        policy: GenerationCachePolicy,
+    ) -> None:
+        if not self.uses(params, policy) or output.error or not output.outputs:
+            return
+        key = generation_key(params)
+        data = output.model_dump_json().encode()
+        await asyncio.to_thread(self.locked, self.write, key, data)
+        logger.debug(f"Cached generation {key}")
+
+    def write(self, key: str, data: bytes) -> None:
+        entries = self.load_entries()
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(path, data)
+        self.size += len(data) - entries.pop(key, 0)
+        entries[key] = len(data)
+        while self.size > self.max_bytes and len(entries) > 1:
+            evicted, size = entries.popitem(last=False)
+            self.path(evicted).unlink(missing_ok=True)
+            self.size -= size
+            self.counters["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        # Read without the lock, which a thread may hold while on the disk
+        return {
+            **self.counters,
+            "entries": len(self.entries or ()),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+        }
@@ -0,0 +1,227 @@
+"""Append-only journal of state changes
+
+The state of a run is stored as a checkpoint, `states/<state_id>.json`, plus a
+journal, `states/<state_id>/journal.jsonl`, with one line per save. Each line
+holds only what changed since the previous save:
+
+- for top-level lists (`nodes`, `previous_results`, ...), the items appended
+  since the previous save plus the last `JOURNAL_MUTABLE_TAIL` items, which
+  phases may still update in place
+- the other top-level fields whose value changed, detected by hash
+
+A list may drop items from its front when the state has a `<key>_offset`
+field counting the items removed, e.g. `previous_results_offset`. Positions in
+the journal then count from the start of the full history.
+
+Every line also records the lengths and hashes of the full state, including a
+hash of each list item, so the next save only has to read the last line. When
+a list shrinks, or an item before its mutable tail was changed (phases may
+rebuild a list, e.g. when trimming messages), the change cannot be expressed
+as an append, so the checkpoint is rewritten instead. The journal is
+compacted into the checkpoint once it grows larger than the checkpoint itself,
+which keeps the bytes a save writes proportional to what changed. Finding what
+changed still hashes every field and list item of the state on each save, as a
+list may have been rebuilt anywhere before its mutable tail.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from flock.config import (
+    JOURNAL_MIN_COMPACT_BYTES,
+    JOURNAL_MUTABLE_TAIL,
+    STATES_DIR,
+)
+
+JournalEntry = Dict[str, Any]
+# The parts of a journal entry describing the whole state
+SUMMARY_KEYS = ("lengths", "offsets", "hashes", "items")
+# List items are hashed to a few hex characters, concatenated per list, to
+# keep the summary small next to the items themselves
+ITEM_HASH_CHARS = 8
+
+
+def checkpoint_path(state_id: str) -> Path:
+    return STATES_DIR / f"{state_id}.json"
+
+
+def journal_path(state_id: str) -> Path:
+    return STATES_DIR / state_id / "journal.jsonl"
+
+
+def field_hash(value: Any) -> str:
+    return hashlib.md5(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+def item_hashes(items: List[Any]) -> str:
+    return "".join(field_hash(item)[:ITEM_HASH_CHARS] for item in items)
+
+
+def list_offset(state: Dict[str, Any], key: str) -> int:
+    """Number of items dropped from the front of a list field"""
+    offset = state.get(f"{key}_offset", 0)
+    return offset if isinstance(offset, int) else 0
+
+
+def state_summary(state: Dict[str, Any]) -> JournalEntry:
+    """Lengths and item hashes of the list fields and hashes of the other
+    fields of a state"""
+    lists = [k for k, v in state.items() if isinstance(v, list)]
+    return {
+        "lengths": {k: list_offset(state, k) + len(state[k]) for k in lists},
+        "offsets": {k: list_offset(state, k) for k in lists},
+        "hashes": {
+            k: field_hash(v) for k, v in state.items() if not isinstance(v, list)
+        },
+        "items": {k: item_hashes(state[k]) for k in lists},
+    }
+
+
+def unchanged_prefix(
+    previous: JournalEntry, summary: JournalEntry, key: str, end: int
+) -> bool:
+    """Whether the live items of list `key` before position `end` are the ones
+    the previous summary recorded"""
+    previous_items = previous.get("items", {}).get(key)
+    if previous_items is None:
+        return False
+    offset = summary["offsets"][key]
+    skipped = offset - previous.get("offsets", {}).get(key, 0)
+    size = (end - offset) * ITEM_HASH_CHARS
+    current = summary["items"][key][:size]
+    skipped *= ITEM_HASH_CHARS
+    return previous_items[skipped : skipped + size] == current
+
+
+def read_last_line(path: Path, chunk_size: int = 64 * 1024) -> Optional[bytes]:
+    """Read the last line of a file without reading the whole file"""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        position = end
+        tail = b""
+        while position > 0:
+            step = min(chunk_size, position)
+            position -= step
+            f.seek(position)
+            tail = f.read(step) + tail
+            # Skip the newline that terminates the last line
+            newline = tail.rfind(b"\n", 0, len(tail) - 1)
+            if newline != -1:
+                return tail[newline + 1 :]
+        return tail or None
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def diff_state(previous: JournalEntry, state: Dict[str, Any]) -> Optional[JournalEntry]:
+    """Return the journal entry turning the previous state into `state`, or None
+    if a list shrank below its mutable tail or changed before it"""
+    summary = state_summary(state)
+    previous_lengths = previous.get("lengths", {})
+    previous_offsets = previous.get("offsets", {})
+    previous_hashes = previous.get("hashes", {})
+    lists: Dict[str, List[Any]] = {}
+    for key, length in summary["lengths"].items():
+        offset = summary["offsets"][key]
+        start = offset
+        if key in previous_lengths:
+            if offset < previous_offsets.get(key, 0):
+                return None
+            start = max(previous_lengths[key] - JOURNAL_MUTABLE_TAIL, offset)
+            if length < start or not unchanged_prefix(previous, summary, key, start):
+                return None
+        lists[key] = [start, state[key][start - offset :], offset]
+    fields = {
+        key: state[key]
+        for key, value_hash in summary["hashes"].items()
+        if previous_hashes.get(key) != value_hash
+    }
+    removed = [key for key in {*previous_lengths, *previous_hashes} if key not in state]
+    return {**summary, "lists": lists, "fields": fields, "removed": removed}
+
+
+def apply_entry(state: Dict[str, Any], entry: JournalEntry) -> None:
+    lists = entry.get("lists", {})
+    # Offsets before the fields holding them are updated
+    previous_offsets = {key: list_offset(state, key) for key in lists}
+    for key in entry.get("removed", []):
+        state.pop(key, None)
+    state.update(entry.get("fields", {}))
+    for key, (start, items, offset) in lists.items():
+        kept = (state.get(key) or [])[
+            offset - previous_offsets[key] : start - previous_offsets[key]
+        ]
+        state[key] = kept + items
+
+
+def write_checkpoint(state_id: str, state: Dict[str, Any]) -> None:
+    """Write the full state and reset the journal to start from it"""
+    write_atomic(checkpoint_path(state_id), json.dumps(state).encode())
+    marker = {**state_summary(state), "checkpoint": True}
+    write_atomic(journal_path(state_id), (json.dumps(marker) + "\n").encode())
+
+
+@contextmanager
+def journal_lock(state_id: str, operation: int) -> Iterator[None]:
+    """Keep readers from seeing a checkpoint and journal of different versions"""
+    lock_path = journal_path(state_id).with_name("journal.lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(lock_path, "a") as lock:
+        fcntl.flock(lock, operation)
+        yield
+
+
+def append_state(state_id: str, state: Dict[str, Any]) -> None:
+    """Record a new version of the state of a run"""
+    journal = journal_path(state_id)
+    with journal_lock(state_id, fcntl.LOCK_EX):
+        checkpoint = checkpoint_path(state_id)
+        last_line = read_last_line(journal) if journal.exists() else None
+        # A line without a newline was cut short by a crash
+        if not last_line or not last_line.endswith(b"\n") or not checkpoint.exists():
+            write_checkpoint(state_id, state)
+            return
+
+        entry = diff_state(json.loads(last_line), state)
+        if entry is None:
+            write_checkpoint(state_id, state)
+            return
+
+        line = (json.dumps(entry) + "\n").encode()
+        journal_size = journal.stat().st_size + len(line)
+        if journal_size > max(checkpoint.stat().st_size, JOURNAL_MIN_COMPACT_BYTES):
+            # The state is already in memory, so compaction is a plain rewrite
+            write_checkpoint(state_id, state)
+            return
+        with open(journal, "ab") as f:
+            f.write(line)
+
+
+def read_state(state_id: str) -> Dict[str, Any]:
+    """Load the checkpoint of a run and replay its journal"""
+    journal = journal_path(state_id)
+    if not journal.exists():
+        with open(checkpoint_path(state_id), "r") as f:
+            return json.load(f)
+    with journal_lock(state_id, fcntl.LOCK_SH):
+        with open(checkpoint_path(state_id), "r") as f:
+            state = json.load(f)
+        with open(journal, "r") as f:
+            for line in f:
+                if not line.endswith("\n"):
+                    break
+                entry = json.loads(line)
+                if not entry.get("checkpoint"):
+                    apply_entry(state, entry)
+    return state
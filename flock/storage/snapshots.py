@@ -0,0 +1,108 @@
+"""Delta encoding of state snapshots shared by the backends
+
+Snapshots of a run form chains: a full keyframe followed by deltas, each a
+journal entry (see `journal.diff_state`) against the previous snapshot. A new
+chain starts every SNAPSHOT_KEYFRAME_INTERVAL snapshots, when a list shrank or
+was rewritten before its mutable tail, and after a restart, as the previous
+snapshot is only known in memory.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from flock.config import SNAPSHOT_KEYFRAME_INTERVAL, SNAPSHOT_RETENTION, STATE_DIFF
+from flock.logger import logger
+from flock.storage.journal import (
+    SUMMARY_KEYS,
+    JournalEntry,
+    apply_entry,
+    diff_state,
+    state_summary,
+)
+
+# (is_delta, keyframe state or delta entry), oldest first
+SnapshotChain = Iterable[Tuple[bool, Dict[str, Any]]]
+
+
+class SnapshotEncoder:
+    """Decides for each snapshot whether it is a keyframe or a delta
+
+    Snapshots are stored through `save` one at a time, so a backend listing
+    them in the order they were stored sees every delta after its base.
+    """
+
+    def __init__(
+        self,
+        keyframe_interval: int = SNAPSHOT_KEYFRAME_INTERVAL,
+        retention: int = SNAPSHOT_RETENTION,
+    ):
+        self.keyframe_interval = keyframe_interval
+        self.retention = retention
+        # state_id -> (summary of the previous snapshot, deltas since keyframe)
+        self.previous: Dict[str, Tuple[JournalEntry, int]] = {}
+        self.lock = threading.Lock()
+
+    def save(
+        self,
+        state_id: str,
+        state: Dict[str, Any],
+        store: Callable[[bool, Dict[str, Any]], str],
+    ) -> str:
+        """Store `state` with `store(is_delta, payload)` and return its result"""
+        with self.lock:
+            previous, count = self.previous.pop(state_id, (None, 0))
+            entry = None
+            if previous is not None and count + 1 < self.keyframe_interval:
+                entry = diff_state(previous, state)
+            # Without a stored previous snapshot, the next one is a keyframe
+            if entry is None:
+                location = store(False, state)
+                self.previous[state_id] = (state_summary(state), 0)
+            else:
+                location = store(True, entry)
+                summary = {k: entry[k] for k in SUMMARY_KEYS}
+                self.previous[state_id] = (summary, count + 1)
+        if STATE_DIFF and entry is not None:
+            log_state_diff(state_id, entry)
+        return location
+
+
+def log_state_diff(state_id: str, entry: JournalEntry) -> None:
+    changes = [f"{key} changed" for key in entry["fields"]]
+    changes += [
+        f"{key}[{start}:] updated ({len(items)} items)"
+        for key, (start, items, _) in entry["lists"].items()
+        if items
+    ]
+    changes += [f"{key} removed" for key in entry["removed"]]
+    logger.info(f"[{state_id}] State changes: {', '.join(changes) or 'none'}")
+
+
+def rebuild_snapshot(chain: SnapshotChain) -> Dict[str, Any]:
+    """Apply the deltas of a chain to its keyframe"""
+    state: Optional[Dict[str, Any]] = None
+    for is_delta, payload in chain:
+        if not is_delta:
+            state = payload
+        elif state is None:
+            raise ValueError("Snapshot chain does not start with a keyframe")
+        else:
+            apply_entry(state, payload)
+    if state is None:
+        raise ValueError("Snapshot chain is empty")
+    return state
+
+
+def thinned_snapshots(kinds: List[bool], retention: int) -> List[int]:
+    """Return the positions of the deltas to delete, given whether each
+    snapshot of a run is a delta, oldest first
+
+    The last `retention` snapshots are kept along with the chain they belong
+    to; older deltas are dropped and their keyframes kept.
+    """
+    if len(kinds) <= retention:
+        return []
+    first_kept = len(kinds) - retention
+    while first_kept > 0 and kinds[first_kept]:
+        first_kept -= 1
+    return [i for i in range(first_kept) if kinds[i]]
@@ -0,0 +1,251 @@
+"""State backend storing every run in one SQLite database in WAL mode
+
+A state is split into a row of scalar fields and one row per item of each list
+field (`nodes`, `previous_results`, ...), so a save only writes the items added
+since the previous save plus the mutable tail, in a single transaction. The
+state row keeps a hash of each live item (see `journal.item_hashes`); a list
+whose items changed before its mutable tail has all its live rows rewritten.
+Items before `<key>_offset` are kept as rows and serve as cold storage for
+result batches that left the live state. Snapshots are keyframes and deltas
+(see `flock.storage.snapshots`), in the order of their ids.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from flock.config import JOURNAL_MUTABLE_TAIL, STATE_DB_PATH
+from flock.storage.base import ResultBatch
+from flock.storage.journal import (
+    JournalEntry,
+    item_hashes,
+    list_offset,
+    unchanged_prefix,
+)
+from flock.storage.snapshots import (
+    SnapshotEncoder,
+    rebuild_snapshot,
+    thinned_snapshots,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS states (
+    state_id TEXT PRIMARY KEY,
+    fields TEXT NOT NULL,
+    lists TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS state_items (
+    state_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (state_id, key, idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS snapshots (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    state_id TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    state TEXT NOT NULL,
+    delta INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS snapshots_state_id ON snapshots (state_id, id);
+"""
+
+
+def lists_summary(lists: Dict[str, List[Any]]) -> JournalEntry:
+    """The offsets and item hashes of the `lists` column, shaped like a journal
+    summary; rows written before item hashes were kept have none"""
+    return {
+        "offsets": {key: value[0] for key, value in lists.items()},
+        "items": {key: value[2] for key, value in lists.items() if len(value) > 2},
+    }
+
+
+class SQLiteStateBackend:
+    def __init__(self, path: Path = STATE_DB_PATH):
+        self.path = path
+        self.snapshots = SnapshotEncoder()
+        # sqlite3 connections cannot be shared between threads, and phases run
+        # in threads with the in_process runner
+        self.local = threading.local()
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn: Optional[sqlite3.Connection] = getattr(self.local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(snapshots)")]
+            # Databases created before snapshots were delta encoded
+            if "delta" not in columns:
+                conn.execute(
+                    "ALTER TABLE snapshots ADD COLUMN delta INTEGER NOT NULL DEFAULT 0"
+                )
+            self.local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def load(self, state_id: str) -> Dict[str, Any]:
+        row = self.conn.execute(
+            "SELECT fields, lists FROM states WHERE state_id = ?", (state_id,)
+        ).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"State {state_id} not found in {self.path}")
+        state = json.loads(row[0])
+        for key, (offset, *_) in json.loads(row[1]).items():
+            rows = self.conn.execute(
+                "SELECT value FROM state_items "
+                "WHERE state_id = ? AND key = ? AND idx >= ? ORDER BY idx",
+                (state_id, key, offset),
+            )
+            state[key] = [json.loads(value) for (value,) in rows]
+        return state
+
+    def save(self, state_id: str, state: Dict[str, Any]) -> None:
+        fields = {k: v for k, v in state.items() if not isinstance(v, list)}
+        lists = {
+            key: [
+                list_offset(state, key),
+                list_offset(state, key) + len(value),
+                item_hashes(value),
+            ]
+            for key, value in state.items()
+            if isinstance(value, list)
+        }
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT lists FROM states WHERE state_id = ?", (state_id,)
+            ).fetchone()
+            previous = json.loads(row[0]) if row else {}
+            for key in previous.keys() - lists.keys():
+                conn.execute(
+                    "DELETE FROM state_items WHERE state_id = ? AND key = ?",
+                    (state_id, key),
+                )
+            previous_summary, summary = lists_summary(previous), lists_summary(lists)
+            for key, (offset, length, _) in lists.items():
+                start = offset
+                if key in previous:
+                    previous_offset, previous_length, *_ = previous[key]
+                    tail_start = max(previous_length - JOURNAL_MUTABLE_TAIL, offset)
+                    # Otherwise the list was reset or rebuilt and is rewritten
+                    if (
+                        offset >= previous_offset
+                        and length >= tail_start
+                        and unchanged_prefix(previous_summary, summary, key, tail_start)
+                    ):
+                        start = tail_start
+                conn.execute(
+                    "DELETE FROM state_items "
+                    "WHERE state_id = ? AND key = ? AND idx >= ?",
+                    (state_id, key, start),
+                )
+                conn.executemany(
+                    "INSERT INTO state_items (state_id, key, idx, value) "
+                    "VALUES (?, ?, ?, ?)",
+                    [
+                        (state_id, key, idx, json.dumps(item))
+                        for idx, item in enumerate(
+                            state[key][start - offset :], start=start
+                        )
+                    ],
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO states (state_id, fields, lists, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (state_id, json.dumps(fields), json.dumps(lists), time.time()),
+            )
+
+    def save_snapshot(
+        self, state_id: str, state: Dict[str, Any], timestamp: str
+    ) -> str:
+        def store(is_delta: bool, payload: Dict[str, Any]) -> str:
+            with self.transaction() as conn:
+                cursor = conn.execute(
+                    "INSERT INTO snapshots (state_id, timestamp, state, delta) "
+                    "VALUES (?, ?, ?, ?)",
+                    (state_id, timestamp, json.dumps(payload), is_delta),
+                )
+                if self.snapshots.retention:
+                    self.thin_snapshots(conn, state_id)
+            return f"sqlite://{self.path}#snapshots/{cursor.lastrowid}"
+
+        return self.snapshots.save(state_id, state, store)
+
+    def thin_snapshots(self, conn: sqlite3.Connection, state_id: str) -> None:
+        rows = conn.execute(
+            "SELECT id, delta FROM snapshots WHERE state_id = ? ORDER BY id",
+            (state_id,),
+        ).fetchall()
+        kinds = [bool(delta) for _, delta in rows]
+        conn.executemany(
+            "DELETE FROM snapshots WHERE id = ?",
+            [(rows[i][0],) for i in thinned_snapshots(kinds, self.snapshots.retention)],
+        )
+
+    def list_snapshots(self, state_id: str) -> List[str]:
+        rows = self.conn.execute(
+            "SELECT timestamp FROM snapshots WHERE state_id = ? ORDER BY id",
+            (state_id,),
+        )
+        return [timestamp for (timestamp,) in rows]
+
+    def load_snapshot(self, state_id: str, timestamp: str) -> Dict[str, Any]:
+        row = self.conn.execute(
+            "SELECT MAX(id) FROM snapshots WHERE state_id = ? AND timestamp = ?",
+            (state_id, timestamp),
+        ).fetchone()
+        if row[0] is None:
+            raise FileNotFoundError(f"No snapshot of {state_id} at {timestamp}")
+        rows = self.conn.execute(
+            "SELECT delta, state FROM snapshots WHERE state_id = ? AND id <= ? "
+            "AND id >= (SELECT MAX(id) FROM snapshots "
+            "WHERE state_id = ? AND id <= ? AND delta = 0) ORDER BY id",
+            (state_id, row[0], state_id, row[0]),
+        )
+        return rebuild_snapshot(
+            (bool(delta), json.loads(state)) for delta, state in rows
+        )
+
+    def spill_results(
+        self, state_id: str, first_index: int, batches: List[ResultBatch]
+    ) -> None:
+        # Rows before the offset are never deleted, so they already hold them
+        pass
+
+    def load_cold_results(self, state_id: str) -> List[ResultBatch]:
+        row = self.conn.execute(
+            "SELECT lists FROM states WHERE state_id = ?", (state_id,)
+        ).fetchone()
+        if row is None:
+            return []
+        offset, *_ = json.loads(row[0]).get("previous_results", [0, 0])
+        rows = self.conn.execute(
+            "SELECT value FROM state_items "
+            "WHERE state_id = ? AND key = 'previous_results' AND idx < ? "
+            "ORDER BY idx",
+            (state_id, offset),
+        )
+        return [json.loads(value) for (value,) in rows]
+
+    def list_states(self) -> List[str]:
+        rows = self.conn.execute("SELECT state_id FROM states ORDER BY state_id")
+        return [state_id for (state_id,) in rows]
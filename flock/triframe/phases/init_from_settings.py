@@ -41,6 +41,8 @@ def initialize_state_from_settings(state_id: str, settings_path: str) -> trifram
         enable_advising=settings_data.get("enable_advising", True),
         enable_tool_use=settings_data.get("enable_tool_use", True),
         enable_xml=settings_data.get("enable_xml", False),
+        generation_cache=settings_data.get("generation_cache"),
+        fallback_models=settings_data.get("fallback_models", {}),
     )
 
     initial_state = triframeState(
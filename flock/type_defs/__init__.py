@@ -13,7 +13,15 @@ from flock.type_defs.phases import (
     PreviousOperations,
     StateRequest,
 )
-from flock.type_defs.processing import ProcessingMode
+from flock.type_defs.processing import (
+    CoalescingPolicy,
+    GenerationCachePolicy,
+    PhaseRunner,
+    PhaseTransport,
+    ProcessingMode,
+    RunStatus,
+    StateBackendType,
+)
 from flock.type_defs.states import (
     BaseState,
     ModularState,
@@ -38,6 +46,12 @@ __all__ = [
     "SubmissionRequest",
     # Processing types
     "ProcessingMode",
+    "PhaseRunner",
+    "PhaseTransport",
+    "RunStatus",
+    "StateBackendType",
+    "GenerationCachePolicy",
+    "CoalescingPolicy",
     # Phase types
     "PreviousOperations",
     "StateRequest",
@@ -1,9 +1,19 @@
 """Operation request and result type definitions"""
 
 from datetime import datetime
-from typing import Any, Dict, Generic, List, Literal, Optional, TypeVar, Union
-
-from pydantic import BaseModel, ConfigDict
+from typing import (
+    Annotated,
+    Any,
+    Dict,
+    Generic,
+    List,
+    Literal,
+    Optional,
+    TypeVar,
+    Union,
+)
+
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter
 from pyhooks.types import MiddlemanModelOutput, MiddlemanSettings, ScoreLogEntry
 
 ParamsT = TypeVar("ParamsT", bound=BaseModel)
@@ -30,6 +40,13 @@ class BaseOperationResult(BaseModel, Generic[ResultT]):
     metadata: Optional[OperationMetadata] = None
 
 
+class OperationDescriptor(BaseModel):
+    """An operation request without its params, as handed to the next phase"""
+
+    type: str
+    metadata: Optional[OperationMetadata] = None
+
+
 class InitWorkflowParams(BaseModel):
     workflow_type: str
 
@@ -148,6 +165,16 @@ class GenerationSettings(BaseModel):
     delegation_token: Optional[str] = None
 
 
+class GenerationStreamOptions(BaseModel):
+    """Stream a generation and stop reading it early. Only Middleman calls are
+    streamed; hooks generations ignore these options."""
+
+    # Stop once every completion holds a complete function call
+    stop_after_function_call: bool = False
+    # Stop once a completion and its function call arguments exceed this size
+    max_completion_chars: Optional[int] = None
+
+
 class GenerationParams(BaseModel):
     settings: MiddlemanSettings
     template: Optional[str] = None
@@ -157,6 +184,7 @@ class GenerationParams(BaseModel):
     description: Optional[str] = None
     prompt: Optional[str] = None
     extraParameters: Optional[Dict[str, Any]] = None
+    stream: Optional[GenerationStreamOptions] = None
 
 
 class GenerationOutput(BaseModel):
@@ -167,6 +195,11 @@ class GenerationOutput(BaseModel):
     n_prompt_tokens_spent: Optional[int] = None
     cost: Optional[float] = None
     duration_ms: Optional[int] = None
+    # Set for streamed generations
+    time_to_first_token_ms: Optional[int] = None
+    # The model that produced the outputs, a fallback model if the requested
+    # one kept failing
+    model: Optional[str] = None
 
 
 class GenerationRequest(BaseOperationRequest[GenerationParams]):
@@ -454,39 +487,49 @@ RESULT_MODELS = {
     "write_message": WriteMessageResult,
     "read_messages": ReadMessagesResult,
 }
-OperationRequest = Union[
-    InitWorkflowRequest,
-    BashRequest,
-    PythonRequest,
-    GenerationRequest,
-    SubmissionRequest,
-    LogRequest,
-    LogWithAttributesRequest,
-    ActionRequest,
-    ObservationRequest,
-    GetUsageRequest,
-    GetTaskRequest,
-    SaveStateRequest,
-    ScoreRequest,
-    ScoreLogRequest,
-    WriteMessageRequest,
-    ReadMessagesRequest,
+# Discriminated by `type`, so validation goes straight to the matching model
+OperationRequest = Annotated[
+    Union[
+        InitWorkflowRequest,
+        BashRequest,
+        PythonRequest,
+        GenerationRequest,
+        SubmissionRequest,
+        LogRequest,
+        LogWithAttributesRequest,
+        ActionRequest,
+        ObservationRequest,
+        GetUsageRequest,
+        GetTaskRequest,
+        SaveStateRequest,
+        ScoreRequest,
+        ScoreLogRequest,
+        WriteMessageRequest,
+        ReadMessagesRequest,
+    ],
+    Field(discriminator="type"),
 ]
-OperationResult = Union[
-    InitWorkflowResult,
-    BashResult,
-    PythonResult,
-    GenerationResult,
-    SubmissionResult,
-    LogResult,
-    LogWithAttributesResult,
-    ActionResult,
-    ObservationResult,
-    GetUsageResult,
-    GetTaskResult,
-    SaveStateResult,
-    ScoreResult,
-    ScoreLogResult,
-    ReadMessagesResult,
-    WriteMessageResult,
+OperationResult = Annotated[
+    Union[
+        InitWorkflowResult,
+        BashResult,
+        PythonResult,
+        GenerationResult,
+        SubmissionResult,
+        LogResult,
+        LogWithAttributesResult,
+        ActionResult,
+        ObservationResult,
+        GetUsageResult,
+        GetTaskResult,
+        SaveStateResult,
+        ScoreResult,
+        ScoreLogResult,
+        ReadMessagesResult,
+        WriteMessageResult,
+    ],
+    Field(discriminator="type"),
 ]
+OPERATION_REQUESTS_ADAPTER = TypeAdapter(List[OperationRequest])
+OPERATION_RESULT_ADAPTER = TypeAdapter(OperationResult)
+OPERATION_RESULTS_ADAPTER = TypeAdapter(List[OperationResult])
@@ -1,14 +1,18 @@
 from typing import Any, Dict, List, Optional, Tuple, Union
 
 from pydantic import BaseModel
-from typing_extensions import TypedDict
+from typing_extensions import NotRequired, TypedDict
 
-from flock.type_defs.operations import BaseOperationRequest, BaseOperationResult
+from flock.type_defs.operations import (
+    BaseOperationRequest,
+    OperationDescriptor,
+    OperationResult,
+)
 from flock.type_defs.states import AgentState
 
 
 class PreviousOperations(BaseModel):
-    updates: List[Tuple[BaseOperationRequest, BaseOperationResult]] = []
+    updates: List[Tuple[OperationDescriptor, OperationResult]] = []
     error: Optional[str] = None
     status: str = "success"
 
@@ -30,3 +34,6 @@ class WorkflowData(TypedDict):
     current_phase: Optional[str]
     next_phase: Optional[str]
     delay: Optional[int]
+    # The state to save before the operations run; requests without one refer
+    # to the state already saved
+    state: NotRequired[Dict[str, Any]]
@@ -6,3 +6,43 @@ from enum import Enum
 class ProcessingMode(str, Enum):
     HOOKS = "hooks"
     MIDDLEMAN_SIMULATED = "middleman_simulated"
+
+
+class PhaseRunner(str, Enum):
+    SUBPROCESS = "subprocess"
+    IN_PROCESS = "in_process"
+    WORKER_POOL = "worker_pool"
+
+
+class PhaseTransport(str, Enum):
+    HTTP = "http"
+    UNIX = "unix"
+
+
+class RunStatus(str, Enum):
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+
+class GenerationCachePolicy(str, Enum):
+    OFF = "off"
+    ON = "on"
+    # Only cache generations at temperature 0
+    DETERMINISTIC = "deterministic"
+    # Make every call upstream and store the outputs
+    REFRESH = "refresh"
+
+
+class CoalescingPolicy(str, Enum):
+    OFF = "off"
+    # Only coalesce generations at temperature 0, whose outputs callers expect
+    # to be the same
+    DETERMINISTIC = "deterministic"
+    ALL = "all"
+
+
+class StateBackendType(str, Enum):
+    FILES = "files"
+    SQLITE = "sqlite"
+    BINARY = "binary"
@@ -1,11 +1,12 @@
 """State type definitions for workflows"""
 
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Sequence
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
 
 from flock.type_defs.base import Message, Node, Option
 from flock.type_defs.operations import MiddlemanSettings, OperationResult
+from flock.type_defs.processing import GenerationCachePolicy
 
 
 class BaseState(BaseModel):
@@ -18,6 +19,9 @@ DEFAULT_TIMEOUT = 60
 
 class AgentState(BaseState):
     previous_results: List[List[OperationResult]] = Field(default_factory=list)
+    previous_results_offset: int = Field(
+        0, description="Number of older result batches moved to cold storage"
+    )
     task_string: str = Field("", description="Task description")
     nodes: List[Node] = Field(default_factory=list)
     timeout: int = Field(DEFAULT_TIMEOUT, description="Command timeout in seconds")
@@ -36,6 +40,15 @@ class AgentState(BaseState):
     context_trimming_threshold: int = Field(
         500000, description="Character threshold for context trimming"
     )
+    trimmed_nodes: int = Field(0, description="Number of nodes already trimmed")
+    trimmed_results: int = Field(
+        0, description="Number of result batches, including cold ones, already trimmed"
+    )
+    # Batches between cold storage and `previous_results` that a phase loaded
+    # without validating them (see `phase_utils.build_state`)
+    _unvalidated_results: Sequence[List[Dict[str, Any]]] = PrivateAttr(
+        default_factory=list
+    )
     last_rating_options: Optional[List[Option]] = None
 
     def update_usage(self):
@@ -77,6 +90,13 @@ class triframeSettings(BaseModel):
     enable_xml: bool = Field(
         False, description="Enable XML mode when enable_tool_use is False"
     )
+    generation_cache: Optional[GenerationCachePolicy] = Field(
+        None, description="Generation cache policy, FLOCK_GENERATION_CACHE if unset"
+    )
+    fallback_models: Dict[str, List[str]] = Field(
+        default_factory=dict,
+        description="Models to fall back to, in order, when a model keeps failing",
+    )
 
 
 class triframeState(AgentState):
@@ -91,6 +111,13 @@ class ModularSettings(BaseModel):
     enable_xml: bool = Field(
         False, description="Enable XML mode when enable_tool_use is False"
     )
+    generation_cache: Optional[GenerationCachePolicy] = Field(
+        None, description="Generation cache policy, FLOCK_GENERATION_CACHE if unset"
+    )
+    fallback_models: Dict[str, List[str]] = Field(
+        default_factory=dict,
+        description="Models to fall back to, in order, when a model keeps failing",
+    )
 
 
 class ModularState(AgentState):
@@ -6,6 +6,8 @@ import asyncio
 import importlib
 import json
 import sys
+import time
+import uuid
 from pathlib import Path
 from typing import (
     TYPE_CHECKING,
@@ -22,29 +24,44 @@ from typing import (
 
 import aiohttp
 from pydantic import BaseModel, ValidationError
-
-from flock.config import API_BASE_URL
+from pydantic_core import to_json
+
+from flock.config import (
+    API_BASE_URL,
+    MIN_PREVIOUS_RESULTS_WINDOW,
+    PHASE_TRANSPORT,
+    SERVER_RECONNECT_TIMEOUT,
+    SOCKET_PATH,
+    STRICT_STATE_VALIDATION,
+)
 from flock.logger import logger
+from flock.storage.binary import Encoded, LazyItems, section_json
 from flock.type_defs.base import Message, ThinkingBlock
 from flock.type_defs.operations import (
-    REQUEST_MODELS,
-    RESULT_MODELS,
+    OPERATION_RESULTS_ADAPTER,
     BaseOperationRequest,
     BaseOperationResult,
     GetTaskOutput,
     GetUsageOutput,
     GetUsageParams,
     GetUsageRequest,
+    OperationDescriptor,
     OperationResult,
 )
-from flock.type_defs.phases import PreviousOperations, StateRequest
+from flock.type_defs.phases import PreviousOperations, StateRequest, WorkflowData
+from flock.type_defs.processing import PhaseTransport
 from flock.type_defs.states import AgentState, BaseState, ModularState, triframeState
 from flock.utils.functions import (
     get_standard_function_definitions,
     parse_completions_function_call,
     remove_code_blocks,
 )
-from flock.utils.state import load_state, save_state
+from flock.utils.state import (
+    load_cold_results,
+    load_phase_state,
+    spill_previous_results,
+)
+from flock.utils.transport import post_workflow_frame
 
 if TYPE_CHECKING:
     from pyhooks.types import MiddlemanModelOutput
@@ -60,6 +77,25 @@ def get_last_result(
     return results[-1] if results else None
 
 
+def get_previous_results(state: AgentState, index: int) -> List[OperationResult]:
+    """Return a result batch by its position in the full history of the run,
+    reading batches moved to cold storage when needed. Negative indices count
+    from the latest batch."""
+    unvalidated = state._unvalidated_results
+    live_offset = state.previous_results_offset + len(unvalidated)
+    total = live_offset + len(state.previous_results)
+    position = index + total if index < 0 else index
+    if not 0 <= position < total:
+        raise IndexError(f"Result batch {index} out of range for {total} batches")
+    if position >= live_offset:
+        return state.previous_results[position - live_offset]
+    if position >= state.previous_results_offset:
+        batch = unvalidated[position - state.previous_results_offset]
+        return OPERATION_RESULTS_ADAPTER.validate_python(batch)
+    cold_results = load_cold_results(state.id)
+    return OPERATION_RESULTS_ADAPTER.validate_python(cold_results[position])
+
+
 def get_last_function_call(
     state: Union[triframeState, ModularState],
     latest_results: List[OperationResult],
@@ -106,52 +142,6 @@ def require_single_results(
     return results
 
 
-def validate_operation_request(raw_request: Dict[str, Any]) -> BaseOperationRequest:
-    """Validate an operation request using the base model"""
-    if not isinstance(raw_request, dict):
-        raise ValueError(f"Request must be a dictionary, got {type(raw_request)}")
-    try:
-        base_request = BaseOperationRequest(**raw_request)
-        if base_request.type in REQUEST_MODELS:
-            specific_model = REQUEST_MODELS[base_request.type]
-            return specific_model(**raw_request)
-        return base_request
-    except ValidationError as e:
-        print(f"Validation error details: {str(e)}")
-        raise ValueError(f"Request validation failed:\n{e}")
-
-
-def validate_operation_result(raw_result: Dict[str, Any]) -> BaseOperationResult:
-    """Validate an operation result using the base model"""
-    if not isinstance(raw_result, dict):
-        raise ValueError(f"Result must be a dictionary, got {type(raw_result)}")
-    try:
-        base_result = BaseOperationResult(**raw_result)
-        if base_result.type in RESULT_MODELS:
-            specific_model = RESULT_MODELS[base_result.type]
-            return specific_model(**raw_result)
-        return base_result
-    except ValidationError as e:
-        print(f"Validation error details: {str(e)}")
-        raise ValueError(f"Result validation failed:\n{e}, raw_result: {raw_result}")
-
-
-def validate_update_pair(
-    update: List[Any], index: int
-) -> Tuple[BaseOperationRequest, BaseOperationResult]:
-    """Validate a request-result pair"""
-    if not isinstance(update, list) or len(update) != 2:
-        raise ValueError(f"Update {index} is not a valid request-result pair")
-    try:
-        req = validate_operation_request(update[0])
-        res = validate_operation_result(update[1])
-        return req, res
-    except Exception as e:
-        print(f"Failed to validate update {index}:")
-        print(f"Raw update: {json.dumps(update, indent=2)}")
-        raise ValueError(f"Invalid update {index}:\n{str(e)}")
-
-
 def get_last_completion(
     state: Union[triframeState, ModularState],
     generator_output: MiddlemanModelOutput | None,
@@ -174,6 +164,22 @@ def get_last_generator_output(
     return None
 
 
+def describe_updates(
+    updates: List[Tuple[BaseOperationRequest, BaseOperationResult]],
+) -> List[Tuple[OperationDescriptor, BaseOperationResult]]:
+    """Drop the request params from updates, which the next phase does not
+    read and which hold the whole state for `save_state`"""
+    return [
+        (OperationDescriptor(type=req.type, metadata=req.metadata), res)
+        for req, res in updates
+    ]
+
+
+def dump_json(obj: Any) -> bytes:
+    """Encode results, including the models they hold, straight to JSON"""
+    return to_json(obj, fallback=serialize_for_json)
+
+
 def serialize_for_json(obj: Any) -> Any:
     if hasattr(obj, "model_dump"):
         return obj.model_dump()
@@ -197,39 +203,152 @@ def get_model_class(model_path: str) -> Type[BaseModel]:
         raise ValueError(f"Model not found: {model_path}")
 
 
-async def process_request(
-    session: aiohttp.ClientSession, req: StateRequest, phase_name: str
-) -> aiohttp.ClientResponse:
-    """Process a state request"""
-    save_state(req.state.id, req.state)
-    workflow_data = {
+def build_state(state_model_class: Type[T], state_dict: Dict[str, Any]) -> T:
+    """Build the state model of a phase from a loaded state
+
+    Only the result batches phases read (up to `previous_results[-2]`) are
+    validated unless FLOCK_STRICT_STATE is set; older ones are kept aside as
+    loaded, possibly still encoded (see `storage.binary.LazyItems`), and put
+    back by `dump_state`.
+    """
+    results = state_dict.get("previous_results")
+    if STRICT_STATE_VALIDATION or not results:
+        if results is not None:
+            state_dict = {**state_dict, "previous_results": list(results)}
+        return state_model_class(**state_dict)
+    split = max(len(results) - MIN_PREVIOUS_RESULTS_WINDOW, 0)
+    state = state_model_class(
+        **{**state_dict, "previous_results": list(results[split:])}
+    )
+    state._unvalidated_results = results[:split]
+    return state
+
+
+def dump_state(
+    state: Union[BaseState, Dict[str, Any]], encoded: bool = False
+) -> Dict[str, Any]:
+    """Dump a state model, including result batches it holds unvalidated
+
+    With `encoded`, batches still encoded as loaded are left so, in
+    `LazyItems`, for `dump_workflow_data` to copy into the request as they are.
+    """
+    if not isinstance(state, BaseModel):
+        return state
+    state_dict = state.model_dump()
+    unvalidated = getattr(state, "_unvalidated_results", None)
+    if unvalidated and encoded and isinstance(unvalidated, LazyItems):
+        state_dict["previous_results"] = LazyItems(
+            unvalidated.entries + state_dict["previous_results"]
+        )
+    elif unvalidated:
+        state_dict["previous_results"] = (
+            list(unvalidated) + state_dict["previous_results"]
+        )
+    return state_dict
+
+
+def build_workflow_data(
+    req: StateRequest, phase_name: str, encoded: bool = False
+) -> WorkflowData:
+    """Build the /run_workflow payload for a state request (see `dump_state`
+    for `encoded`)"""
+    return {
         "state_id": req.state.id,
         "operations": [op.model_dump() for op in req.operations],
         "current_phase": phase_name,
         "next_phase": req.next_phase,
         "delay": req.delay,
+        "state": dump_state(req.state, encoded),
     }
-    return await session.post(
+
+
+def dump_workflow_data(workflow_data: WorkflowData) -> bytes:
+    """Encode a workflow request, copying the result batches its state holds
+    still encoded into it without decoding them"""
+    results = workflow_data.get("state", {}).get("previous_results")
+    if not isinstance(results, LazyItems):
+        return dump_json(workflow_data)
+    placeholder = f"previous_results:{uuid.uuid4().hex}"
+    payload = dump_json(
+        {
+            **workflow_data,
+            "state": {**workflow_data["state"], "previous_results": placeholder},
+        }
+    )
+    items = b",".join(
+        section_json(*entry) if isinstance(entry, Encoded) else dump_json(entry)
+        for entry in results.entries
+    )
+    return payload.replace(dump_json(placeholder), b"[%s]" % items, 1)
+
+
+async def process_request(
+    session: aiohttp.ClientSession, req: StateRequest, phase_name: str
+) -> Tuple[int, Any]:
+    """Process a state request and return the response status and body
+
+    The state travels with the request and is saved by the server.
+    """
+    payload = dump_workflow_data(build_workflow_data(req, phase_name, encoded=True))
+    deadline = time.monotonic() + SERVER_RECONNECT_TIMEOUT
+    while True:
+        try:
+            return await send_workflow_data(session, payload)
+        except (
+            aiohttp.ClientConnectorError,
+            ConnectionRefusedError,
+            FileNotFoundError,
+        ):
+            # The request never reached the server, which may be restarting
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.5)
+
+
+async def send_workflow_data(
+    session: aiohttp.ClientSession, payload: bytes
+) -> Tuple[int, Any]:
+    if PHASE_TRANSPORT == PhaseTransport.UNIX:
+        return await post_workflow_frame(SOCKET_PATH, payload)
+    async with session.post(
         f"{API_BASE_URL}/run_workflow",
-        json=workflow_data,
+        data=payload,
         headers={"Content-Type": "application/json"},
         timeout=aiohttp.ClientTimeout(total=100000),
-    )
+    ) as response:
+        if response.status != 200:
+            return response.status, await response.text()
+        return response.status, await response.json()
 
 
-def validate_latest_results(previous_operations_raw: Dict[str, Any]) -> Dict[str, Any]:
-    if "updates" not in previous_operations_raw:
+def validate_latest_results(previous_operations_json: bytes) -> List[Dict[str, Any]]:
+    try:
+        previous_operations = PreviousOperations.model_validate_json(
+            previous_operations_json
+        )
+    except ValidationError as e:
+        raise ValueError(f"Invalid previous operations:\n{e}")
+    if "updates" not in previous_operations.model_fields_set:
         raise ValueError("Previous results missing 'updates' field")
-    validated_updates = []
-    for i, update in enumerate(previous_operations_raw["updates"]):
-        req, res = validate_update_pair(update, i)
-        validated_updates.append((req, res))
-    previous_operations_raw["updates"] = validated_updates
-    previous_operations = PreviousOperations(**previous_operations_raw)
-    latest_results = [
-        req_res[1].model_dump() for req_res in previous_operations.updates
-    ]
-    return latest_results
+    return [res.model_dump() for _, res in previous_operations.updates]
+
+
+def create_state_requests(
+    phase_name: str,
+    create_request_func: Callable[[T], List[StateRequest]],
+    state_model_class: Type[T],
+    state_id: str,
+    previous_operations_json: bytes,
+) -> List[StateRequest]:
+    """Load the state, append the latest results and run the phase function"""
+    latest_results = validate_latest_results(previous_operations_json)
+    logger.info(f"Starting phase: {phase_name}")
+    logger.debug(f"State ID: {state_id}")
+    state_dict = load_phase_state(state_id)
+    state_dict["previous_results"].append(latest_results)
+    spill_previous_results(state_id, state_dict)
+    current_state = build_state(state_model_class, state_dict)
+    return create_request_func(current_state)
 
 
 async def run_main(
@@ -256,15 +375,14 @@ async def run_main(
         sys.exit(1)
     try:
         state_id = sys.argv[1]
-        previous_operations_raw = json.loads(sys.stdin.read())
-        latest_results = validate_latest_results(previous_operations_raw)
-        logger.info(f"Starting phase: {phase_name}")
-        logger.debug(f"State ID: {state_id}")
-        state_dict = load_state(state_id)
-        state_dict["previous_results"].append(latest_results)
-        state_model_class = get_model_class(state_model)
-        current_state = state_model_class(**state_dict)
-        state_requests = create_request_func(current_state)
+        previous_operations_json = sys.stdin.buffer.read()
+        state_requests = create_state_requests(
+            phase_name,
+            create_request_func,
+            get_model_class(state_model),
+            state_id,
+            previous_operations_json,
+        )
         async with aiohttp.ClientSession(
             connector=aiohttp.TCPConnector(limit=None, ssl=False),
             timeout=aiohttp.ClientTimeout(total=100000),
@@ -274,11 +392,9 @@ async def run_main(
             ]
             if tasks:
                 responses = await asyncio.gather(*tasks)
-                for response in responses:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        raise Exception(f"Workflow request failed: {error_text}")
-                    result = await response.json()
+                for status, result in responses:
+                    if status != 200:
+                        raise Exception(f"Workflow request failed: {result}")
                     logger.debug(f"Workflow response: {result}")
         logger.info(f"Phase {phase_name} completed")
     except Exception:
@@ -0,0 +1,103 @@
+"""Retries, backoff and hedging for calls to model APIs"""
+
+import asyncio
+import random
+import re
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+import aiohttp
+
+T = TypeVar("T")
+
+# Error messages of failed upstream calls start with the HTTP status
+RETRYABLE_STATUS = re.compile(r"^\s*(?:HTTP\s+)?(408|409|425|429|5\d\d)\b")
+RETRYABLE_MESSAGES = re.compile(
+    r"timeout|timed out|rate.?limit|overloaded|temporarily|cannot connect|"
+    r"connection (?:reset|refused|closed|aborted)|server disconnected",
+    re.IGNORECASE,
+)
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed call may succeed if made again"""
+    if isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    message = str(error)
+    # Timeouts reported by the clients often have no message
+    return (
+        not message
+        or bool(RETRYABLE_STATUS.match(message))
+        or bool(RETRYABLE_MESSAGES.search(message))
+    )
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter for the given retry (from 0)"""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+class LatencyTracker:
+    """Recent successful call durations per model"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.window = window
+        self.min_samples = min_samples
+        self.samples: Dict[str, Deque[float]] = {}
+
+    def record(self, model: str, seconds: float) -> None:
+        self.samples.setdefault(model, deque(maxlen=self.window)).append(seconds)
+
+    def percentile(self, model: str, percentile: float) -> Optional[float]:
+        """Return the percentile of the recent durations, or None until there
+        are enough of them"""
+        samples = self.samples.get(model)
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(percentile / 100 * len(ordered)))]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            model: {
+                "samples": len(samples),
+                "p50": self.percentile(model, 50),
+                "p95": self.percentile(model, 95),
+            }
+            for model, samples in self.samples.items()
+        }
+
+
+async def hedged(
+    call: Callable[[], Awaitable[T]],
+    delay: Optional[float],
+    on_hedge: Optional[Callable[[], None]] = None,
+) -> T:
+    """Run `call`, and run it a second time if it has not finished after
+    `delay` seconds; the first of the two to succeed wins and the other is
+    cancelled"""
+    if delay is None:
+        return await call()
+    first = asyncio.ensure_future(call())
+    # Cancelled along with the caller, including while waiting for `delay`
+    pending = {first}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return first.result()
+        if on_hedge:
+            on_hedge()
+        pending.add(asyncio.ensure_future(call()))
+        while True:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+            if not pending:
+                # Both failed: report the error of the original call
+                return first.result()
+    finally:
+        for task in pending:
+            task.cancel()
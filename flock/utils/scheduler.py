@@ -0,0 +1,243 @@
+"""Concurrency and rate limits shared between workflow runs"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Deque,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+
+T = TypeVar("T")
+
+
+class FairLimiter:
+    """Caps how many tasks run at once, handing freed slots to waiting runs in
+    round-robin order so that a run with many queued tasks cannot starve the
+    others. A limit of None never makes tasks wait."""
+
+    def __init__(self, limit: Optional[int] = None):
+        if limit is not None and limit < 1:
+            raise ValueError(f"Concurrency limit must be at least 1, got {limit}")
+        self.limit = limit
+        self.active = 0
+        self.waiters: Dict[str, Deque[asyncio.Future]] = {}
+        # Runs with waiting tasks, in the order they will next be served
+        self.ring: Deque[str] = deque()
+
+    def try_acquire(self) -> bool:
+        """Take a slot if one is free and no run is waiting for it"""
+        if self.limit is None or (self.active < self.limit and not self.ring):
+            self.active += 1
+            return True
+        return False
+
+    async def acquire(self, key: str) -> None:
+        if self.try_acquire():
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        queue = self.waiters.setdefault(key, deque())
+        if not queue:
+            self.ring.append(key)
+        queue.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was handed over just before the cancellation
+                self.release()
+            else:
+                self.remove_waiter(key, future)
+            raise
+
+    def release(self) -> None:
+        while self.ring:
+            key = self.ring.popleft()
+            queue = self.waiters[key]
+            future = queue.popleft()
+            if queue:
+                self.ring.append(key)
+            else:
+                del self.waiters[key]
+            if not future.done():
+                # Hand the slot over, so the active count is unchanged
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def remove_waiter(self, key: str, future: asyncio.Future) -> None:
+        queue = self.waiters.get(key)
+        if queue is None or future not in queue:
+            return
+        queue.remove(future)
+        if not queue:
+            del self.waiters[key]
+            self.ring.remove(key)
+
+    @asynccontextmanager
+    async def slot(self, key: str) -> AsyncIterator[None]:
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def run(self, key: str, awaitable: Awaitable[T]) -> T:
+        """Await `awaitable` once `key` has been given a slot"""
+        try:
+            await self.acquire(key)
+        except BaseException:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise
+        try:
+            return await awaitable
+        finally:
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": {key: len(queue) for key, queue in self.waiters.items()},
+        }
+
+
+class TokenBucket:
+    """Refills `per_minute` units a minute, holding at most a minute's worth"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.available = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.available = min(
+            self.capacity, self.available + (now - self.updated) * self.rate
+        )
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` units are available"""
+        self.refill()
+        return max(0.0, (min(amount, self.capacity) - self.available) / self.rate)
+
+    def take(self, amount: float) -> None:
+        """Take units, going below zero for amounts beyond the estimate"""
+        self.refill()
+        self.available -= amount
+
+
+class RateLimiter:
+    """Admits model calls under per-model request and token budgets
+
+    `limits` maps model names, or "*" for any other model, to
+    `requests_per_minute` and `tokens_per_minute`. Calls waiting for a model's
+    budget are admitted by priority (lower first), then in arrival order, so
+    a burst of low priority calls cannot hold back the others.
+    """
+
+    def __init__(self, limits: Dict[str, Dict[str, float]]):
+        self.limits = limits
+        # model -> (request bucket, token bucket), None where unlimited
+        self.buckets: Dict[str, Tuple[Optional[TokenBucket], ...]] = {}
+        # model -> heap of (priority, sequence, woken when first in line)
+        self.queues: Dict[str, List[Tuple[int, int, asyncio.Event]]] = {}
+        self.sequence = itertools.count()
+        self.counters: Dict[str, Dict[str, float]] = {}
+
+    def model_buckets(self, model: str) -> Optional[Tuple[Optional[TokenBucket], ...]]:
+        limits = self.limits.get(model, self.limits.get("*"))
+        if not limits:
+            return None
+        if model not in self.buckets:
+            self.buckets[model] = tuple(
+                TokenBucket(limits[key]) if limits.get(key) else None
+                for key in ("requests_per_minute", "tokens_per_minute")
+            )
+        return self.buckets[model]
+
+    async def acquire(self, model: str, tokens: int, priority: int) -> None:
+        """Wait until a call of about `tokens` tokens fits the model's budget"""
+        buckets = self.model_buckets(model)
+        if buckets is None:
+            return
+        amounts = list(zip(buckets, (1, tokens)))
+        counters = self.counters.setdefault(
+            model, {"admitted": 0, "waited_seconds": 0.0, "max_wait_seconds": 0.0}
+        )
+        queue = self.queues.setdefault(model, [])
+        entry = (priority, next(self.sequence), asyncio.Event())
+        heapq.heappush(queue, entry)
+        queue[0][2].set()
+        start = time.monotonic()
+        try:
+            while True:
+                if queue[0] is not entry:
+                    entry[2].clear()
+                    await entry[2].wait()
+                    continue
+                wait = max(
+                    (bucket.wait_time(amount) for bucket, amount in amounts if bucket),
+                    default=0.0,
+                )
+                if wait == 0:
+                    break
+                # Sleep until the budget refills, unless a call with a higher
+                # priority gets in line first
+                entry[2].clear()
+                try:
+                    await asyncio.wait_for(entry[2].wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            queue.remove(entry)
+            heapq.heapify(queue)
+            if queue:
+                queue[0][2].set()
+        for bucket, amount in amounts:
+            if bucket:
+                bucket.take(amount)
+        waited = time.monotonic() - start
+        counters["admitted"] += 1
+        counters["waited_seconds"] += waited
+        counters["max_wait_seconds"] = max(counters["max_wait_seconds"], waited)
+
+    def settle(self, model: str, estimated: int, actual: Optional[int]) -> None:
+        """Correct the token budget once a call reported what it used"""
+        buckets = self.model_buckets(model)
+        if buckets is not None and buckets[1] is not None and actual is not None:
+            buckets[1].take(actual - estimated)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = {}
+        for model, counters in self.counters.items():
+            queue = self.queues.get(model, [])
+            for bucket in self.buckets[model]:
+                if bucket:
+                    bucket.refill()
+            requests, tokens = self.buckets[model]
+            stats[model] = {
+                **counters,
+                "waiting": len(queue),
+                "waiting_by_priority": {
+                    priority: sum(1 for entry in queue if entry[0] == priority)
+                    for priority in sorted({entry[0] for entry in queue})
+                },
+                "requests_available": requests.available if requests else None,
+                "tokens_available": tokens.available if tokens else None,
+            }
+        return stats
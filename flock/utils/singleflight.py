@@ -0,0 +1,56 @@
+"""Coalescing of identical calls in flight"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class CallAbandoned(Exception):
+    """The caller making a shared call was cancelled before it completed"""
+
+
+class Singleflight:
+    """Runs one call per key at a time: callers arriving while a call with
+    the same key is in flight wait for it and share its result or error
+
+    When the caller making the call is cancelled, its waiters start over, and
+    the first of them to do so makes the call for the others.
+    """
+
+    def __init__(self) -> None:
+        self.calls: Dict[str, asyncio.Future] = {}
+        self.counters = {"calls": 0, "coalesced": 0}
+
+    async def run(self, key: str, call: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """Return the result of `call` and whether it came from another
+        caller's call"""
+        while (future := self.calls.get(key)) is not None:
+            self.counters["coalesced"] += 1
+            try:
+                # A cancelled waiter must not cancel the call it shares
+                return await asyncio.shield(future), True
+            except CallAbandoned:
+                continue
+
+        future = asyncio.get_running_loop().create_future()
+        self.calls[key] = future
+        self.counters["calls"] += 1
+        try:
+            result = await call()
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                # Only this caller is cancelled, not the callers waiting on it
+                future.set_exception(CallAbandoned())
+            else:
+                future.set_exception(e)
+            # Retrieved here so that an error nobody waited for is not logged
+            future.exception()
+            raise
+        finally:
+            del self.calls[key]
+        future.set_result(result)
+        return result, False
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.counters, "in_flight": len(self.calls)}
@@ -1,31 +1,42 @@
 """State management utilities"""
 
-import json
-from typing import Any, Dict, Optional, Type
+from typing import Any, Dict, List, Optional, Type
 
 from pydantic import BaseModel
 
-from flock.config import STATES_DIR
+from flock.config import (
+    JOURNAL_MUTABLE_TAIL,
+    MIN_PREVIOUS_RESULTS_WINDOW,
+    PREVIOUS_RESULTS_WINDOW,
+)
+from flock.storage import BinaryStateBackend, get_state_backend
+from flock.storage.journal import list_offset
 
 
 def load_state(
     state_id: str, schema: Optional[Type[BaseModel]] = None
 ) -> Dict[str, Any]:
-    state_file = STATES_DIR / f"{state_id}.json"
-    try:
-        with open(state_file, "r") as f:
-            state = json.load(f)
-        if schema:
-            validated = schema(**state)
-            return validated.dict()
-        return state
-    except FileNotFoundError:
-        raise FileNotFoundError(f"State file {state_file} not found")
+    state = get_state_backend().load(state_id)
+    if schema:
+        validated = schema(**state)
+        return validated.dict()
+    return state
+
+
+def load_phase_state(state_id: str) -> Dict[str, Any]:
+    """Load a state for a phase; with the binary backend, result batches are
+    only decoded when read, which `phase_utils.build_state` limits to the
+    last few"""
+    backend = get_state_backend()
+    if isinstance(backend, BinaryStateBackend):
+        return backend.load(state_id, lazy_lists=("previous_results",))
+    return backend.load(state_id)
 
 
 def save_state(
     state_id: str, state: Dict[str, Any], schema: Optional[Type[BaseModel]] = None
-) -> None:
+) -> Dict[str, Any]:
+    """Save a state and return it as stored"""
     if schema:
         if isinstance(state, schema):
             state = state.model_dump()
@@ -36,10 +47,30 @@ def save_state(
         state = state.model_dump()
     state_char_limit = state.get("context_trimming_threshold", 8_000)
     state = trim_state(state, state_char_limit)
-    STATES_DIR.mkdir(exist_ok=True)
-    state_file = STATES_DIR / f"{state_id}.json"
-    with open(state_file, "w") as f:
-        json.dump(state, f, indent=2)
+    get_state_backend().save(state_id, state)
+    return state
+
+
+def spill_previous_results(
+    state_id: str, state: Dict[str, Any], window: int = PREVIOUS_RESULTS_WINDOW
+) -> None:
+    """Move the result batches before the last `window` to cold storage"""
+    if not window:
+        return
+    window = max(window, MIN_PREVIOUS_RESULTS_WINDOW)
+    results = state["previous_results"]
+    spilled = len(results) - window
+    if spilled <= 0:
+        return
+    offset = state.get("previous_results_offset", 0)
+    get_state_backend().spill_results(state_id, offset, results[:spilled])
+    state["previous_results"] = results[spilled:]
+    state["previous_results_offset"] = offset + spilled
+
+
+def load_cold_results(state_id: str) -> List[List[Dict[str, Any]]]:
+    """Load the result batches moved out of the live state, oldest first"""
+    return get_state_backend().load_cold_results(state_id)
 
 
 def truncate_string(input: str, char_limit: int) -> str:
@@ -50,16 +81,34 @@ def truncate_string(input: str, char_limit: int) -> str:
     )
 
 
+# Fields recording how far each list has been trimmed by earlier saves
+TRIM_WATERMARKS = {"nodes": "trimmed_nodes", "previous_results": "trimmed_results"}
+
+
+def untrimmed_items(state: Dict[str, Any], key: str) -> List[Any]:
+    """Return the items of a list not trimmed by an earlier save, including the
+    mutable tail, and move the watermark past them"""
+    items = state[key]
+    offset = list_offset(state, key)
+    watermark = state.get(TRIM_WATERMARKS[key], 0)
+    if watermark > offset + len(items):
+        # The list was reset since it was last trimmed
+        watermark = 0
+    start = max(watermark - JOURNAL_MUTABLE_TAIL - offset, 0)
+    state[TRIM_WATERMARKS[key]] = offset + len(items)
+    return items[start:]
+
+
 def trim_state(state: Dict[str, Any], char_limit: int) -> Dict[str, Any]:
     if "nodes" not in state or "previous_results" not in state:
         return state
 
-    for node in state["nodes"]:
+    for node in untrimmed_items(state, "nodes"):
         for option in node.get("options") or []:
             if len(option.get("content") or "") <= char_limit:
                 continue
             option["content"] = truncate_string(option["content"], char_limit)
-    for results in state["previous_results"]:
+    for results in untrimmed_items(state, "previous_results"):
         for result in results:
             if result["type"] == "bash":
                 for field in ["stderr", "stdout"]:
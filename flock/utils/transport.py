@@ -0,0 +1,65 @@
+"""Length-prefixed frames for the Unix domain socket phase transport
+
+Each frame is a 4-byte big-endian length followed by a UTF-8 JSON document.
+Phases send one /run_workflow payload per frame and the server answers with
+a frame of the form {"status": <http status>, "body": <response body>}. A frame
+the server cannot read is answered with an error status and the connection is
+closed.
+"""
+
+import asyncio
+import json
+import struct
+from pathlib import Path
+from typing import Any, Tuple
+
+FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME_SIZE = 1024**2 * 100  # 100 MB, matches the HTTP client_max_size
+
+
+class FrameError(ValueError):
+    """A frame that is too large or not JSON, with the HTTP status to answer"""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Any:
+    """Read a single frame, raising asyncio.IncompleteReadError at EOF and
+    FrameError for a frame that cannot be read"""
+    header = await reader.readexactly(FRAME_HEADER.size)
+    (length,) = FRAME_HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise FrameError(
+            f"Frame of {length} bytes exceeds {MAX_FRAME_SIZE} bytes", status=413
+        )
+    try:
+        return json.loads(await reader.readexactly(length))
+    except ValueError as e:
+        raise FrameError(f"Malformed frame: {e}", status=400)
+
+
+async def write_frame(writer: asyncio.StreamWriter, payload: Any) -> None:
+    """Write a frame; bytes are taken as an already encoded JSON document"""
+    data = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+    writer.write(FRAME_HEADER.pack(len(data)) + data)
+    await writer.drain()
+
+
+def response_frame(status: int, body: bytes) -> bytes:
+    """Encode a response frame around a JSON body without decoding it"""
+    return b'{"status": %d, "body": %s}' % (status, body)
+
+
+async def post_workflow_frame(socket_path: Path, workflow_data: Any) -> Tuple[int, Any]:
+    """Send a /run_workflow payload over the Unix socket and return the
+    response status and body"""
+    reader, writer = await asyncio.open_unix_connection(str(socket_path))
+    try:
+        await write_frame(writer, workflow_data)
+        response = await read_frame(reader)
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    return response["status"], response["body"]
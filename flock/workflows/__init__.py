@@ -2,14 +2,18 @@
 
 from flock.workflows.executor import execute_phase
 from flock.workflows.handlers import (
+    dispatch_workflow,
     handle_workflow,
     start_workflow_handler,
     workflow_handler,
 )
+from flock.workflows.runtime import WorkflowRuntime
 
 __all__ = [
     "workflow_handler",
     "start_workflow_handler",
     "execute_phase",
     "handle_workflow",
+    "dispatch_workflow",
+    "WorkflowRuntime",
 ]
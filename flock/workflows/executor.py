@@ -1,42 +1,125 @@
 """Execute workflow phases"""
 
 import asyncio
-import json
+import importlib
+import os
 import sys
+import typing
+from functools import cache
 from pathlib import Path
-from typing import Any, Dict
+from typing import Callable, List, Optional, Tuple, Type
 
+from flock.config import API_URL_ENV, PHASE_TRANSPORT_ENV, SOCKET_PATH_ENV
 from flock.logger import logger
+from flock.type_defs.phases import StateRequest, WorkflowData
+from flock.type_defs.processing import PhaseRunner
+from flock.type_defs.states import BaseState
+from flock.utils.phase_utils import build_workflow_data, create_state_requests
+from flock.workflows.runtime import WorkflowRuntime
+
+PhaseFunction = Callable[[BaseState], List[StateRequest]]
 
 
 async def execute_phase(
     phase_name: str,
     state_id: str,
-    previous_operations: Dict[str, Any],
-    event: asyncio.Event,
+    previous_operations: bytes,
+    runtime: WorkflowRuntime,
+    proc: Optional[asyncio.subprocess.Process] = None,
 ) -> None:
-    """Execute a workflow phase with the given state and previous operations"""
-    previous_operations_json = json.dumps(previous_operations)
-    absolute_path = Path(__file__).parent.parent / f"{phase_name}"
+    """Execute a workflow phase with the given state and previous operations
 
+    `proc` is an interpreter already started for this phase by
+    `prespawn_phase_process`, which is only used by the subprocess runner.
+    """
     logger.debug(f"[{state_id}][{phase_name}] {'=' * 40}")
-    logger.debug(f"[{state_id}][{phase_name}] Starting phase execution")
-    logger.debug(f"[{state_id}][{phase_name}] Phase path: {str(absolute_path)}")
     logger.debug(
-        f"[{state_id}][{phase_name}] Previous results: "
-        f"{json.dumps(previous_operations, indent=2)}"
+        f"[{state_id}][{phase_name}] Starting phase execution ({runtime.runner})"
+    )
+    logger.debug(
+        f"[{state_id}][{phase_name}] Previous results: {previous_operations.decode()}"
     )
 
-    proc = await asyncio.create_subprocess_exec(
+    runtime.runs.phase_started(state_id, Path(phase_name).stem)
+    if runtime.runner in (PhaseRunner.IN_PROCESS, PhaseRunner.WORKER_POOL):
+        await execute_phase_in_process(
+            phase_name, state_id, previous_operations, runtime
+        )
+    else:
+        await execute_phase_subprocess(
+            phase_name, state_id, previous_operations, runtime, proc
+        )
+
+    logger.debug(f"[{state_id}][{phase_name}] Phase completed successfully")
+
+
+async def spawn_phase_process(
+    phase_name: str, state_id: str, runtime: WorkflowRuntime
+) -> asyncio.subprocess.Process:
+    """Start a phase interpreter, which imports its modules and then blocks on
+    stdin until it is handed the previous operations"""
+    absolute_path = Path(__file__).parent.parent / f"{phase_name}"
+    logger.debug(f"[{state_id}][{phase_name}] Phase path: {str(absolute_path)}")
+    return await asyncio.create_subprocess_exec(
         sys.executable,
         str(absolute_path),
         state_id,
         stdin=asyncio.subprocess.PIPE,
         stdout=asyncio.subprocess.PIPE,
         stderr=asyncio.subprocess.PIPE,
+        env={
+            **os.environ,
+            API_URL_ENV: runtime.api_url,
+            PHASE_TRANSPORT_ENV: runtime.transport.value,
+            SOCKET_PATH_ENV: str(runtime.socket_path),
+        },
     )
 
-    stdout, stderr = await proc.communicate(input=previous_operations_json.encode())
+
+async def prespawn_phase_process(
+    phase_name: str, state_id: str, runtime: WorkflowRuntime
+) -> Optional[asyncio.subprocess.Process]:
+    """Start the interpreter of a run's next phase ahead of time, if a phase
+    slot is free; the process holds that slot until it is run or discarded"""
+    if not runtime.phase_limiter.try_acquire():
+        return None
+    try:
+        return await spawn_phase_process(phase_name, state_id, runtime)
+    except BaseException:
+        runtime.phase_limiter.release()
+        raise
+
+
+async def discard_phase_process(
+    proc: asyncio.subprocess.Process, runtime: WorkflowRuntime
+) -> None:
+    """Stop a pre-spawned phase interpreter that will not be used and free its
+    phase slot"""
+    try:
+        if proc.returncode is None:
+            proc.kill()
+        await proc.wait()
+    finally:
+        runtime.phase_limiter.release()
+
+
+async def execute_phase_subprocess(
+    phase_name: str,
+    state_id: str,
+    previous_operations: bytes,
+    runtime: WorkflowRuntime,
+    proc: Optional[asyncio.subprocess.Process] = None,
+) -> None:
+    """Run a phase script in a fresh Python interpreter"""
+    # A pre-spawned interpreter already holds its slot
+    if proc is None:
+        await runtime.phase_limiter.acquire(state_id)
+    try:
+        if proc is None:
+            proc = await spawn_phase_process(phase_name, state_id, runtime)
+        stdout, stderr = await proc.communicate(input=previous_operations)
+    finally:
+        runtime.phase_limiter.release()
 
     if stdout:
         logger.debug(f"[{state_id}][{phase_name}] stdout: {stdout.decode()}")
@@ -46,7 +129,75 @@ async def execute_phase(
         if stderr:
             error_msg += f"\nstderr: {stderr.decode()}"
         logger.error(f"[{state_id}][{phase_name}] {error_msg}")
-        event.set()
+        runtime.fail(state_id, error_msg)
         raise Exception(error_msg)
 
-    logger.debug(f"[{state_id}][{phase_name}] Phase completed successfully")
+
+@cache
+def load_phase(phase_name: str) -> Tuple[str, PhaseFunction, Type[BaseState]]:
+    """Import a phase module once and return its name, function and state model
+
+    The state model is taken from the annotation of the `state` argument of
+    `create_phase_request`, which matches the model passed to `run_phase` in the
+    module's `__main__` block.
+    """
+    module_name = ".".join(("flock", *Path(phase_name).with_suffix("").parts))
+    module = importlib.import_module(module_name)
+    create_request_func = module.create_phase_request
+    state_model_class = typing.get_type_hints(create_request_func)["state"]
+    return Path(phase_name).stem, create_request_func, state_model_class
+
+
+def prepare_phase_in_process(
+    phase_name: str, state_id: str, previous_operations: bytes
+) -> List[WorkflowData]:
+    """Run a phase function and return the workflow requests it makes, which
+    carry the resulting states"""
+    short_name, create_request_func, state_model_class = load_phase(phase_name)
+    state_requests = create_state_requests(
+        short_name,
+        create_request_func,
+        state_model_class,
+        state_id,
+        previous_operations,
+    )
+    return [build_workflow_data(req, short_name) for req in state_requests]
+
+
+async def execute_phase_in_process(
+    phase_name: str,
+    state_id: str,
+    previous_operations: bytes,
+    runtime: WorkflowRuntime,
+) -> None:
+    """Run a phase in the server process or a pooled worker and dispatch its
+    requests directly"""
+    from flock.workflows.handlers import dispatch_workflow
+    from flock.workflows.worker_pool import get_phase_worker_pool
+
+    try:
+        if runtime.runner == PhaseRunner.WORKER_POOL:
+            prepare = get_phase_worker_pool().run_phase(
+                phase_name, state_id, previous_operations
+            )
+        else:
+            prepare = asyncio.to_thread(
+                prepare_phase_in_process, phase_name, state_id, previous_operations
+            )
+        # Only the phase itself holds a slot, not the operations it requests
+        workflow_requests = await runtime.phase_limiter.run(state_id, prepare)
+        outcomes = await asyncio.gather(
+            *[dispatch_workflow(data, runtime) for data in workflow_requests]
+        )
+    except Exception as e:
+        error_msg = f"Phase {phase_name} failed: {e!r}"
+        logger.error(f"[{state_id}][{phase_name}] {error_msg}", exc_info=True)
+        runtime.fail(state_id, error_msg)
+        raise Exception(error_msg) from e
+
+    errors = [error for _, error in outcomes if error]
+    if errors:
+        error_msg = f"Phase {phase_name} failed: workflow request failed: {errors[0]}"
+        logger.error(f"[{state_id}][{phase_name}] {error_msg}")
+        runtime.fail(state_id, error_msg)
+        raise Exception(error_msg)
@@ -2,15 +2,24 @@
 
 import asyncio
 import json
+import logging
 from datetime import datetime
-from typing import Any, Dict, Optional, Tuple
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
 
 from aiohttp import web
 
-from flock.handlers.base import validate_untyped_request
+from flock.config import WORKFLOW_RESUME_ATTEMPTS
+from flock.dependencies import Dependencies
+from flock.handlers.base import validate_untyped_requests
 from flock.logger import logger
 from flock.operation_handler import handle_operations
-from flock.type_defs import PreviousOperations, ProcessingMode
+from flock.type_defs import (
+    PhaseRunner,
+    PreviousOperations,
+    ProcessingMode,
+    RunStatus,
+)
 from flock.type_defs.operations import (
     InitWorkflowOutput,
     InitWorkflowParams,
@@ -20,19 +29,44 @@ from flock.type_defs.operations import (
     SaveStateRequest,
 )
 from flock.type_defs.phases import WorkflowData
-from flock.utils.phase_utils import serialize_for_json
+from flock.utils.phase_utils import describe_updates, dump_json
+from flock.utils.scheduler import FairLimiter
 from flock.utils.state import load_state, save_state
-from flock.workflows.executor import execute_phase
+from flock.utils.transport import FrameError, read_frame, response_frame, write_frame
+from flock.workflows.executor import (
+    discard_phase_process,
+    execute_phase,
+    prespawn_phase_process,
+)
+from flock.workflows.handoff import (
+    complete_workflow,
+    enqueue_workflow,
+    fail_workflow,
+    pending_workflows,
+    record_resume,
+)
+from flock.workflows.runtime import WorkflowRuntime
 
 
-async def handle_workflow(data: WorkflowData, mode: ProcessingMode) -> Dict[str, Any]:
+async def handle_workflow(
+    data: WorkflowData,
+    mode: ProcessingMode,
+    limiter: Optional[FairLimiter] = None,
+    dependencies: Optional[Dependencies] = None,
+) -> Dict[str, Any]:
     """Handle workflow operations"""
     raw_operations = data.get("operations", [])
     current_phase = data.get("current_phase")
     next_phase = data.get("next_phase")
     delay = data.get("delay", 0)
     state_id = data["state_id"]
-    operations = [validate_untyped_request(op) for op in raw_operations]
+    operations = validate_untyped_requests(raw_operations)
+
+    # The only durable write of the state on this hop
+    if "state" in data:
+        current_state = save_state(state_id, data["state"])
+    else:
+        current_state = load_state(state_id)
 
     if not operations:
         logger.info(f"[{state_id}][{current_phase}] No operations to process")
@@ -42,7 +76,6 @@ async def handle_workflow(data: WorkflowData, mode: ProcessingMode) -> Dict[str,
         logger.info(f"[{state_id}][{current_phase}] Applying delay of {delay} seconds")
         await asyncio.sleep(delay)
 
-    current_state = load_state(state_id)
     save_state_op = SaveStateRequest(
         type="save_state",
         params=SaveStateParams(
@@ -52,33 +85,90 @@ async def handle_workflow(data: WorkflowData, mode: ProcessingMode) -> Dict[str,
     operations.append(save_state_op)
 
     updates = await handle_operations(
-        mode=mode, operations=operations, state_id=state_id, current_phase=current_phase
+        mode=mode,
+        operations=operations,
+        state_id=state_id,
+        current_phase=current_phase,
+        limiter=limiter,
+        container=dependencies,
+        settings=current_state.get("settings"),
     )
 
     logger.info(
         f"[{state_id}][{current_phase}] {len(operations)} operations processed, "
         f"next phase: {next_phase}"
     )
-    return {"updates": updates, "next_phase": next_phase, "error": None, "delay": delay}
-
+    return {
+        "updates": describe_updates(updates),
+        "next_phase": next_phase,
+        "error": None,
+        "delay": delay,
+    }
+
+
+async def dispatch_workflow(
+    data: WorkflowData, runtime: WorkflowRuntime
+) -> Tuple[bytes, Optional[str]]:
+    """Process a workflow request and start its next phase, returning the
+    result as JSON"""
+    state_id = data["state_id"]
+    current_phase = data.get("current_phase", "unknown")
+    if runtime.failed(state_id):
+        return b"{}", f"Run {state_id} has failed"
+
+    proc = None
+    if (
+        runtime.runner == PhaseRunner.SUBPROCESS
+        and runtime.prespawn_phases
+        and data.get("next_phase")
+    ):
+        # Let the next interpreter start up while the operations run, if that
+        # keeps within the phase concurrency limit
+        proc = await prespawn_phase_process(data["next_phase"], state_id, runtime)
 
-async def workflow_handler(
-    request: web.Request, mode: ProcessingMode, event: asyncio.Event
-) -> web.Response:
-    """Handle /run_workflow requests"""
-    if event.is_set():
-        return web.json_response(
-            {"error": "Previous phase errored out, exiting..."}, status=500
+    try:
+        result, error = await process_workflow(
+            data, runtime.mode, runtime.operation_limiter, runtime.dependencies
         )
+    except BaseException:
+        if proc:
+            await discard_phase_process(proc, runtime)
+        raise
+    if error:
+        logger.error(f"[{state_id}][{current_phase}] Workflow error: {error}")
+        if proc:
+            await discard_phase_process(proc, runtime)
+        # Only this run stops when failures are isolated
+        runtime.fail(state_id, error)
+        return b"{}", error
+
+    # Encoded once, for the response and as the input of the next phase
+    result_json = dump_json(result)
+    if result.get("next_phase"):
+        await execute_next_phase(result, result_json, data, runtime, proc)
+    elif proc:
+        await discard_phase_process(proc, runtime)
+
+    return result_json, None
+
+
+async def run_workflow(
+    raw_data: Dict[str, Any], runtime: WorkflowRuntime
+) -> Tuple[bytes, int]:
+    """Handle a /run_workflow payload and return the JSON response body and
+    status"""
     try:
-        raw_data = await request.json()
         state_id = raw_data["state_id"]
         current_phase = raw_data.get("current_phase", "unknown")
-
-        logger.debug(
-            f"[{state_id}][{current_phase}] Received workflow request: "
-            f"{json.dumps(raw_data, indent=2)}"
-        )
+        if runtime.failed(state_id):
+            return dump_json({"error": "Previous phase errored out, exiting..."}), 500
+
+        # The payload carries the whole state, so only format it when logged
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                f"[{state_id}][{current_phase}] Received workflow request: "
+                f"{json.dumps(raw_data, indent=2)}"
+            )
 
         data: WorkflowData = {
             "state_id": state_id,
@@ -87,30 +177,152 @@ async def workflow_handler(
             "next_phase": raw_data.get("next_phase"),
             "delay": raw_data.get("delay", 0),
         }
+        if "state" in raw_data:
+            data["state"] = raw_data["state"]
+
+        if runtime.async_handoff:
+            path, data = await enqueue_workflow(data)
+            runtime.runs.begin(state_id)
+            asyncio.create_task(
+                run_queued_workflow(path, data, runtime),
+                name=f"workflow_{state_id}_{current_phase}",
+            )
+            queued = {
+                "status": "queued",
+                "state_id": state_id,
+                "next_phase": data["next_phase"],
+            }
+            return dump_json(queued), 200
 
-        result, error = await process_workflow(data, mode)
+        result_json, error = await dispatch_workflow(data, runtime)
         if error:
-            logger.error(f"[{state_id}][{current_phase}] Workflow error: {error}")
-            return web.json_response({"error": error}, status=500)
+            return dump_json({"error": error}), 500
+
+        return result_json, 200
+    except Exception as e:
+        logger.error(f"Error in workflow handler: {str(e)}", exc_info=True)
+        return dump_json({"error": str(e)}), 500
 
-        if result.get("next_phase"):
-            await execute_next_phase(result, data, event)
 
-        return web.json_response(serialize_for_json(result))
+async def run_queued_workflow(
+    path: Path, data: WorkflowData, runtime: WorkflowRuntime
+) -> None:
+    """Run a workflow request that was acknowledged before it was processed"""
+    state_id = data["state_id"]
+    current_phase = data.get("current_phase", "unknown")
+    try:
+        _, error = await dispatch_workflow(data, runtime)
+    except asyncio.CancelledError:
+        raise
+    except BaseException as e:
+        # Anything escaping here would be retried on every restart
+        logger.error(
+            f"[{state_id}][{current_phase}] Error running queued workflow: {e!r}",
+            exc_info=True,
+        )
+        error = str(e) or repr(e)
+    finally:
+        runtime.runs.end(state_id)
+    if error:
+        # The phase has already exited, so nothing else will report the failure
+        fail_workflow(path)
+        runtime.fail(state_id, error)
+        return
+    complete_workflow(path)
+
+
+def resume_pending_workflows(
+    runtime: WorkflowRuntime, owns: Optional[Callable[[str], bool]] = None
+) -> int:
+    """Restart the workflow requests that were queued but not completed
+
+    `owns` selects the runs this server is responsible for when the states
+    directory is shared by the workers of a cluster.
+    """
+    resumed = 0
+    for path, data in pending_workflows():
+        state_id = data["state_id"]
+        if owns is not None and not owns(state_id):
+            continue
+        prefix = f"[{state_id}][{data.get('current_phase')}]"
+        attempts = record_resume(path, data)
+        if attempts > WORKFLOW_RESUME_ATTEMPTS:
+            error = f"Queued workflow request failed after {attempts - 1} resumes"
+            logger.error(f"{prefix} {error}")
+            fail_workflow(path)
+            runtime.fail(state_id, error)
+            continue
+        logger.info(f"{prefix} Resuming queued workflow request (attempt {attempts})")
+        runtime.runs.begin(state_id)
+        asyncio.create_task(
+            run_queued_workflow(path, data, runtime),
+            name=f"workflow_{state_id}_{data.get('current_phase')}",
+        )
+        resumed += 1
+    return resumed
+
+
+async def runs_handler(request: web.Request, runtime: WorkflowRuntime) -> web.Response:
+    """Handle /runs requests, optionally filtered with ?status="""
+    status = request.query.get("status")
+    try:
+        run_status = RunStatus(status) if status else None
+    except ValueError:
+        return web.json_response({"error": f"Unknown run status: {status}"}, status=400)
+    return web.json_response({"runs": runtime.runs.list(run_status)})
+
+
+async def workflow_handler(
+    request: web.Request, runtime: WorkflowRuntime
+) -> web.Response:
+    """Handle /run_workflow requests"""
+    try:
+        raw_data = await request.json()
     except Exception as e:
         logger.error(f"Error in workflow handler: {str(e)}", exc_info=True)
         return web.json_response({"error": str(e)}, status=500)
+    body, status = await run_workflow(raw_data, runtime)
+    return web.Response(body=body, status=status, content_type="application/json")
+
+
+async def frame_workflow_handler(
+    reader: asyncio.StreamReader,
+    writer: asyncio.StreamWriter,
+    runtime: WorkflowRuntime,
+) -> None:
+    """Handle /run_workflow payloads sent as frames over the Unix socket"""
+    try:
+        while True:
+            try:
+                raw_data = await read_frame(reader)
+            except asyncio.IncompleteReadError:
+                break
+            except FrameError as e:
+                # The rest of the stream cannot be framed, so answer and close
+                logger.error(f"Rejected workflow frame: {str(e)}")
+                body = dump_json({"error": str(e)})
+                await write_frame(writer, response_frame(e.status, body))
+                break
+            body, status = await run_workflow(raw_data, runtime)
+            await write_frame(writer, response_frame(status, body))
+    except Exception as e:
+        logger.error(f"Error in frame workflow handler: {str(e)}", exc_info=True)
+    finally:
+        writer.close()
 
 
 async def process_workflow(
-    data: WorkflowData, mode: ProcessingMode
+    data: WorkflowData,
+    mode: ProcessingMode,
+    limiter: Optional[FairLimiter] = None,
+    dependencies: Optional[Dependencies] = None,
 ) -> Tuple[Dict[str, Any], Optional[str]]:
     """Process workflow and return result"""
     state_id = data["state_id"]
     current_phase = data.get("current_phase", "unknown")
 
     try:
-        result = await handle_workflow(data, mode)
+        result = await handle_workflow(data, mode, limiter, dependencies)
         return result, None
     except Exception as e:
         logger.error(
@@ -121,7 +333,11 @@ async def process_workflow(
 
 
 async def execute_next_phase(
-    result: Dict[str, Any], data: WorkflowData, event: asyncio.Event
+    result: Dict[str, Any],
+    result_json: bytes,
+    data: WorkflowData,
+    runtime: WorkflowRuntime,
+    proc: Optional[asyncio.subprocess.Process] = None,
 ) -> None:
     """Start next phase if present"""
     if not result.get("next_phase"):
@@ -133,12 +349,14 @@ async def execute_next_phase(
 
     try:
         logger.info(f"[{state_id}][{current_phase}] Starting next phase: {next_phase}")
+        runtime.runs.begin(state_id)
         asyncio.create_task(
-            execute_phase(
+            execute_tracked_phase(
                 next_phase,
                 state_id,
-                {"updates": serialize_for_json(result["updates"])},
-                event,
+                result_json,
+                runtime,
+                proc,
             ),
             name=f"phase_{state_id}_{next_phase}",
         )
@@ -149,8 +367,22 @@ async def execute_next_phase(
         )
 
 
+async def execute_tracked_phase(
+    phase_name: str,
+    state_id: str,
+    previous_operations: bytes,
+    runtime: WorkflowRuntime,
+    proc: Optional[asyncio.subprocess.Process] = None,
+) -> None:
+    """Execute a phase that was counted as pending with `runtime.runs.begin`"""
+    try:
+        await execute_phase(phase_name, state_id, previous_operations, runtime, proc)
+    finally:
+        runtime.runs.end(state_id)
+
+
 async def start_workflow_handler(
-    request: web.Request, mode: ProcessingMode, event: asyncio.Event
+    request: web.Request, runtime: WorkflowRuntime
 ) -> web.Response:
     """Handle /start_workflow requests"""
     try:
@@ -171,6 +403,12 @@ async def start_workflow_handler(
         initial_state = raw_data["initial_state"]
         first_phase = raw_data["first_phase"]
 
+        existing_run = runtime.runs.runs.get(state_id)
+        if existing_run and existing_run.status == RunStatus.RUNNING:
+            error_msg = f"Run {state_id} is already running"
+            logger.error(error_msg)
+            return web.json_response({"error": error_msg}, status=409)
+
         try:
             save_state(state_id, initial_state)
             logger.debug(f"[{state_id}] Saved initial state")
@@ -181,7 +419,7 @@ async def start_workflow_handler(
 
         settings_path = (
             "/home/agent/settings.json"
-            if mode == ProcessingMode.HOOKS
+            if runtime.mode == ProcessingMode.HOOKS
             else raw_data.get("settings_path", "settings.json")
         )
         logger.debug(f"[{state_id}] Using settings path: {settings_path}")
@@ -195,14 +433,18 @@ async def start_workflow_handler(
                 status="success", state_id=state_id, settings_path=settings_path
             ),
         )
-        previous_operations = PreviousOperations(updates=[(init_request, init_result)])
+        previous_operations = PreviousOperations(
+            updates=describe_updates([(init_request, init_result)])
+        )
 
+        runtime.runs.start(state_id, workflow_type)
+        runtime.runs.begin(state_id)
         try:
-            await execute_phase(
+            await execute_tracked_phase(
                 first_phase,
                 state_id,
-                previous_operations.model_dump(),
-                event,
+                dump_json(previous_operations),
+                runtime,
             )
             logger.info(f"[{state_id}] Started {workflow_type} workflow")
         except Exception as e:
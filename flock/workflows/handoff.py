@@ -0,0 +1,80 @@
+"""Durable queue of workflow requests accepted from phases in async handoff mode
+
+A request is written to `states/<state_id>/pending/` before the phase is
+acknowledged and removed once its operations have run and the next phase has
+been started, so requests accepted before a crash can be resumed on restart.
+The state a request carries is saved with the run's other saves instead, so
+queued requests stay small and are loaded with the state when they run. Each
+resume is counted in the request file, so one that keeps failing can be given
+up on.
+"""
+
+import asyncio
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from flock.config import STATES_DIR
+from flock.type_defs.phases import WorkflowData
+from flock.utils.state import save_state
+
+RESUME_ATTEMPTS_KEY = "resume_attempts"
+
+
+def pending_dir(state_id: str) -> Path:
+    return STATES_DIR / state_id / "pending"
+
+
+async def enqueue_workflow(data: WorkflowData) -> Tuple[Path, WorkflowData]:
+    """Durably record an accepted workflow request, off the event loop, and
+    return its path and the request as queued, without its state"""
+    return await asyncio.to_thread(write_pending_workflow, data)
+
+
+def write_pending_workflow(data: WorkflowData) -> Tuple[Path, WorkflowData]:
+    if "state" in data:
+        data = data.copy()
+        save_state(data["state_id"], data.pop("state"))
+    directory = pending_dir(data["state_id"])
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{uuid.uuid4().hex}.json"
+    write_request(path, data)
+    return path, data
+
+
+def write_request(path: Path, data: Dict[str, Any]) -> None:
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def record_resume(path: Path, data: WorkflowData) -> int:
+    """Count a resume of a queued request and return how many there were"""
+    attempts = data.get(RESUME_ATTEMPTS_KEY, 0) + 1
+    write_request(path, {**data, RESUME_ATTEMPTS_KEY: attempts})
+    return attempts
+
+
+def complete_workflow(path: Path) -> None:
+    path.unlink(missing_ok=True)
+
+
+def fail_workflow(path: Path) -> None:
+    """Keep a failed request for inspection without resuming it on restart"""
+    if path.exists():
+        path.rename(path.with_suffix(".failed"))
+
+
+def pending_workflows() -> List[Tuple[Path, WorkflowData]]:
+    """Return the accepted requests that have not completed, oldest first"""
+    paths = sorted(STATES_DIR.glob("*/pending/*.json"), key=lambda p: p.stat().st_mtime)
+    pending = []
+    for path in paths:
+        with open(path) as f:
+            pending.append((path, json.load(f)))
+    return pending
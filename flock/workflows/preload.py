@@ -0,0 +1,34 @@
+"""Phase modules and tiktoken encodings loaded by the forkserver of the phase
+worker pool (see `worker_pool.PRELOAD_MODULES`)
+
+Importing this module does the loading, so it is only meant to be imported
+there: every worker forked afterwards inherits what it loaded.
+"""
+
+from flock.config import REPO_ROOT
+from flock.logger import logger
+from flock.workflows.executor import load_phase
+
+TIKTOKEN_ENCODINGS = ("o200k_base", "cl100k_base")
+
+
+def warm_up() -> None:
+    """Import every phase module and load the tiktoken encodings"""
+    for phase_path in sorted(REPO_ROOT.glob("*/phases/*.py")):
+        if phase_path.stem == "__init__":
+            continue
+        phase_name = str(phase_path.relative_to(REPO_ROOT))
+        try:
+            load_phase(phase_name)
+        except Exception as e:
+            logger.warning(f"Could not preload phase {phase_name}: {e!r}")
+    try:
+        import tiktoken
+
+        for encoding in TIKTOKEN_ENCODINGS:
+            tiktoken.get_encoding(encoding)
+    except Exception as e:
+        logger.debug(f"Could not preload tiktoken encodings: {e!r}")
+
+
+warm_up()
@@ -0,0 +1,90 @@
+"""Registry of the workflow runs hosted by a server"""
+
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional
+
+from flock.type_defs.processing import RunStatus
+
+
+@dataclass
+class RunInfo:
+    state_id: str
+    workflow_type: Optional[str] = None
+    status: RunStatus = RunStatus.RUNNING
+    started_at: float = 0.0
+    finished_at: Optional[float] = None
+    current_phase: Optional[str] = None
+    phases_run: int = 0
+    # Phases and queued workflow requests of this run that have not finished.
+    # The run has completed once this drops to zero.
+    active: int = 0
+    error: Optional[str] = None
+
+
+class RunRegistry:
+    """Tracks the status of every run so one failing run can be stopped without
+    affecting the others"""
+
+    def __init__(self):
+        self.runs: Dict[str, RunInfo] = {}
+
+    def get(self, state_id: str) -> RunInfo:
+        run = self.runs.get(state_id)
+        if run is None:
+            # Runs resumed after a restart were not started on this server
+            run = RunInfo(state_id=state_id, started_at=time.time())
+            self.runs[state_id] = run
+        return run
+
+    def start(self, state_id: str, workflow_type: str) -> RunInfo:
+        run = RunInfo(
+            state_id=state_id, workflow_type=workflow_type, started_at=time.time()
+        )
+        self.runs[state_id] = run
+        return run
+
+    def begin(self, state_id: str) -> None:
+        """Record that a phase or workflow request of the run is pending"""
+        run = self.get(state_id)
+        run.active += 1
+        if run.status == RunStatus.COMPLETED:
+            run.status = RunStatus.RUNNING
+            run.finished_at = None
+
+    def end(self, state_id: str) -> None:
+        run = self.get(state_id)
+        run.active = max(run.active - 1, 0)
+        if run.active == 0 and run.status == RunStatus.RUNNING:
+            run.status = RunStatus.COMPLETED
+            run.finished_at = time.time()
+
+    def phase_started(self, state_id: str, phase_name: str) -> None:
+        run = self.get(state_id)
+        run.current_phase = phase_name
+        run.phases_run += 1
+
+    def fail(self, state_id: str, error: str) -> None:
+        run = self.get(state_id)
+        if run.status == RunStatus.FAILED:
+            return
+        run.status = RunStatus.FAILED
+        run.error = error
+        run.finished_at = time.time()
+
+    def failed(self, state_id: str) -> bool:
+        run = self.runs.get(state_id)
+        return run is not None and run.status == RunStatus.FAILED
+
+    def list(self, status: Optional[RunStatus] = None) -> List[Dict[str, Any]]:
+        return [
+            asdict(run)
+            for run in self.runs.values()
+            if status is None or run.status == status
+        ]
+
+    def stats(self) -> Dict[str, int]:
+        counts = {status.value: 0 for status in RunStatus}
+        for run in self.runs.values():
+            counts[run.status.value] += 1
+        return counts
@@ -0,0 +1,49 @@
+"""Server-wide settings and shared objects used while running workflows"""
+
+import asyncio
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional
+
+from flock.config import API_BASE_URL, SOCKET_PATH
+from flock.dependencies import Dependencies
+from flock.type_defs.processing import PhaseRunner, PhaseTransport, ProcessingMode
+from flock.utils.scheduler import FairLimiter
+from flock.workflows.runs import RunRegistry
+
+
+@dataclass
+class WorkflowRuntime:
+    mode: ProcessingMode
+    runner: PhaseRunner = PhaseRunner.SUBPROCESS
+    # Where phase subprocesses send their workflow requests over HTTP
+    api_url: str = API_BASE_URL
+    # Start the next phase's interpreter while the current operations run,
+    # when a phase slot is free
+    prespawn_phases: bool = False
+    # How phase subprocesses send their workflow requests to the server
+    transport: PhaseTransport = PhaseTransport.HTTP
+    socket_path: Path = SOCKET_PATH
+    # Acknowledge workflow requests once they are durably queued, so phase
+    # processes exit without waiting for their operations
+    async_handoff: bool = False
+    # Only stop the failing run instead of shutting the server down
+    isolate_run_failures: bool = False
+    runs: RunRegistry = field(default_factory=RunRegistry)
+    # Caps on the phases and operations executing at once across all runs
+    phase_limiter: FairLimiter = field(default_factory=FairLimiter)
+    operation_limiter: FairLimiter = field(default_factory=FairLimiter)
+    # Clients reused by every operation batch; built on first use unless
+    # started with the server
+    dependencies: Optional[Dependencies] = None
+    # Set when a phase fails, which shuts the server down
+    event: asyncio.Event = field(default_factory=asyncio.Event)
+
+    def fail(self, state_id: str, error: str) -> None:
+        """Stop a run after one of its phases or workflow requests failed"""
+        self.runs.fail(state_id, error)
+        if not self.isolate_run_failures:
+            self.event.set()
+
+    def failed(self, state_id: str) -> bool:
+        return self.event.is_set() or self.runs.failed(state_id)
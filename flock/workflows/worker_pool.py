@@ -0,0 +1,210 @@
+"""Pool of pre-forked phase workers with flock already imported"""
+
+import asyncio
+import multiprocessing
+import time
+import traceback
+from dataclasses import asdict, dataclass
+from multiprocessing.connection import Connection
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from flock.config import PHASE_WORKER_MAX_PHASES, PHASE_WORKERS
+from flock.logger import logger
+from flock.type_defs.phases import WorkflowData
+
+# Modules imported once by the forkserver so that every forked worker starts
+# with them already loaded; importing `preload` loads the phase modules and
+# tiktoken encodings
+PRELOAD_MODULES = [
+    "flock.type_defs",
+    "flock.utils.phase_utils",
+    "flock.workflows.executor",
+    "flock.workflows.preload",
+]
+
+# Phase name, state id and previous operations as JSON
+PhaseTask = Tuple[str, str, bytes]
+
+
+@dataclass
+class PhaseWorkerStats:
+    worker_id: int
+    pid: Optional[int]
+    started_at: float
+    phases_run: int = 0
+    failures: int = 0
+    busy_seconds: float = 0.0
+    last_phase: Optional[str] = None
+
+
+def worker_main(conn: Connection, max_phases: int) -> None:
+    """Run phases sent over the pipe until the worker is recycled"""
+    from flock.workflows.executor import prepare_phase_in_process
+
+    for _ in range(max_phases):
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        phase_name, state_id, previous_operations = task
+        try:
+            workflow_requests = prepare_phase_in_process(
+                phase_name, state_id, previous_operations
+            )
+            conn.send(("ok", workflow_requests))
+        except Exception:
+            conn.send(("error", traceback.format_exc()))
+    conn.close()
+
+
+class PhaseWorker:
+    """A single pre-forked worker process and its pipe"""
+
+    def __init__(
+        self, ctx: multiprocessing.context.BaseContext, worker_id: int, max_phases: int
+    ):
+        self.max_phases = max_phases
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(
+            target=worker_main,
+            args=(child_conn, max_phases),
+            name=f"flock-phase-worker-{worker_id}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.stats = PhaseWorkerStats(
+            worker_id=worker_id, pid=self.process.pid, started_at=time.time()
+        )
+
+    @property
+    def exhausted(self) -> bool:
+        return self.stats.phases_run >= self.max_phases or not self.process.is_alive()
+
+    def run(self, task: PhaseTask) -> Tuple[str, Any]:
+        self.conn.send(task)
+        return self.conn.recv()
+
+    def close(self, timeout: float = 5.0) -> None:
+        try:
+            if self.process.is_alive():
+                self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+
+class PhaseWorkerPool:
+    """Hands phases to idle pre-forked workers and recycles them after
+    `max_phases_per_worker` phases to bound memory growth"""
+
+    def __init__(
+        self,
+        size: int = PHASE_WORKERS,
+        max_phases_per_worker: int = PHASE_WORKER_MAX_PHASES,
+    ):
+        self.size = size
+        self.max_phases_per_worker = max_phases_per_worker
+        self.ctx = multiprocessing.get_context("forkserver")
+        self.ctx.set_forkserver_preload(PRELOAD_MODULES)
+        self.workers: Dict[int, PhaseWorker] = {}
+        self.idle: asyncio.Queue[PhaseWorker] = asyncio.Queue()
+        self.next_worker_id = 0
+        self.retired_workers = 0
+        # Replacements of exhausted workers, kept until they complete
+        self.retiring: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        await asyncio.gather(*[self.add_worker() for _ in range(self.size)])
+        logger.info(f"Started {self.size} phase workers")
+
+    async def add_worker(self) -> None:
+        worker_id = self.next_worker_id
+        self.next_worker_id += 1
+        worker = await asyncio.to_thread(
+            PhaseWorker, self.ctx, worker_id, self.max_phases_per_worker
+        )
+        self.workers[worker_id] = worker
+        await self.idle.put(worker)
+
+    async def retire_worker(self, worker: PhaseWorker) -> None:
+        self.workers.pop(worker.stats.worker_id, None)
+        self.retired_workers += 1
+        await asyncio.to_thread(worker.close)
+        await self.add_worker()
+
+    async def run_phase(
+        self, phase_name: str, state_id: str, previous_operations: bytes
+    ) -> List[WorkflowData]:
+        """Run a phase on an idle worker and return its workflow requests"""
+        worker = await self.idle.get()
+        started = time.monotonic()
+        try:
+            status, payload = await asyncio.to_thread(
+                worker.run, (phase_name, state_id, previous_operations)
+            )
+        except (EOFError, OSError) as e:
+            status, payload = "error", f"Phase worker exited unexpectedly: {e!r}"
+        finally:
+            worker.stats.phases_run += 1
+            worker.stats.busy_seconds += time.monotonic() - started
+            worker.stats.last_phase = Path(phase_name).stem
+            if worker.exhausted:
+                task = asyncio.create_task(self.retire_worker(worker))
+                self.retiring.add(task)
+                task.add_done_callback(self.retiring.discard)
+            else:
+                self.idle.put_nowait(worker)
+
+        if status != "ok":
+            worker.stats.failures += 1
+            raise Exception(f"Phase {phase_name} failed in worker:\n{payload}")
+        return payload
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self.size,
+            "max_phases_per_worker": self.max_phases_per_worker,
+            "idle": self.idle.qsize(),
+            "retired_workers": self.retired_workers,
+            "workers": [asdict(worker.stats) for worker in self.workers.values()],
+        }
+
+    async def close(self) -> None:
+        await asyncio.gather(*self.retiring, return_exceptions=True)
+        workers = list(self.workers.values())
+        self.workers.clear()
+        await asyncio.gather(*[asyncio.to_thread(w.close) for w in workers])
+
+
+_pool: Optional[PhaseWorkerPool] = None
+
+
+def get_phase_worker_pool() -> PhaseWorkerPool:
+    if _pool is None:
+        raise RuntimeError("Phase worker pool has not been started")
+    return _pool
+
+
+async def start_phase_worker_pool(
+    size: int = PHASE_WORKERS,
+    max_phases_per_worker: int = PHASE_WORKER_MAX_PHASES,
+) -> PhaseWorkerPool:
+    global _pool
+    if _pool is None:
+        _pool = PhaseWorkerPool(size, max_phases_per_worker)
+        await _pool.start()
+    return _pool
+
+
+async def stop_phase_worker_pool() -> None:
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import os
+import signal
+import socket
+from pathlib import Path
+
+import aiohttp
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+from flock.cluster import ClusterSupervisor, HashRing, create_router_app, worker_name
+from flock.cluster import supervisor as supervisor_module
+
+HELD_PROMPT = "held until the worker is killed"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def owned_state_id(ring: HashRing, node: str, prefix: str) -> str:
+    return next(
+        state_id
+        for state_id in (f"{prefix}_{i}" for i in range(1000))
+        if ring.node_for(state_id) == node
+    )
+
+
+async def wait_until(condition, timeout: float = 60.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not await condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.2)
+
+
+@pytest_asyncio.fixture
+async def middleman():
+    """Fake Middleman that never answers the first held prompt"""
+    held = []
+    released = asyncio.Event()
+
+    async def completions(request: web.Request) -> web.Response:
+        data = await request.json()
+        if data["messages"][0]["content"] == HELD_PROMPT:
+            held.append(data)
+            if len(held) == 1:
+                await released.wait()
+        return web.json_response(
+            {"outputs": [{"completion": "done", "stop_reason": "stop"}]}
+        )
+
+    app = web.Application()
+    app.router.add_post("/completions", completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    port = free_port()
+    await web.TCPSite(runner, "localhost", port).start()
+    yield f"http://localhost:{port}", held
+    released.set()
+    await runner.cleanup()
+
+
+@pytest_asyncio.fixture
+async def cluster(tmp_path, monkeypatch, middleman):
+    url, _ = middleman
+    # Phase scripts import flock from the repository, as with main.py
+    repo_root = str(Path(__file__).parents[2])
+    monkeypatch.setenv(
+        "PYTHONPATH",
+        os.pathsep.join(filter(None, [repo_root, os.getenv("PYTHONPATH")])),
+    )
+    monkeypatch.setenv("FLOCK_STATES_DIR", str(tmp_path / "states"))
+    monkeypatch.setenv("MIDDLEMAN_API_URL", url)
+    monkeypatch.setenv("MIDDLEMAN_API_KEY", "cluster-test")
+    monkeypatch.setattr(supervisor_module, "CLUSTER_RESTART_DELAY", 0.1)
+
+    base_port = free_port()
+    supervisor = ClusterSupervisor(
+        2,
+        base_port,
+        ["--mode", "middleman_simulated", "--socket-path", str(tmp_path / "s.sock")],
+    )
+    runner = web.AppRunner(create_router_app(supervisor))
+    await runner.setup()
+    site = web.TCPSite(runner, "localhost", base_port)
+    try:
+        await supervisor.start()
+        await site.start()
+        async with aiohttp.ClientSession() as session:
+
+            async def workers_ready() -> bool:
+                for worker in supervisor.workers:
+                    try:
+                        async with session.get(f"{worker.url}/health") as response:
+                            if response.status != 200:
+                                return False
+                    except aiohttp.ClientError:
+                        return False
+                return True
+
+            await wait_until(workers_ready)
+            yield supervisor, f"http://localhost:{base_port}", session
+    finally:
+        await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_run_of_killed_worker_is_resumed(tmp_path, middleman, cluster):
+    _, held = middleman
+    supervisor, router_url, session = cluster
+    ring = HashRing(worker_name(i) for i in range(2))
+    started = owned_state_id(ring, worker_name(0), "started")
+    queued = owned_state_id(ring, worker_name(1), "queued")
+    settings_path = tmp_path / "settings.json"
+    settings_path.write_text(
+        json.dumps({"actors": [{"model": "gpt-4o-mini"}], "enable_advising": False})
+    )
+
+    async with session.post(
+        f"{router_url}/start_workflow",
+        json={
+            "state_id": started,
+            "workflow_type": "triframe",
+            "initial_state": {"id": started, "previous_results": []},
+            "first_phase": "triframe/phases/init_from_settings.py",
+            "settings_path": str(settings_path),
+        },
+    ) as response:
+        assert response.status == 200, await response.text()
+
+    operation = {
+        "type": "generate",
+        "params": {
+            "settings": {"model": "gpt-4o-mini"},
+            "messages": [{"role": "user", "content": HELD_PROMPT}],
+        },
+        "metadata": {"purpose": "test", "phase": "test", "state_id": queued},
+    }
+    async with session.post(
+        f"{router_url}/run_workflow",
+        json={
+            "state_id": queued,
+            "current_phase": "test",
+            "operations": [operation],
+            "next_phase": None,
+            "state": {"id": queued},
+        },
+    ) as response:
+        assert response.status == 200, await response.text()
+
+    async def generation_held() -> bool:
+        return len(held) == 1
+
+    await wait_until(generation_held)
+    supervisor.workers[1].proc.send_signal(signal.SIGKILL)
+
+    pending = tmp_path / "states" / queued / "pending"
+
+    async def request_completed() -> bool:
+        return len(held) == 2 and not any(pending.glob("*.json"))
+
+    await wait_until(request_completed)
+    assert not any(pending.glob("*.failed"))
+    assert [w.restarts for w in supervisor.workers] == [0, 1]
+
+    async with session.get(f"{router_url}/runs") as response:
+        runs = {run["state_id"]: run for run in (await response.json())["runs"]}
+    assert runs[started]["worker"] == worker_name(0)
+    assert runs[queued]["worker"] == worker_name(1)
+    assert runs[queued]["status"] != "failed"
@@ -0,0 +1,41 @@
+from collections import Counter
+
+import pytest
+
+from flock.cluster.ring import HashRing, worker_name
+
+STATE_IDS = [f"triframe_{i}" for i in range(2000)]
+
+
+def test_hash_ring_is_deterministic():
+    nodes = [worker_name(i) for i in range(4)]
+    first, second = HashRing(nodes), HashRing(reversed(nodes))
+    assert [first.node_for(s) for s in STATE_IDS] == [
+        second.node_for(s) for s in STATE_IDS
+    ]
+
+
+def test_hash_ring_spreads_keys_across_nodes():
+    ring = HashRing(worker_name(i) for i in range(4))
+    counts = Counter(ring.node_for(s) for s in STATE_IDS)
+    assert set(counts) == set(ring.nodes)
+    assert min(counts.values()) > len(STATE_IDS) / 4 * 0.5
+
+
+def test_hash_ring_only_moves_keys_of_changed_node():
+    ring = HashRing(worker_name(i) for i in range(4))
+    before = {s: ring.node_for(s) for s in STATE_IDS}
+
+    ring.add(worker_name(4))
+    after = {s: ring.node_for(s) for s in STATE_IDS}
+    moved = [s for s in STATE_IDS if before[s] != after[s]]
+    assert moved
+    assert all(after[s] == worker_name(4) for s in moved)
+
+    ring.remove(worker_name(4))
+    assert {s: ring.node_for(s) for s in STATE_IDS} == before
+
+
+def test_empty_hash_ring_raises():
+    with pytest.raises(LookupError):
+        HashRing().node_for("triframe_1")
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from flock.handlers import generate
+from flock.storage.generation_cache import GenerationCache
+from flock.type_defs.operations import (
+    GenerationOutput,
+    GenerationParams,
+    MiddlemanSettings,
+)
+from flock.type_defs.processing import GenerationCachePolicy
+from flock.utils.resilience import LatencyTracker
+from flock.utils.singleflight import Singleflight
+
+
+@pytest.mark.asyncio
+async def test_generation_retries_then_falls_back(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(generate, "GENERATION_RETRIES", 1)
+    monkeypatch.setattr(generate, "GENERATION_RETRY_DELAY", 0)
+    models = []
+
+    async def executor(params, deps):
+        models.append(params.settings.model)
+        if params.settings.model == "primary":
+            raise Exception("529, overloaded")
+        return GenerationOutput(outputs=[{"completion": "ok"}])
+
+    deps = {
+        "fallback_models": {"primary": ["secondary"]},
+        "generation_latencies": LatencyTracker(),
+    }
+    params = GenerationParams(settings=MiddlemanSettings(model="primary"))
+
+    output = await generate.resilient(executor)(params, deps)
+
+    assert output.outputs[0].completion == "ok" and output.model == "secondary"
+    assert models == ["primary", "primary", "secondary"]
+    log = (tmp_path / "logs" / "generations").glob("*.jsonl")
+    assert sum(len(path.read_text().splitlines()) for path in log) == 3
+
+
+@pytest.mark.asyncio
+async def test_generation_errors_that_cannot_be_retried_are_raised(
+    tmp_path, monkeypatch
+):
+    monkeypatch.chdir(tmp_path)
+    calls = []
+
+    async def executor(params, deps):
+        calls.append(1)
+        raise Exception("400, unknown model")
+
+    params = GenerationParams(settings=MiddlemanSettings(model="primary"))
+    with pytest.raises(Exception, match="unknown model"):
+        await generate.resilient(executor)(params, {})
+    assert calls == [1]
+
+
+@pytest.mark.asyncio
+async def test_fallback_outputs_are_neither_cached_nor_shared(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    release = asyncio.Event()
+
+    async def executor(params, deps):
+        await release.wait()
+        if params.settings.model == "primary":
+            raise Exception("400, unknown model")
+        return GenerationOutput(outputs=[{"completion": "ok"}])
+
+    stack = generate.cached(generate.coalesced(generate.resilient(executor)))
+    cache = GenerationCache(tmp_path / "cache")
+    flights = Singleflight()
+    shared = {
+        "generation_cache": cache,
+        "generation_cache_policy": GenerationCachePolicy.ON,
+        "generation_flights": flights,
+    }
+    params = GenerationParams(settings=MiddlemanSettings(model="primary"))
+
+    # Only the first run falls back; the second waits for the same generation
+    fallback = asyncio.create_task(
+        stack(params, {**shared, "fallback_models": {"primary": ["secondary"]}})
+    )
+    no_fallback = asyncio.create_task(stack(params, shared))
+    while flights.stats()["coalesced"] == 0:
+        await asyncio.sleep(0.01)
+    release.set()
+
+    assert (await fallback).model == "secondary"
+    with pytest.raises(Exception, match="unknown model"):
+        await no_fallback
+    assert cache.stats()["entries"] == 0
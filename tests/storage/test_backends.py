@@ -0,0 +1,180 @@
+import pytest
+
+from flock.storage import (
+    BinaryStateBackend,
+    FileStateBackend,
+    LazyState,
+    SQLiteStateBackend,
+    binary,
+    files,
+    journal,
+)
+from flock.storage.convert import convert_state
+from flock.storage.snapshots import SnapshotEncoder
+
+
+@pytest.fixture(autouse=True)
+def states_dir(tmp_path, monkeypatch):
+    for module in (files, journal, binary):
+        monkeypatch.setattr(module, "STATES_DIR", tmp_path)
+    return tmp_path
+
+
+def make_backend(name, states_dir):
+    if name == "sqlite":
+        return SQLiteStateBackend(states_dir / "states.db")
+    if name == "binary":
+        return BinaryStateBackend()
+    return FileStateBackend()
+
+
+@pytest.fixture(params=["files", "sqlite", "binary"])
+def backend(request, states_dir):
+    return make_backend(request.param, states_dir)
+
+
+def make_state(n_nodes: int, n_results: int, offset: int = 0, **fields):
+    return {
+        "id": "run_1",
+        "nodes": [{"content": f"node {i}"} for i in range(n_nodes)],
+        "previous_results": [
+            [{"type": "bash", "i": i}] for i in range(offset, n_results)
+        ],
+        "previous_results_offset": offset,
+        **fields,
+    }
+
+
+def test_missing_state_raises_file_not_found(backend):
+    with pytest.raises(FileNotFoundError):
+        backend.load("run_1")
+
+
+def test_saves_round_trip(backend):
+    for i in range(1, 6):
+        backend.save("run_1", make_state(i, i, token_usage=i))
+    assert backend.load("run_1") == make_state(5, 5, token_usage=5)
+    assert backend.list_states() == ["run_1"]
+
+
+def test_last_item_update_and_reset(backend):
+    state = make_state(3, 3)
+    backend.save("run_1", state)
+    state["nodes"][-1]["token_usage"] = 42
+    backend.save("run_1", state)
+    assert backend.load("run_1")["nodes"][-1]["token_usage"] == 42
+
+    backend.save("run_1", make_state(0, 1))
+    assert backend.load("run_1") == make_state(0, 1)
+
+
+@pytest.mark.parametrize(
+    "rewritten",
+    [["sys", "NOTICE", "c", "d", "e", "usage2"], ["sys", "NOTICE", "b", "c", "usage2"]],
+)
+def test_rewritten_list_is_saved_in_full(backend, rewritten):
+    backend.save("run_1", {"id": "run_1", "messages": ["sys", "a", "b", "c"]})
+    backend.save("run_1", {"id": "run_1", "messages": ["sys", "a", "b", "c", "u1"]})
+    backend.save("run_1", {"id": "run_1", "messages": rewritten})
+    assert backend.load("run_1") == {"id": "run_1", "messages": rewritten}
+
+
+def test_spilled_results_are_kept_cold(backend):
+    for n in range(1, 4):
+        backend.save("run_1", make_state(n, n))
+    state = make_state(4, 4)
+    backend.spill_results("run_1", 0, state["previous_results"][:2])
+    state = make_state(4, 4, offset=2)
+    backend.save("run_1", state)
+
+    assert backend.load("run_1") == state
+    assert backend.load_cold_results("run_1") == make_state(0, 2)["previous_results"]
+
+
+def test_snapshots_are_stored(backend):
+    location = backend.save_snapshot("run_1", make_state(1, 1), "2025-01-01T00:00:00")
+    assert location
+
+
+def test_delta_snapshots_round_trip_and_thin(backend):
+    backend.snapshots = SnapshotEncoder(keyframe_interval=3, retention=4)
+    states = [make_state(n, n, token_usage=n) for n in range(1, 11)]
+    for n, state in enumerate(states):
+        backend.save_snapshot("run_1", state, f"t{n:02d}")
+
+    # Snapshots 0, 3, 6 and 9 are keyframes; the last 4 need the one at 6
+    timestamps = backend.list_snapshots("run_1")
+    assert timestamps == ["t00", "t03", "t06", "t07", "t08", "t09"]
+    for timestamp in timestamps:
+        assert backend.load_snapshot("run_1", timestamp) == states[int(timestamp[1:])]
+    with pytest.raises(FileNotFoundError):
+        backend.load_snapshot("run_1", "t05")
+
+
+def test_rewritten_list_starts_a_snapshot_chain(backend):
+    backend.snapshots = SnapshotEncoder(keyframe_interval=10, retention=10)
+    states = [
+        {"id": "run_1", "messages": ["sys", "a", "b", "c"]},
+        {"id": "run_1", "messages": ["sys", "a", "b", "c", "usage1"]},
+        {"id": "run_1", "messages": ["sys", "NOTICE", "c", "d", "e", "usage2"]},
+    ]
+    for n, state in enumerate(states):
+        backend.save_snapshot("run_1", state, f"t{n:02d}")
+
+    assert backend.snapshots.previous["run_1"][1] == 0
+    for n, state in enumerate(states):
+        assert backend.load_snapshot("run_1", f"t{n:02d}") == state
+
+
+def test_lazy_state_reads_single_sections():
+    backend = BinaryStateBackend()
+    for n in range(1, 4):
+        backend.save("run_1", make_state(n, n, token_usage=n))
+    backend.save("run_1", make_state(4, 4, offset=2, token_usage=4))
+
+    with LazyState("run_1") as state:
+        assert state.length("previous_results") == 2
+        assert state.item("previous_results", 0) == [{"type": "bash", "i": 2}]
+        assert state.item("nodes", -1) == {"content": "node 3"}
+        assert state.field("token_usage") == 4
+        with pytest.raises(IndexError):
+            state.item("previous_results", 2)
+
+
+def test_binary_appends_until_a_list_is_rewritten(states_dir):
+    BinaryStateBackend().save("run_1", {"id": "run_1", "messages": ["sys", "a"]})
+    for messages in (["sys", "a", "b"], ["sys", "a", "b", "c"]):
+        with open(states_dir / "run_1.flock", "r+b") as f:
+            assert binary.append_state(f, {"id": "run_1", "messages": messages})
+    with open(states_dir / "run_1.flock", "r+b") as f:
+        rewritten = {"id": "run_1", "messages": ["sys", "NOTICE", "c", "d"]}
+        assert not binary.append_state(f, rewritten)
+
+
+def test_binary_state_survives_a_torn_save(states_dir):
+    backend = BinaryStateBackend()
+    backend.save("run_1", make_state(2, 2))
+    with open(states_dir / "run_1.flock", "ab") as f:
+        f.write(b"partial section")
+
+    assert backend.load("run_1") == make_state(2, 2)
+    backend.save("run_1", make_state(3, 3))
+    assert backend.load("run_1") == make_state(3, 3)
+
+
+@pytest.mark.parametrize(
+    "source_name,target_name",
+    [("files", "binary"), ("binary", "sqlite"), ("sqlite", "files")],
+)
+def test_convert_state(source_name, target_name, states_dir):
+    source = make_backend(source_name, states_dir)
+    target = make_backend(target_name, states_dir)
+    state = make_state(4, 4, offset=2)
+    cold_results = make_state(0, 2)["previous_results"]
+    source.save("run_1", make_state(4, 4))
+    source.spill_results("run_1", 0, cold_results)
+    source.save("run_1", state)
+
+    convert_state("run_1", source, target)
+    assert target.load("run_1") == state
+    assert target.load_cold_results("run_1") == cold_results
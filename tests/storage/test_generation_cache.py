@@ -0,0 +1,72 @@
+import pytest
+
+from flock.storage.generation_cache import GenerationCache, cache_policy
+from flock.type_defs.operations import (
+    GenerationOutput,
+    GenerationParams,
+    MiddlemanSettings,
+)
+from flock.type_defs.processing import GenerationCachePolicy
+
+
+def params(content, temp=0.0):
+    return GenerationParams(
+        settings=MiddlemanSettings(model="gpt-4o-mini", n=1, temp=temp),
+        messages=[{"role": "user", "content": content}],
+    )
+
+
+def output(completion):
+    return GenerationOutput(
+        outputs=[{"completion": completion}], n_prompt_tokens_spent=10
+    )
+
+
+@pytest.mark.asyncio
+async def test_outputs_are_served_by_params_and_evicted_least_recent_first(tmp_path):
+    cache = GenerationCache(tmp_path, max_bytes=10_000)
+    await cache.open()
+    policy = GenerationCachePolicy.ON
+
+    assert await cache.get(params("a"), policy) is None
+    await cache.put(params("a"), output("A"), policy)
+    cache.max_bytes = 2 * cache.stats()["bytes"]
+    await cache.put(params("b"), output("B"), policy)
+    assert await cache.get(params("a"), policy) == output("A")
+    # "b" is now the least recently used
+    await cache.put(params("c"), output("C"), policy)
+
+    assert await cache.get(params("b"), policy) is None
+    assert await cache.get(params("c"), policy) == output("C")
+    # The recency order survives a restart
+    reopened = GenerationCache(tmp_path, max_bytes=cache.max_bytes)
+    await reopened.open()
+    assert list(reopened.entries) == list(cache.entries)
+    assert cache.stats() | {"max_bytes": 0} == {
+        "hits": 2,
+        "misses": 2,
+        "bypassed": 0,
+        "evictions": 1,
+        "entries": 2,
+        "bytes": cache.size,
+        "max_bytes": 0,
+    }
+
+
+@pytest.mark.asyncio
+async def test_policies_bypass_the_cache(tmp_path):
+    cache = GenerationCache(tmp_path)
+    await cache.open()
+    await cache.put(
+        params("a", temp=1.0), output("A"), GenerationCachePolicy.DETERMINISTIC
+    )
+    await cache.put(params("a", temp=1.0), output("A"), GenerationCachePolicy.REFRESH)
+
+    assert await cache.get(params("a", temp=1.0), GenerationCachePolicy.REFRESH) is None
+    assert await cache.get(params("a", temp=1.0), GenerationCachePolicy.ON) == output(
+        "A"
+    )
+    assert cache_policy({"generation_cache": "deterministic"}) == (
+        GenerationCachePolicy.DETERMINISTIC
+    )
+    assert cache_policy(None) == GenerationCachePolicy.OFF
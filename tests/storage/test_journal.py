@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+from flock.storage import journal
+
+
+@pytest.fixture(autouse=True)
+def states_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(journal, "STATES_DIR", tmp_path)
+    return tmp_path
+
+
+def make_state(n_nodes: int, n_results: int, **fields):
+    return {
+        "id": "run_1",
+        "nodes": [{"source": "actor", "content": f"node {i}"} for i in range(n_nodes)],
+        "previous_results": [[{"type": "bash", "i": i}] for i in range(n_results)],
+        **fields,
+    }
+
+
+def journal_lines(state_id: str = "run_1"):
+    return journal.journal_path(state_id).read_text().splitlines()
+
+
+def test_saves_are_appended_and_replayed():
+    journal.append_state("run_1", make_state(1, 1, token_usage=1))
+    for i in range(2, 6):
+        journal.append_state("run_1", make_state(i, i, token_usage=i))
+
+    assert len(journal_lines()) == 5
+    entry = json.loads(journal_lines()[-1])
+    # Only the mutable tail and the new items are written
+    assert entry["lists"]["nodes"][0] == 4 - journal.JOURNAL_MUTABLE_TAIL
+    assert len(entry["lists"]["nodes"][1]) == 1 + journal.JOURNAL_MUTABLE_TAIL
+    assert entry["fields"] == {"token_usage": 5}
+    assert journal.read_state("run_1") == make_state(5, 5, token_usage=5)
+
+
+def test_last_item_can_be_updated_in_place():
+    state = make_state(3, 1)
+    journal.append_state("run_1", state)
+    state["nodes"][-1]["token_usage"] = 42
+    journal.append_state("run_1", state)
+    assert journal.read_state("run_1")["nodes"][-1]["token_usage"] == 42
+
+
+def test_shrinking_list_rewrites_checkpoint():
+    journal.append_state("run_1", make_state(4, 4))
+    journal.append_state("run_1", make_state(5, 5))
+    journal.append_state("run_1", make_state(0, 1))
+
+    assert len(journal_lines()) == 1
+    assert json.loads(journal_lines()[0])["checkpoint"]
+    assert journal.read_state("run_1") == make_state(0, 1)
+
+
+@pytest.mark.parametrize(
+    "rewritten",
+    [
+        ["sys", "NOTICE", "c", "d", "e", "usage2"],
+        ["sys", "NOTICE", "c", "usage2", "f"],
+        ["sys", "NOTICE", "b", "c", "usage2"],
+    ],
+)
+def test_rewritten_prefix_rewrites_checkpoint(rewritten):
+    journal.append_state("run_1", {"id": "run_1", "messages": ["sys", "a", "b", "c"]})
+    journal.append_state(
+        "run_1", {"id": "run_1", "messages": ["sys", "a", "b", "c", "usage1"]}
+    )
+    journal.append_state("run_1", {"id": "run_1", "messages": rewritten})
+
+    assert len(journal_lines()) == 1
+    assert journal.read_state("run_1") == {"id": "run_1", "messages": rewritten}
+
+
+def test_removed_fields_are_replayed():
+    journal.append_state("run_1", make_state(1, 1, extra="x"))
+    journal.append_state("run_1", make_state(2, 1))
+    assert journal.read_state("run_1") == make_state(2, 1)
+
+
+def test_journal_is_compacted_once_larger_than_checkpoint(monkeypatch):
+    monkeypatch.setattr(journal, "JOURNAL_MIN_COMPACT_BYTES", 0)
+    journal.append_state("run_1", make_state(1, 1))
+    compactions = 0
+    for i in range(2, 50):
+        journal.append_state("run_1", make_state(i, i))
+        # Right after a compaction the journal only holds the summary line
+        if len(journal_lines()) == 1:
+            compactions += 1
+            continue
+        assert (
+            journal.journal_path("run_1").stat().st_size
+            <= journal.checkpoint_path("run_1").stat().st_size
+        )
+    assert compactions > 1
+    assert journal.read_state("run_1") == make_state(49, 49)
+
+
+def test_truncated_last_line_is_ignored():
+    journal.append_state("run_1", make_state(1, 1))
+    journal.append_state("run_1", make_state(2, 2))
+    with open(journal.journal_path("run_1"), "a") as f:
+        f.write('{"lists": {"nodes": [0, [')
+    assert journal.read_state("run_1") == make_state(2, 2)
+
+    journal.append_state("run_1", make_state(3, 3))
+    assert journal.read_state("run_1") == make_state(3, 3)
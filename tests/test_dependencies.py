@@ -0,0 +1,40 @@
+import pytest
+
+from flock import dependencies as dependencies_module
+from flock.dependencies import Dependencies
+from flock.type_defs import ProcessingMode
+
+
+@pytest.mark.asyncio
+async def test_clients_and_credentials_are_built_once(monkeypatch):
+    lookups = []
+
+    def get_credentials():
+        lookups.append(1)
+        return "http://middleman", "key"
+
+    monkeypatch.setattr(dependencies_module, "get_credentials", get_credentials)
+    container = Dependencies(ProcessingMode.MIDDLEMAN_SIMULATED)
+    await container.start()
+
+    first = await container.for_batch("run_1")
+    second = await container.for_batch(None)
+
+    assert first["simulator"] is second["simulator"]
+    assert (first["state_id"], second["state_id"]) == ("run_1", "unknown")
+    assert len(lookups) == 1
+
+
+@pytest.mark.asyncio
+async def test_middleman_calls_share_one_session_until_closed(monkeypatch):
+    monkeypatch.setattr(
+        dependencies_module, "get_credentials", lambda: ("http://middleman", "key")
+    )
+    container = Dependencies(ProcessingMode.MIDDLEMAN_SIMULATED)
+    dependencies = await container.for_batch("run_1")
+    session = container.sessions["middleman"]
+
+    assert dependencies["simulator"]["session"] is session
+    await container.close()
+    assert session.closed
+    assert container.sessions == {}
@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from flock.middleman_client import stream_completion
+from flock.type_defs.operations import GenerationStreamOptions
+
+
+async def serve_chunks(chunks, sent):
+    async def completions(request):
+        response = web.StreamResponse()
+        await response.prepare(request)
+        try:
+            for chunk in chunks:
+                await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                sent.append(chunk)
+                await asyncio.sleep(0.01)
+            await response.write(b"data: [DONE]\n\n")
+        except ConnectionResetError:
+            pass
+        return response
+
+    app = web.Application()
+    app.router.add_post("/completions", completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def call_delta(name="", arguments=""):
+    return {"outputs": [{"function_call": {"name": name, "arguments": arguments}}]}
+
+
+@pytest.mark.asyncio
+async def test_stream_stops_after_a_complete_function_call():
+    chunks = [
+        {"outputs": [{"completion": "Let me "}], "n_prompt_tokens_spent": 7},
+        {"outputs": [{"completion": "look."}]},
+        call_delta("bash", '{"command": '),
+        call_delta(arguments='"ls"}'),
+        {"outputs": [{"completion": " More text nobody reads"}]},
+        {"n_completion_tokens_spent": 40},
+    ]
+    sent = []
+    runner, base_url = await serve_chunks(chunks, sent)
+    options = GenerationStreamOptions(stop_after_function_call=True)
+    try:
+        async with aiohttp.ClientSession() as session:
+            result = await stream_completion(session, base_url, {"n": 1}, options)
+    finally:
+        await runner.cleanup()
+
+    assert result["outputs"] == [
+        {
+            "completion": "Let me look.",
+            "function_call": {"name": "bash", "arguments": '{"command": "ls"}'},
+            "stop_reason": "function_call",
+        }
+    ]
+    assert result["time_to_first_token_ms"] is not None
+    assert len(sent) < len(chunks)
+    # The usage of a stream cut short is unknown, not partial
+    assert "n_prompt_tokens_spent" not in result
+
+
+@pytest.mark.asyncio
+async def test_stream_reads_to_the_end_without_a_stop_condition():
+    chunks = [
+        {"outputs": [{"completion": "a", "completion_index": 1}]},
+        {"outputs": [{"completion": "b", "stop_reason": "length"}]},
+        {"n_prompt_tokens_spent": 7},
+    ]
+    sent = []
+    runner, base_url = await serve_chunks(chunks, sent)
+    options = GenerationStreamOptions(max_completion_chars=10)
+    try:
+        async with aiohttp.ClientSession() as session:
+            result = await stream_completion(session, base_url, {"n": 2}, options)
+    finally:
+        await runner.cleanup()
+
+    assert [o["completion"] for o in result["outputs"]] == ["b", "a"]
+    assert [o["stop_reason"] for o in result["outputs"]] == ["length", "stop"]
+    assert result["n_prompt_tokens_spent"] == 7
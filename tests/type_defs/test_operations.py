@@ -0,0 +1,40 @@
+import pytest
+
+from flock.handlers.base import validate_untyped_requests
+from flock.type_defs.operations import (
+    OPERATION_RESULT_ADAPTER,
+    ReadMessagesRequest,
+    SaveStateRequest,
+    SaveStateResult,
+)
+
+
+def test_requests_are_dispatched_on_type():
+    requests = validate_untyped_requests(
+        [
+            {"type": "read_messages", "params": {"agent_id": "a"}},
+            {
+                "type": "save_state",
+                "params": {"state_id": "run_1", "state": {}, "timestamp": ""},
+            },
+        ]
+    )
+    assert [type(request) for request in requests] == [
+        ReadMessagesRequest,
+        SaveStateRequest,
+    ]
+
+
+def test_unknown_request_type_is_rejected():
+    with pytest.raises(ValueError):
+        validate_untyped_requests([{"type": "unknown", "params": {}}])
+
+
+def test_results_are_dispatched_on_type():
+    result = OPERATION_RESULT_ADAPTER.validate_python(
+        {
+            "type": "save_state",
+            "result": {"status": "success", "message": "", "snapshot_path": ""},
+        }
+    )
+    assert isinstance(result, SaveStateResult)
@@ -0,0 +1,67 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from flock.utils.resilience import LatencyTracker, hedged, is_retryable
+
+
+def test_retryable_errors():
+    assert is_retryable(Exception("429, rate limited"))
+    assert is_retryable(Exception("HTTP 503: unavailable"))
+    assert is_retryable(asyncio.TimeoutError())
+    assert is_retryable(aiohttp.ClientConnectionError("reset"))
+    assert not is_retryable(Exception("400, invalid model"))
+
+
+def test_latency_percentile_needs_enough_samples():
+    latencies = LatencyTracker(window=100, min_samples=10)
+    for i in range(9):
+        latencies.record("m", i)
+    assert latencies.percentile("m", 95) is None
+    for i in range(9, 100):
+        latencies.record("m", i)
+    assert latencies.percentile("m", 95) == 95
+
+
+@pytest.mark.asyncio
+async def test_slow_call_is_hedged_and_the_first_success_wins():
+    delays = [1.0, 0.01]
+    cancelled = []
+    hedges = []
+
+    async def call():
+        delay = delays.pop(0)
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled.append(delay)
+            raise
+        return delay
+
+    assert await hedged(call, 0.01, on_hedge=lambda: hedges.append(1)) == 0.01
+    await asyncio.sleep(0)
+    assert cancelled == [1.0]
+    assert hedges == [1]
+    # Calls finishing before the delay are not hedged
+    delays = [0.0]
+    assert await hedged(call, 0.5) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_cancelling_the_caller_before_the_hedge_cancels_the_call():
+    cancelled = asyncio.Event()
+
+    async def call():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    caller = asyncio.create_task(hedged(call, 5))
+    await asyncio.sleep(0.01)
+    caller.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await caller
+    await asyncio.wait_for(cancelled.wait(), 1)
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from flock.utils.scheduler import FairLimiter, RateLimiter
+
+
+@pytest.mark.asyncio
+async def test_fair_limiter_serves_runs_round_robin():
+    limiter = FairLimiter(1)
+    order = []
+    release = asyncio.Event()
+
+    async def task(run: str, index: int) -> None:
+        async with limiter.slot(run):
+            order.append((run, index))
+            await release.wait()
+
+    holder = asyncio.create_task(task("a", 0))
+    await asyncio.sleep(0)
+    # Run "a" queues three tasks before run "b" queues any
+    waiters = [asyncio.create_task(task("a", i)) for i in range(1, 4)]
+    waiters += [asyncio.create_task(task("b", i)) for i in range(2)]
+    await asyncio.sleep(0)
+    assert limiter.stats()["waiting"] == {"a": 3, "b": 2}
+
+    release.set()
+    await asyncio.gather(holder, *waiters)
+    assert order == [("a", 0), ("a", 1), ("b", 0), ("a", 2), ("b", 1), ("a", 3)]
+    assert limiter.stats() == {"limit": 1, "active": 0, "waiting": {}}
+
+
+@pytest.mark.asyncio
+async def test_fair_limiter_cancelled_waiter_frees_its_place():
+    limiter = FairLimiter(1)
+    await limiter.acquire("a")
+    waiter = asyncio.create_task(limiter.acquire("b"))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert limiter.stats()["waiting"] == {}
+
+    limiter.release()
+    assert limiter.active == 0
+
+
+@pytest.mark.asyncio
+async def test_fair_limiter_without_limit_never_waits():
+    limiter = FairLimiter()
+    results = await asyncio.gather(
+        *[limiter.run("a", asyncio.sleep(0, i)) for i in range(5)]
+    )
+    assert results == list(range(5))
+    assert limiter.active == 0
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_admits_waiting_calls_by_priority():
+    limiter = RateLimiter({"*": {"requests_per_minute": 6000}})
+    bucket = limiter.model_buckets("m")[0]
+    bucket.available = 0
+    order = []
+
+    async def call(name, priority):
+        await limiter.acquire("m", 100, priority)
+        order.append(name)
+
+    tasks = [asyncio.create_task(call("rater", 1))]
+    await asyncio.sleep(0)
+    tasks += [asyncio.create_task(call(name, 0)) for name in ("actor_1", "actor_2")]
+    await asyncio.sleep(0)
+    assert limiter.stats()["m"]["waiting_by_priority"] == {0: 2, 1: 1}
+
+    await asyncio.gather(*tasks)
+    assert order == ["actor_1", "actor_2", "rater"]
+    assert limiter.stats()["m"]["admitted"] == 3
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_keeps_token_usage_under_the_budget():
+    limiter = RateLimiter({"big": {"tokens_per_minute": 60_000}})
+    await limiter.acquire("big", 50_000, 0)
+    # The call used more than estimated
+    limiter.settle("big", 50_000, 60_000)
+    await limiter.acquire("other", 10**9, 0)
+
+    tokens = limiter.model_buckets("big")[1]
+    assert tokens.wait_time(1_000) == pytest.approx(1.0, abs=0.05)
+    assert limiter.model_buckets("other") is None
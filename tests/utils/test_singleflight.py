@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from flock.utils.singleflight import Singleflight
+
+
+@pytest.mark.asyncio
+async def test_identical_calls_in_flight_share_one_call():
+    flights = Singleflight()
+    release = asyncio.Event()
+    calls = []
+
+    async def call(value):
+        calls.append(value)
+        await release.wait()
+        return value
+
+    first = asyncio.create_task(flights.run("a", lambda: call(1)))
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(flights.run("a", lambda: call(2))) for _ in range(2)]
+    other = asyncio.create_task(flights.run("b", lambda: call(3)))
+    await asyncio.sleep(0)
+    assert flights.stats() == {"calls": 2, "coalesced": 2, "in_flight": 2}
+
+    release.set()
+    assert await first == (1, False)
+    assert [await waiter for waiter in waiters] == [(1, True), (1, True)]
+    assert await other == (3, False)
+    assert calls == [1, 3]
+    # Later calls are not served the earlier result
+    assert await flights.run("a", lambda: call(4)) == (4, False)
+
+
+@pytest.mark.asyncio
+async def test_waiters_share_the_error_of_the_call():
+    flights = Singleflight()
+    release = asyncio.Event()
+
+    async def fail():
+        await release.wait()
+        raise RuntimeError("upstream down")
+
+    first = asyncio.create_task(flights.run("a", fail))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(flights.run("a", fail))
+    await asyncio.sleep(0)
+    release.set()
+
+    for task in (first, waiter):
+        with pytest.raises(RuntimeError, match="upstream down"):
+            await task
+    assert flights.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_waiters_of_a_cancelled_call_make_it_again():
+    flights = Singleflight()
+    release = asyncio.Event()
+    calls = []
+
+    async def call(value):
+        calls.append(value)
+        await release.wait()
+        return value
+
+    first = asyncio.create_task(flights.run("a", lambda: call(1)))
+    await asyncio.sleep(0)
+    waiters = [
+        asyncio.create_task(flights.run("a", lambda value=value: call(value)))
+        for value in (2, 3)
+    ]
+    await asyncio.sleep(0)
+    first.cancel()
+    for _ in range(3):
+        await asyncio.sleep(0)
+    release.set()
+
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    # The first waiter to start over makes the call and shares it
+    assert [await waiter for waiter in waiters] == [(2, False), (2, True)]
+    assert calls == [1, 2]
+    assert flights.stats() == {"calls": 2, "coalesced": 3, "in_flight": 0}
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+
+from flock.storage import files, journal
+from flock.type_defs import ProcessingMode
+from flock.utils import transport
+from flock.utils.state import load_state
+from flock.utils.transport import FRAME_HEADER, post_workflow_frame, read_frame
+from flock.workflows.handlers import frame_workflow_handler
+from flock.workflows.runtime import WorkflowRuntime
+
+
+@pytest_asyncio.fixture
+async def frame_server(tmp_path):
+    runtime = WorkflowRuntime(mode=ProcessingMode.MIDDLEMAN_SIMULATED)
+    socket_path = tmp_path / "flock.sock"
+    server = await asyncio.start_unix_server(
+        lambda reader, writer: frame_workflow_handler(reader, writer, runtime),
+        path=str(socket_path),
+    )
+    yield socket_path
+    server.close()
+    await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_workflow_request_round_trips_over_frames(
+    frame_server, tmp_path, monkeypatch
+):
+    monkeypatch.setattr(files, "STATES_DIR", tmp_path)
+    monkeypatch.setattr(journal, "STATES_DIR", tmp_path)
+    state = {"id": "run_1", "token_usage": 3}
+    data = {
+        "state_id": "run_1",
+        "operations": [],
+        "current_phase": "advisor",
+        "next_phase": None,
+        "state": state,
+    }
+
+    status, body = await post_workflow_frame(frame_server, data)
+
+    assert status == 200
+    assert body == {"updates": [], "next_phase": None, "error": None, "delay": 0}
+    assert load_state("run_1") == state
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "frame, status",
+    [(FRAME_HEADER.pack(11) + b"not json ok", 400), (FRAME_HEADER.pack(1024), 413)],
+)
+async def test_unreadable_frame_is_answered_before_closing(
+    frame_server, monkeypatch, frame, status
+):
+    monkeypatch.setattr(transport, "MAX_FRAME_SIZE", 512)
+    reader, writer = await asyncio.open_unix_connection(str(frame_server))
+    writer.write(frame)
+    await writer.drain()
+
+    response = await read_frame(reader)
+    assert response["status"] == status
+    assert "error" in response["body"]
+    assert await reader.read() == b""
+    writer.close()
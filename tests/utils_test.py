@@ -3,8 +3,35 @@ import json
 
 import pytest
 
+from flock.storage import BinaryStateBackend, binary, files, journal
+from flock.type_defs.operations import (
+    SaveStateOutput,
+    SaveStateParams,
+    SaveStateRequest,
+    SaveStateResult,
+)
+from flock.type_defs.phases import StateRequest
+from flock.type_defs.states import triframeState
+from flock.utils import state as state_utils
 from flock.utils.functions import parse_completions_function_call
-from flock.utils.state import trim_state
+from flock.utils.phase_utils import (
+    build_state,
+    build_workflow_data,
+    describe_updates,
+    dump_json,
+    dump_state,
+    dump_workflow_data,
+    get_previous_results,
+    validate_latest_results,
+)
+from flock.utils.state import (
+    load_cold_results,
+    load_phase_state,
+    load_state,
+    save_state,
+    spill_previous_results,
+    trim_state,
+)
 
 
 @pytest.mark.parametrize(
@@ -196,3 +223,128 @@ def test_trim_state(original_state: dict[str, any]):
     assert len(json.dumps(trimmed_state)) < 1_000_000, (
         "trimmed state is still too large"
     )
+
+
+def test_spill_previous_results_keeps_window(tmp_path, monkeypatch):
+    monkeypatch.setattr(files, "STATES_DIR", tmp_path)
+    monkeypatch.setattr(journal, "STATES_DIR", tmp_path)
+    batches = [[{"type": "get_usage", "batch": i}] for i in range(10)]
+    save_state("run_1", {"id": "run_1", "nodes": [], "previous_results": []})
+
+    for batch in batches:
+        run_state = load_state("run_1")
+        run_state["previous_results"].append(batch)
+        spill_previous_results("run_1", run_state, window=3)
+        save_state("run_1", run_state)
+
+    saved = load_state("run_1")
+    assert saved["previous_results"] == batches[-3:]
+    assert saved["previous_results_offset"] == 7
+    assert load_cold_results("run_1") + saved["previous_results"] == batches
+
+
+def test_handed_off_updates_drop_request_params():
+    request = SaveStateRequest(
+        type="save_state",
+        params=SaveStateParams(
+            state_id="run_1", state={"nodes": ["x" * 10_000]}, timestamp=""
+        ),
+    )
+    result = SaveStateResult(
+        type="save_state",
+        result=SaveStateOutput(status="success", message="", snapshot_path="a"),
+    )
+    previous_operations = dump_json({"updates": describe_updates([(request, result)])})
+
+    assert len(previous_operations) < 1_000
+    latest_results = validate_latest_results(previous_operations)
+    assert latest_results == [result.model_dump()]
+    # Updates carrying full requests are still accepted
+    full_updates = dump_json({"updates": [(request, result)]})
+    assert validate_latest_results(full_updates) == latest_results
+    with pytest.raises(ValueError, match="missing 'updates'"):
+        validate_latest_results(b"{}")
+
+
+def test_trim_state_only_trims_items_after_the_watermark():
+    def batch(text):
+        return [{"type": "bash", "result": {"stdout": text, "stderr": ""}}]
+
+    state = {"nodes": [], "previous_results": [batch("a" * 100), batch("a" * 100)]}
+    trim_state(state, 10)
+    assert state["trimmed_results"] == 2
+    assert len(state["previous_results"][0][0]["result"]["stdout"]) < 100
+
+    # Items before the mutable tail are not measured again
+    state["previous_results"][0] = batch("b" * 100)
+    state["previous_results"] += [batch("c" * 100), batch("d" * 100)]
+    trim_state(state, 10)
+    stdouts = [results[0]["result"]["stdout"] for results in state["previous_results"]]
+    assert stdouts[0] == "b" * 100
+    assert all(len(stdout) < 100 for stdout in stdouts[1:])
+    assert state["trimmed_results"] == 4
+
+
+def test_unread_result_batches_are_passed_through():
+    batches = [
+        [
+            SaveStateResult(
+                type="save_state",
+                result=SaveStateOutput(
+                    status="success", message="", snapshot_path=str(i)
+                ),
+            ).model_dump()
+        ]
+        for i in range(5)
+    ]
+    state_dict = {"id": "run_1", "previous_results": batches}
+
+    state = build_state(triframeState, state_dict)
+    assert len(state.previous_results) == 2
+    assert get_previous_results(state, -1)[0].result.snapshot_path == "4"
+    assert get_previous_results(state, 1)[0].result.snapshot_path == "1"
+
+    req = StateRequest(state=state, state_model="x", operations=[])
+    assert dump_state(req.state)["previous_results"] == batches
+
+
+def test_phase_state_decodes_only_read_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(binary, "STATES_DIR", tmp_path)
+    monkeypatch.setattr(journal, "STATES_DIR", tmp_path)
+    batches = [
+        [{"type": "bash", "result": {"stdout": str(i), "stderr": ""}}] for i in range(5)
+    ]
+    backend = BinaryStateBackend()
+    backend.save("run_1", {"id": "run_1", "nodes": [], "previous_results": batches})
+    monkeypatch.setattr(state_utils, "get_state_backend", lambda: backend)
+
+    state_dict = load_phase_state("run_1")
+    state = build_state(triframeState, state_dict)
+    unvalidated = state._unvalidated_results
+    assert len(unvalidated) == 3
+    assert all(isinstance(entry, binary.Encoded) for entry in unvalidated.entries)
+    assert get_previous_results(state, 1)[0].result.stdout == "1"
+    assert dump_state(state)["previous_results"][:3] == batches[:3]
+
+
+def test_unread_batches_are_sent_as_stored(tmp_path, monkeypatch):
+    monkeypatch.setattr(binary, "STATES_DIR", tmp_path)
+    monkeypatch.setattr(journal, "STATES_DIR", tmp_path)
+    # Large enough for the first batch to be stored compressed
+    batches = [
+        [{"type": "bash", "result": {"stdout": str(i) * 2000, "stderr": ""}}]
+        for i in range(5)
+    ]
+    backend = BinaryStateBackend()
+    backend.save("run_1", {"id": "run_1", "nodes": [], "previous_results": batches})
+    monkeypatch.setattr(state_utils, "get_state_backend", lambda: backend)
+    state = build_state(triframeState, load_phase_state("run_1"))
+    req = StateRequest(state=state, state_model="x", operations=[])
+
+    payload = dump_workflow_data(build_workflow_data(req, "actor", encoded=True))
+
+    assert all(
+        isinstance(entry, binary.Encoded)
+        for entry in state._unvalidated_results.entries
+    )
+    assert json.loads(payload)["state"] == json.loads(dump_json(dump_state(state)))
@@ -0,0 +1,39 @@
+from typing import List
+
+import pytest
+
+from flock.storage import files, journal
+from flock.type_defs import PhaseRunner, ProcessingMode
+from flock.type_defs.phases import StateRequest
+from flock.type_defs.states import AgentState
+from flock.utils.state import load_state, save_state
+from flock.workflows import executor
+from flock.workflows.executor import execute_phase
+from flock.workflows.runtime import WorkflowRuntime
+
+
+def count_phase(state: AgentState) -> List[StateRequest]:
+    state.actions_usage += 1
+    return [StateRequest(state=state, state_model="AgentState", operations=[])]
+
+
+@pytest.mark.asyncio
+async def test_in_process_runner_dispatches_state_requests(tmp_path, monkeypatch):
+    monkeypatch.setattr(files, "STATES_DIR", tmp_path)
+    monkeypatch.setattr(journal, "STATES_DIR", tmp_path)
+    monkeypatch.setattr(
+        executor, "load_phase", lambda phase_name: ("count", count_phase, AgentState)
+    )
+    save_state("run_1", AgentState(id="run_1").model_dump())
+    runtime = WorkflowRuntime(
+        mode=ProcessingMode.MIDDLEMAN_SIMULATED, runner=PhaseRunner.IN_PROCESS
+    )
+
+    await execute_phase("count.py", "run_1", b'{"updates": []}', runtime)
+
+    # The request was handled by the server without a phase process
+    state = load_state("run_1")
+    assert state["actions_usage"] == 1
+    assert state["previous_results"] == [[]]
+    assert runtime.runs.get("run_1").phases_run == 1
+    assert not runtime.failed("run_1")
@@ -0,0 +1,130 @@
+import asyncio
+import sys
+
+import pytest
+
+from flock import dependencies as dependencies_module
+from flock.handlers import handler_registry
+from flock.handlers.base import create_handler
+from flock.storage import files, journal
+from flock.type_defs import ProcessingMode
+from flock.type_defs.operations import LogOutput
+from flock.utils.scheduler import FairLimiter
+from flock.utils.state import load_state
+from flock.workflows import executor, handlers
+from flock.workflows.handlers import dispatch_workflow, handle_workflow
+from flock.workflows.runtime import WorkflowRuntime
+
+
+@pytest.mark.asyncio
+async def test_state_sent_with_the_request_is_saved(tmp_path, monkeypatch):
+    monkeypatch.setattr(files, "STATES_DIR", tmp_path)
+    monkeypatch.setattr(journal, "STATES_DIR", tmp_path)
+    state = {"id": "run_1", "token_usage": 3}
+    data = {
+        "state_id": "run_1",
+        "operations": [],
+        "current_phase": "advisor",
+        "next_phase": "actor",
+        "delay": 0,
+        "state": state,
+    }
+
+    result = await handle_workflow(data, ProcessingMode.MIDDLEMAN_SIMULATED)
+
+    assert result["next_phase"] == "actor"
+    assert load_state("run_1") == state
+
+
+@pytest.fixture
+def spawned(monkeypatch):
+    """Phase interpreters started by the executor, as sleeping processes"""
+    processes = []
+
+    async def spawn_phase_process(phase_name, state_id, runtime):
+        proc = await asyncio.create_subprocess_exec(
+            sys.executable, "-c", "import time; time.sleep(60)"
+        )
+        processes.append(proc)
+        return proc
+
+    monkeypatch.setattr(executor, "spawn_phase_process", spawn_phase_process)
+    return processes
+
+
+def prespawning_runtime(limit):
+    return WorkflowRuntime(
+        mode=ProcessingMode.MIDDLEMAN_SIMULATED,
+        prespawn_phases=True,
+        phase_limiter=FairLimiter(limit),
+    )
+
+
+@pytest.mark.asyncio
+async def test_prespawned_phase_is_killed_when_operations_fail(monkeypatch, spawned):
+    async def process_workflow(*args):
+        raise RuntimeError("operations failed")
+
+    monkeypatch.setattr(handlers, "process_workflow", process_workflow)
+    runtime = prespawning_runtime(1)
+    data = {"state_id": "run_1", "current_phase": "advisor", "next_phase": "actor"}
+
+    with pytest.raises(RuntimeError):
+        await dispatch_workflow(data, runtime)
+
+    assert len(spawned) == 1
+    assert spawned[0].returncode is not None
+    assert runtime.phase_limiter.active == 0
+
+
+@pytest.mark.asyncio
+async def test_phase_is_not_prespawned_without_a_free_slot(monkeypatch, spawned):
+    async def process_workflow(*args):
+        return {"updates": [], "next_phase": None}, None
+
+    monkeypatch.setattr(handlers, "process_workflow", process_workflow)
+    runtime = prespawning_runtime(1)
+    assert runtime.phase_limiter.try_acquire()
+    data = {"state_id": "run_1", "current_phase": "advisor", "next_phase": "actor"}
+
+    await dispatch_workflow(data, runtime)
+
+    assert spawned == []
+    assert runtime.phase_limiter.active == 1
+
+
+@pytest.mark.asyncio
+async def test_failing_operation_only_fails_its_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(files, "STATES_DIR", tmp_path)
+    monkeypatch.setattr(journal, "STATES_DIR", tmp_path)
+    monkeypatch.setattr(
+        dependencies_module, "get_credentials", lambda: ("http://middleman", "key")
+    )
+
+    async def log(params, deps):
+        await asyncio.sleep(0.01)
+        if params.content == "boom":
+            raise RuntimeError("upstream down")
+        return LogOutput(status="success", message="", timestamp="")
+
+    mode = ProcessingMode.MIDDLEMAN_SIMULATED
+    monkeypatch.setitem(handler_registry["log"], mode, create_handler("log", log))
+    runtime = WorkflowRuntime(mode=mode, isolate_run_failures=True)
+
+    def request(state_id, content):
+        return {
+            "state_id": state_id,
+            "operations": [{"type": "log", "params": {"content": content}}],
+            "current_phase": "advisor",
+            "next_phase": None,
+            "state": {"id": state_id},
+        }
+
+    (_, failed), (_, ok) = await asyncio.gather(
+        dispatch_workflow(request("run_1", "boom"), runtime),
+        dispatch_workflow(request("run_2", "fine"), runtime),
+    )
+
+    assert "upstream down" in failed and ok is None
+    assert runtime.failed("run_1") and not runtime.failed("run_2")
+    assert not runtime.event.is_set()
@@ -0,0 +1,102 @@
+import asyncio
+import json
+
+import pytest
+
+from flock.storage import files, journal
+from flock.type_defs import ProcessingMode
+from flock.utils.state import load_state
+from flock.workflows import handlers, handoff
+from flock.workflows.handlers import resume_pending_workflows
+from flock.workflows.handoff import enqueue_workflow, pending_workflows
+from flock.workflows.runtime import WorkflowRuntime
+
+
+@pytest.fixture(autouse=True)
+def states_dir(tmp_path, monkeypatch):
+    for module in (files, journal, handoff):
+        monkeypatch.setattr(module, "STATES_DIR", tmp_path)
+    return tmp_path
+
+
+@pytest.mark.asyncio
+async def test_queued_request_refers_to_the_saved_state():
+    state = {"id": "run_1", "token_usage": 3}
+    data = {
+        "state_id": "run_1",
+        "operations": [],
+        "next_phase": "actor",
+        "state": state,
+    }
+
+    path, queued = await enqueue_workflow(data)
+
+    assert "state" not in queued and "state" in data
+    assert json.loads(path.read_text()) == queued
+    assert pending_workflows() == [(path, queued)]
+    assert load_state("run_1") == state
+
+
+@pytest.mark.asyncio
+async def test_pending_request_is_resumed_at_startup():
+    state = {"id": "run_1", "token_usage": 3}
+    data = {"state_id": "run_1", "operations": [], "next_phase": None, "state": state}
+    path, _ = await enqueue_workflow(data)
+    runtime = WorkflowRuntime(mode=ProcessingMode.MIDDLEMAN_SIMULATED)
+
+    assert resume_pending_workflows(runtime) == 1
+    assert runtime.runs.get("run_1").active == 1
+    resumed = [t for t in asyncio.all_tasks() if t.get_name().startswith("workflow_")]
+    await asyncio.gather(*resumed)
+
+    assert not path.exists()
+    assert pending_workflows() == []
+    assert runtime.runs.get("run_1").active == 0
+    assert not runtime.failed("run_1")
+
+
+@pytest.mark.asyncio
+async def test_request_killing_its_task_is_marked_failed(monkeypatch):
+    class Crash(BaseException):
+        pass
+
+    async def crash(data, runtime):
+        raise Crash("worker died")
+
+    monkeypatch.setattr(handlers, "dispatch_workflow", crash)
+    data = {"state_id": "run_1", "operations": [], "next_phase": None}
+    path, _ = await enqueue_workflow(data)
+    runtime = WorkflowRuntime(
+        mode=ProcessingMode.MIDDLEMAN_SIMULATED, isolate_run_failures=True
+    )
+
+    assert resume_pending_workflows(runtime) == 1
+    resumed = [t for t in asyncio.all_tasks() if t.get_name().startswith("workflow_")]
+    await asyncio.gather(*resumed)
+
+    assert not path.exists() and path.with_suffix(".failed").exists()
+    assert runtime.failed("run_1")
+    assert runtime.runs.get("run_1").active == 0
+
+
+@pytest.mark.asyncio
+async def test_request_is_given_up_after_its_resume_attempts(monkeypatch):
+    monkeypatch.setattr(handlers, "WORKFLOW_RESUME_ATTEMPTS", 2)
+    data = {"state_id": "run_1", "operations": [], "next_phase": None}
+    path, _ = await enqueue_workflow(data)
+    runtime = WorkflowRuntime(
+        mode=ProcessingMode.MIDDLEMAN_SIMULATED, isolate_run_failures=True
+    )
+
+    # Each server that resumed the request died before completing it
+    for attempt in (1, 2):
+        assert resume_pending_workflows(runtime) == 1
+        tasks = [t for t in asyncio.all_tasks() if t.get_name().startswith("workflow_")]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        assert json.loads(path.read_text())["resume_attempts"] == attempt
+
+    assert resume_pending_workflows(runtime) == 0
+    assert not path.exists() and path.with_suffix(".failed").exists()
+    assert runtime.failed("run_1")
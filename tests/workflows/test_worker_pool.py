@@ -0,0 +1,40 @@
+import pytest
+
+from flock.storage import files, journal
+from flock.type_defs.states import triframeState
+from flock.utils.state import save_state
+from flock.workflows.worker_pool import PhaseWorkerPool
+
+
+@pytest.fixture
+def state_id(tmp_path, monkeypatch):
+    # Workers are forked from a server-wide process started with the pool, so
+    # they take the states directory from the environment
+    monkeypatch.setenv("FLOCK_STATES_DIR", str(tmp_path))
+    for module in (files, journal):
+        monkeypatch.setattr(module, "STATES_DIR", tmp_path)
+    state_id = "test_pool"
+    save_state(state_id, triframeState(id=state_id, task_string="Task").model_dump())
+    return state_id
+
+
+@pytest.mark.asyncio
+async def test_worker_pool_runs_phases_and_recycles_workers(state_id):
+    pool = PhaseWorkerPool(size=1, max_phases_per_worker=1)
+    await pool.start()
+    try:
+        first_pid = pool.stats()["workers"][0]["pid"]
+        requests = await pool.run_phase(
+            "triframe/phases/advisor.py", state_id, b'{"updates": []}'
+        )
+        assert [data["next_phase"] for data in requests] == ["triframe/phases/actor.py"]
+        assert requests[0]["operations"][0]["type"] == "generate"
+
+        # The worker ran its one phase and is replaced by a fresh one
+        with pytest.raises(Exception, match="failed in worker"):
+            await pool.run_phase("triframe/phases/advisor.py", "missing", b"{}")
+        stats = pool.stats()
+        assert stats["retired_workers"] >= 1
+        assert first_pid not in [worker["pid"] for worker in stats["workers"]]
+    finally:
+        await pool.close()